@@ -0,0 +1,273 @@
+from collections import Counter
+from typing import IO, Iterable, Iterator, Optional
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+from pyarrow import csv as pacsv
+
+from app.etl.geo import haversine_vectorized
+from app.etl.schema import (
+    FLAG_FIELDS,
+    LAT_BOUNDS,
+    LNG_BOUNDS,
+    REQUIRED_COLUMNS,
+    reject_mask,
+)
+
+# Arrow equivalent of `app.etl.schema.TRIP_DTYPES` plus the timestamp columns
+TRIP_ARROW_TYPES = {
+    "ride_id": pa.string(),
+    "rideable_type": pa.dictionary(pa.int32(), pa.string()),
+    "started_at": pa.timestamp("us"),
+    "ended_at": pa.timestamp("us"),
+    "start_station_name": pa.dictionary(pa.int32(), pa.string()),
+    "start_station_id": pa.string(),
+    "end_station_name": pa.dictionary(pa.int32(), pa.string()),
+    "end_station_id": pa.string(),
+    "start_lat": pa.float64(),
+    "start_lng": pa.float64(),
+    "end_lat": pa.float64(),
+    "end_lng": pa.float64(),
+    "member_casual": pa.dictionary(pa.int32(), pa.string()),
+}
+# Bytes of CSV parsed per Arrow record batch
+BLOCK_SIZE = 16 * 1024 * 1024
+
+
+def column_values(column: pa.ChunkedArray) -> list:
+    """
+    Converts an Arrow column into a list of Python values, with None for nulls.
+
+    Going through NumPy is much faster than `to_pylist`: dictionary columns
+    look their values up by index and timestamps convert in one `astype`.
+
+    Args:
+        column (pa.ChunkedArray): The column to convert.
+
+    Returns:
+        list: The column values.
+    """
+    column = column.combine_chunks()
+    nulls = (
+        column.is_null().to_numpy(zero_copy_only=False) if column.null_count else None
+    )
+    if pa.types.is_dictionary(column.type):
+        if not len(column.dictionary):
+            return [None] * len(column)
+        dictionary = np.array(column.dictionary.to_pylist(), dtype=object)
+        values = dictionary[column.indices.fill_null(0).to_numpy()]
+    else:
+        values = column.to_numpy(zero_copy_only=False)
+        if pa.types.is_timestamp(column.type):
+            values = values.astype("datetime64[us]")
+        if nulls is not None or pa.types.is_timestamp(column.type):
+            values = values.astype(object)
+    if nulls is not None:
+        values[nulls] = None
+    return values.tolist()
+
+
+def table_to_documents(table: pa.Table) -> list:
+    """
+    Builds one document per row of a table, column by column.
+
+    As with `app.etl.schema.to_documents`, null fields are left out of a
+    document and `FLAG_FIELDS` are only set where they are true.
+
+    Args:
+        table (pa.Table): The table to convert.
+
+    Returns:
+        list: The rows as dictionaries.
+    """
+    names = [name for name in table.column_names if name not in FLAG_FIELDS]
+    columns = [column_values(table[name]) for name in names]
+    documents = [dict(zip(names, row)) for row in zip(*columns)]
+    nulls = [
+        table[name].is_null().to_numpy() for name in names if table[name].null_count
+    ]
+    if nulls:
+        for index in np.flatnonzero(np.logical_or.reduce(nulls)):
+            documents[index] = {
+                key: value
+                for key, value in documents[index].items()
+                if value is not None
+            }
+    for field in FLAG_FIELDS:
+        if field in table.column_names:
+            flags = table[field].fill_null(False).to_numpy()
+            for index in np.flatnonzero(flags):
+                documents[index][field] = True
+    return documents
+
+
+def clean_table(table: pa.Table, metrics: Optional[Counter] = None) -> pa.Table:
+    """
+    Validates a table of trips and adds the derived fields.
+
+    This is the Arrow counterpart of `ExtractTransformLoad.transform_data`,
+    with the derived fields computed by Arrow compute kernels and the same
+    checks as `app.etl.schema.validate`.
+
+    Args:
+        table (pa.Table): The raw trips read from a CSV file.
+        metrics (Counter, optional): Counts rows read, rejected and flagged per reason.
+
+    Returns:
+        pa.Table: The kept trips.
+    """
+    started_at = table["started_at"]
+    duration = pc.cast(pc.subtract(table["ended_at"], started_at), pa.int64())
+    coordinates = {
+        column: table[column].to_numpy()
+        for column in ("start_lat", "start_lng", "end_lat", "end_lng")
+    }
+    distance = haversine_vectorized(*coordinates.values())
+
+    def outside(column: str, bounds: tuple) -> np.ndarray:
+        # NaN, the nulls, compares false on both sides
+        values = coordinates[column]
+        return (values < bounds[0]) | (values > bounds[1])
+
+    missing = np.column_stack(
+        [
+            (
+                table[column].is_null().to_numpy()
+                if column in table.column_names
+                else np.ones(table.num_rows, bool)
+            )
+            for column in REQUIRED_COLUMNS
+        ]
+    )
+    negative = pc.less(duration, 0).fill_null(False).to_numpy()
+    outlier = (
+        outside("start_lat", LAT_BOUNDS)
+        | outside("start_lng", LNG_BOUNDS)
+        | outside("end_lat", LAT_BOUNDS)
+        | outside("end_lng", LNG_BOUNDS)
+    )
+    has_null = np.zeros(table.num_rows, bool)
+    for column in table.columns:
+        if column.null_count:
+            has_null |= column.is_null().to_numpy()
+    keep = reject_mask(missing, negative, outlier, has_null, metrics)
+
+    table = (
+        table.append_column("duration_seconds", pc.divide(duration, 1_000_000.0))
+        .append_column("hour", pc.hour(started_at))
+        .append_column(
+            "day_of_week",
+            pc.day_of_week(started_at, count_from_zero=False, week_start=7),
+        )
+        .append_column("month", pc.month(started_at))
+        .append_column("distance_km", pa.array(distance, from_pandas=True))
+        .append_column("coordinate_outlier", pa.array(outlier))
+    )
+    if keep.all():
+        return table
+    return table.filter(pa.array(keep))
+
+
+def transform_table(table: pa.Table, metrics: Optional[Counter] = None) -> list:
+    """
+    Cleans a table of trips and converts it into documents.
+
+    The documents are built from NumPy views of the columns, without a
+    pandas DataFrame or per-value Arrow scalars.
+
+    Args:
+        table (pa.Table): The raw trips read from a CSV file.
+        metrics (Counter, optional): Counts rows read, rejected and flagged per reason.
+
+    Returns:
+        list: The transformed trips as a list of dictionaries.
+    """
+    return table_to_documents(clean_table(table, metrics))
+
+
+def rebatch(
+    record_batches: Iterable[pa.RecordBatch], batch_size: Optional[int] = None
+) -> Iterator[pa.Table]:
+    """
+    Regroups record batches into tables of exactly `batch_size` rows.
+
+    Only the last table may be shorter. Without a batch size everything is
+    combined into a single table.
+
+    Args:
+        record_batches (Iterable[pa.RecordBatch]): The record batches to regroup.
+        batch_size (int, optional): The number of rows per table.
+
+    Yields:
+        pa.Table: The regrouped rows.
+    """
+    pending = []
+    pending_rows = 0
+    for record_batch in record_batches:
+        pending.append(record_batch)
+        pending_rows += record_batch.num_rows
+        while batch_size and pending_rows >= batch_size:
+            table = pa.Table.from_batches(pending)
+            yield table.slice(0, batch_size)
+            pending = table.slice(batch_size).to_batches()
+            pending_rows -= batch_size
+    if pending_rows:
+        yield pa.Table.from_batches(pending)
+
+
+def read_csv_tables(
+    csv_file: IO[bytes],
+    batch_size: Optional[int] = None,
+    skip_rows: int = 0,
+    metrics: Optional[Counter] = None,
+) -> Iterator[pa.Table]:
+    """
+    Reads trips with the pyarrow CSV reader and yields cleaned tables.
+
+    The file is parsed in blocks by Arrow's multithreaded reader and
+    regrouped into batches of exactly `batch_size` CSV rows, so resume
+    offsets match the pandas reader.
+
+    Args:
+        csv_file (IO[bytes]): The CSV file object.
+        batch_size (int, optional): The number of rows per batch, the whole file if None.
+        skip_rows (int): The number of data rows to skip, used to resume a member.
+        metrics (Counter, optional): Updated with each batch's validation counts.
+
+    Yields:
+        pa.Table: A batch of cleaned trips.
+    """
+    reader = pacsv.open_csv(
+        csv_file,
+        read_options=pacsv.ReadOptions(
+            block_size=BLOCK_SIZE, skip_rows_after_names=skip_rows
+        ),
+        convert_options=pacsv.ConvertOptions(
+            column_types=TRIP_ARROW_TYPES, strings_can_be_null=True
+        ),
+    )
+    for table in rebatch(reader, batch_size):
+        yield clean_table(table, metrics)
+
+
+def read_csv_batches(
+    csv_file: IO[bytes],
+    batch_size: Optional[int] = None,
+    skip_rows: int = 0,
+    metrics: Optional[Counter] = None,
+) -> Iterator[list]:
+    """
+    Reads trips with the pyarrow CSV reader and yields transformed batches.
+
+    Args:
+        csv_file (IO[bytes]): The CSV file object.
+        batch_size (int, optional): The number of rows per batch, the whole file if None.
+        skip_rows (int): The number of data rows to skip, used to resume a member.
+        metrics (Counter, optional): Updated with each batch's validation counts.
+
+    Yields:
+        list: A batch of transformed trips.
+    """
+    for table in read_csv_tables(csv_file, batch_size, skip_rows, metrics):
+        yield table_to_documents(table)
@@ -0,0 +1,229 @@
+import copy
+import functools
+import inspect
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+# Defaults of the caches shared by `Queries` instances
+CACHE_MAX_ENTRIES = 256
+CACHE_TTL_SECONDS = 600
+# How often the data version is read while the cache is being used
+VERSION_CHECK_SECONDS = 15
+
+
+def freeze(value: Any) -> Hashable:
+    """
+    Turns query parameters into a hashable cache key component.
+
+    Args:
+        value: A parameter, possibly a nested dict or list.
+
+    Returns:
+        Hashable: An equivalent tuple-based value.
+    """
+    if isinstance(value, dict):
+        return tuple(sorted((key, freeze(item)) for key, item in value.items()))
+    if isinstance(value, (list, tuple, set)):
+        return tuple(freeze(item) for item in value)
+    return value
+
+
+class QueryCache:
+    """
+    A bounded LRU cache of query results with a TTL and data-version invalidation.
+
+    `version` is called at most every `version_check_seconds`; when the
+    value it returns changes, typically because the ETL committed new data
+    to the load manifest, every entry is dropped. Results are kept in
+    process memory, so the cache works the same inside and outside
+    Streamlit and is shared by every rerun of the app.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = CACHE_MAX_ENTRIES,
+        ttl_seconds: float = CACHE_TTL_SECONDS,
+        version: Optional[Callable[[], Hashable]] = None,
+        version_check_seconds: float = VERSION_CHECK_SECONDS,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.version = version
+        self.version_check_seconds = version_check_seconds
+        self.clock = clock
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self._data_version = None
+        self._version_checked_at = None
+        # bumped on every clear, so a result computed across one is not stored
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def _check_version(self) -> None:
+        """
+        Drops every entry if the data version changed since it was last read.
+
+        The version is read outside the lock, since it can take database
+        round trips, and only one caller reads it per check interval while
+        the others keep serving entries.
+        """
+        if self.version is None:
+            return
+        with self._lock:
+            now = self.clock()
+            if (
+                self._version_checked_at is not None
+                and now - self._version_checked_at < self.version_check_seconds
+            ):
+                return
+            self._version_checked_at = now
+        data_version = self.version()
+        with self._lock:
+            if data_version != self._data_version:
+                if self._entries:
+                    self.invalidations += 1
+                self._entries.clear()
+                self._generation += 1
+                self._data_version = data_version
+
+    def get_or_compute(self, key: Hashable, compute: Callable[[], Any]) -> Any:
+        """
+        Returns the cached result for a key, computing and storing it on a miss.
+
+        Args:
+            key (Hashable): The cache key.
+            compute (Callable): Produces the result on a miss.
+
+        Returns:
+            The cached or freshly computed result.
+        """
+        self._check_version()
+        with self._lock:
+            now = self.clock()
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if now < expires_at:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+                self.expirations += 1
+            self.misses += 1
+            generation = self._generation
+
+        # computed outside the lock so slow queries do not block cache hits
+        value = compute()
+        with self._lock:
+            if generation == self._generation:
+                self._store(key, value)
+        return value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        """
+        Stores a result computed elsewhere, such as by a query answering several keys.
+
+        Args:
+            key (Hashable): The cache key.
+            value: The result.
+        """
+        self._check_version()
+        with self._lock:
+            self._store(key, value)
+
+    def _store(self, key: Hashable, value: Any) -> None:
+        self._entries[key] = (value, self.clock() + self.ttl_seconds)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._generation += 1
+
+    def stats(self) -> dict:
+        """
+        Returns the hit and miss counters of the cache.
+
+        Returns:
+            dict: Hits, misses, hit rate, evictions, expirations, invalidations and size.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+                "size": len(self._entries),
+            }
+
+
+_caches: dict = {}
+_caches_lock = threading.Lock()
+
+
+def shared_cache(
+    key: str, version: Optional[Callable[[], Hashable]] = None
+) -> QueryCache:
+    """
+    Returns the process-wide cache for a key, creating it on first use.
+
+    Args:
+        key (str): Identifies the data source, such as the client, database and collection.
+        version (Callable, optional): The data version of a newly created cache.
+
+    Returns:
+        QueryCache: The cache shared by every caller with the same key.
+    """
+    with _caches_lock:
+        if key not in _caches:
+            _caches[key] = QueryCache(version=version)
+        return _caches[key]
+
+
+def cached(method: Callable) -> Callable:
+    """
+    Caches a query method in its instance's `cache`, keyed by name and parameters.
+
+    Parameters are bound to the method's signature with their defaults, so
+    `bike_count()` and `bike_count(trip_filter=None)` share an entry, and
+    `method.cache_key(*args, **kwargs)` gives the key of a call. Cursors
+    are read into lists before they are stored, and each call gets its own
+    deep copy of the result, so a caller changing its rows does not change
+    what later calls get.
+    """
+    signature = inspect.signature(method)
+
+    def cache_key(*args, **kwargs) -> tuple:
+        bound = signature.bind(None, *args, **kwargs)
+        bound.apply_defaults()
+        parameters = list(bound.arguments.items())[1:]
+        return (method.__name__, freeze(dict(parameters)))
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        key = cache_key(*args, **kwargs)
+
+        def compute():
+            result = method(self, *args, **kwargs)
+            return result if isinstance(result, (int, float, str)) else list(result)
+
+        result = self.cache.get_or_compute(key, compute)
+        return (
+            result if isinstance(result, (int, float, str)) else copy.deepcopy(result)
+        )
+
+    wrapper.cache_key = cache_key
+    return wrapper
@@ -0,0 +1,206 @@
+import threading
+import time
+from typing import Optional
+
+from pymongo import MongoClient, monitoring
+
+# Pool settings for every client in the registry. The dashboard issues a
+# handful of concurrent queries per session and the ETL at most one write
+# per load worker, so a small pool that keeps a couple of warm connections
+# avoids reconnecting without holding dozens of idle sockets.
+POOL_OPTIONS = {
+    "maxPoolSize": 32,
+    "minPoolSize": 2,
+    "maxIdleTimeMS": 300_000,
+    "waitQueueTimeoutMS": 10_000,
+    "connectTimeoutMS": 5_000,
+    "serverSelectionTimeoutMS": 10_000,
+}
+
+
+class PoolMetrics(monitoring.ConnectionPoolListener):
+    """
+    Tracks connection pool activity of a client from CMAP events.
+
+    The wait time of a checkout runs from the driver starting it to the
+    connection being handed over or the checkout failing. Events of one
+    checkout are published on the thread performing it, so the start time
+    is kept per thread.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.connections_open = 0
+        self.connections_created = 0
+        self.checked_out = 0
+        self.checkouts = 0
+        self.checkout_failures = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.pool_clears = 0
+
+    def _finish_wait(self) -> None:
+        start = getattr(self._local, "checkout_started", None)
+        if start is None:
+            return
+        self._local.checkout_started = None
+        wait = time.perf_counter() - start
+        self.wait_seconds += wait
+        self.max_wait_seconds = max(self.max_wait_seconds, wait)
+
+    def snapshot(self) -> dict:
+        """
+        Returns the current counters.
+
+        Returns:
+            dict: Open and checked-out connections, checkouts, failures and wait times.
+        """
+        with self._lock:
+            return {
+                "connections_open": self.connections_open,
+                "connections_created": self.connections_created,
+                "checked_out": self.checked_out,
+                "checkouts": self.checkouts,
+                "checkout_failures": self.checkout_failures,
+                "avg_wait_ms": (
+                    1000 * self.wait_seconds / self.checkouts if self.checkouts else 0.0
+                ),
+                "max_wait_ms": 1000 * self.max_wait_seconds,
+                "pool_clears": self.pool_clears,
+            }
+
+    def connection_check_out_started(self, event) -> None:
+        self._local.checkout_started = time.perf_counter()
+
+    def connection_checked_out(self, event) -> None:
+        with self._lock:
+            self._finish_wait()
+            self.checked_out += 1
+            self.checkouts += 1
+
+    def connection_check_out_failed(self, event) -> None:
+        with self._lock:
+            self._finish_wait()
+            self.checkout_failures += 1
+
+    def connection_checked_in(self, event) -> None:
+        with self._lock:
+            self.checked_out -= 1
+
+    def connection_created(self, event) -> None:
+        with self._lock:
+            self.connections_open += 1
+            self.connections_created += 1
+
+    def connection_closed(self, event) -> None:
+        with self._lock:
+            self.connections_open -= 1
+
+    def pool_cleared(self, event) -> None:
+        with self._lock:
+            self.pool_clears += 1
+
+    def connection_ready(self, event) -> None:
+        pass
+
+    def pool_created(self, event) -> None:
+        pass
+
+    def pool_ready(self, event) -> None:
+        pass
+
+    def pool_closed(self, event) -> None:
+        pass
+
+
+class ClientRegistry:
+    """
+    Hands out one `MongoClient` per connection string for the whole process.
+
+    A `MongoClient` owns a connection pool and background monitoring
+    threads, so creating one per `ExtractTransformLoad` meant new TCP and
+    TLS handshakes on every Streamlit rerun. The registry lives at module
+    level, which Streamlit keeps loaded across reruns, so every `Queries`
+    and `CustomQuery` instance reuses the same pool.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._clients: dict = {}
+        self._metrics: dict = {}
+
+    @staticmethod
+    def key(
+        uri: Optional[str] = None,
+        host: Optional[str] = None,
+        port: Optional[int] = None,
+    ) -> str:
+        if uri:
+            return uri
+        if host and port:
+            return f"{host}:{port}"
+        raise ValueError("Either `host` and `port` or `uri` must be provided.")
+
+    def get_client(
+        self,
+        uri: Optional[str] = None,
+        host: Optional[str] = None,
+        port: Optional[int] = None,
+    ) -> MongoClient:
+        """
+        Returns the shared client for a server, creating it on first use.
+
+        Args:
+            uri (str, optional): The MongoDB connection string.
+            host (str, optional): The server host, used with `port` when there is no URI.
+            port (int, optional): The server port.
+
+        Returns:
+            MongoClient: The client, with `POOL_OPTIONS` and a `PoolMetrics` listener.
+        """
+        key = self.key(uri, host, port)
+        with self._lock:
+            client = self._clients.get(key)
+            if client is None:
+                metrics = PoolMetrics()
+                if uri:
+                    client = MongoClient(uri, event_listeners=[metrics], **POOL_OPTIONS)
+                else:
+                    client = MongoClient(
+                        host, port, event_listeners=[metrics], **POOL_OPTIONS
+                    )
+                self._clients[key] = client
+                self._metrics[key] = metrics
+            return client
+
+    def pool_metrics(
+        self,
+        uri: Optional[str] = None,
+        host: Optional[str] = None,
+        port: Optional[int] = None,
+    ) -> dict:
+        """
+        Returns the pool counters of a registered client.
+
+        Args:
+            uri (str, optional): The MongoDB connection string.
+            host (str, optional): The server host.
+            port (int, optional): The server port.
+
+        Returns:
+            dict: The `PoolMetrics.snapshot` of the client, empty if it was never created.
+        """
+        metrics = self._metrics.get(self.key(uri, host, port))
+        return metrics.snapshot() if metrics else {}
+
+    def close_all(self) -> None:
+        with self._lock:
+            for client in self._clients.values():
+                client.close()
+            self._clients.clear()
+            self._metrics.clear()
+
+
+# The process-wide registry used by `ExtractTransformLoad`
+registry = ClientRegistry()
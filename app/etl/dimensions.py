@@ -0,0 +1,467 @@
+import threading
+from datetime import datetime, timezone
+from typing import Iterable, Optional
+
+from pymongo import ReturnDocument, UpdateMany, UpdateOne
+from pymongo.collection import Collection
+from pymongo.errors import BulkWriteError
+
+# Suffix of the collection holding the distinct filter values of a trips collection
+DIMENSIONS_SUFFIX = "_dimensions"
+# Suffix of the station dimension, one document per station keyed on a small int
+STATIONS_SUFFIX = "_stations"
+# `_id` of the dimensions document counting the station keys handed out
+STATION_KEY_COUNTER = "station_keys"
+# Trip fields of each station role, by the station attribute they hold
+STATION_ROLES = {
+    "start": {
+        "name": "start_station_name",
+        "station_id": "start_station_id",
+        "lat": "start_lat",
+        "lng": "start_lng",
+    },
+    "end": {
+        "name": "end_station_name",
+        "station_id": "end_station_id",
+        "lat": "end_lat",
+        "lng": "end_lng",
+    },
+}
+# Station name fields of trip queries and the key field each one is matched on
+STATION_NAME_KEYS = {
+    fields["name"]: f"{role}_station_key" for role, fields in STATION_ROLES.items()
+}
+# Fields the custom query sidebar filters on
+DIMENSION_FIELDS = [
+    "start_station_name",
+    "end_station_name",
+    "rideable_type",
+    "member_casual",
+]
+
+
+class Dimensions:
+    """
+    Stores the sorted distinct values of each of `DIMENSION_FIELDS`.
+
+    One small document per field is derived from the rollups whenever they
+    change, so the custom query sidebar is filled from four document reads
+    instead of four `distinct` scans of the trips collection.
+    """
+
+    def __init__(self, trips: Collection) -> None:
+        self.collection = trips.database[f"{trips.name}{DIMENSIONS_SUFFIX}"]
+        self.stations = trips.database[f"{trips.name}{STATIONS_SUFFIX}"]
+
+    def values(self, field: str) -> Optional[list]:
+        """
+        Returns the distinct values of a field.
+
+        Args:
+            field (str): One of `DIMENSION_FIELDS`.
+
+        Returns:
+            list: The sorted values, or None before the dimensions are first built.
+        """
+        document = self.collection.find_one({"_id": field})
+        return document["values"] if document else None
+
+    def refresh(self, usage: Collection, stations: Collection) -> None:
+        """
+        Recomputes every dimension from the usage and station rollups.
+
+        The station rollup counts trips per station key, so the names are
+        read from the station dimension.
+
+        Args:
+            usage (Collection): The usage rollup.
+            stations (Collection): The station rollup.
+        """
+
+        def station_names(count_field: str) -> list:
+            keys = stations.distinct("station_key", {count_field: {"$gt": 0}})
+            return self.stations.distinct("name", {"_id": {"$in": keys}})
+
+        found = {
+            "start_station_name": station_names("start_count"),
+            "end_station_name": station_names("end_count"),
+            "rideable_type": usage.distinct("rideable_type"),
+            "member_casual": usage.distinct("member_casual"),
+        }
+        now = datetime.now(timezone.utc)
+        for field, values in found.items():
+            self.collection.replace_one(
+                {"_id": field},
+                {
+                    "values": sorted(value for value in values if value is not None),
+                    "updated_at": now,
+                },
+                upsert=True,
+            )
+
+
+class StationDimension:
+    """
+    Maps station IDs to compact integer keys stored on every trip.
+
+    Each station is a document `{_id: key, station_id, name, lat, lng}`,
+    with the name it was last loaded with and the coordinates of the first
+    trip that referenced it. The ETL sets `start_station_key` and
+    `end_station_key` on each trip before it is written and drops the
+    station's name, ID and coordinates from the trip, so a renamed station
+    keeps its key and its trips, and station groupings and comparisons run
+    on small ints. Trips without a station ID are keyed on the station
+    name, and trips without a station, such as undocked e-bikes, keep
+    their own coordinates.
+
+    Keys are reserved in blocks from a counter and stations are upserted
+    on their unique `station_id`, so concurrent loaders agree on every key:
+    threads sharing an instance register one batch at a time, and a
+    loader whose upsert loses to another process reads the winner's key.
+    """
+
+    def __init__(self, trips: Collection) -> None:
+        self.collection = trips.database[f"{trips.name}{STATIONS_SUFFIX}"]
+        self.counters = trips.database[f"{trips.name}{DIMENSIONS_SUFFIX}"]
+        self._keys: Optional[dict] = None
+        self._names: dict = {}
+        self._built = False
+        # load threads share the instance, and `register` reads `keys`
+        self._lock = threading.RLock()
+
+    def is_built(self) -> bool:
+        """
+        Tells whether every trip in the collection carries its station keys.
+
+        Returns:
+            bool: True once `mark_built` has been called after a backfill,
+            which is remembered since a built dimension stays built.
+        """
+        if not self._built:
+            counter = self.counters.find_one({"_id": STATION_KEY_COUNTER})
+            self._built = bool(counter and counter.get("built"))
+        return self._built
+
+    def mark_built(self) -> None:
+        self.counters.update_one(
+            {"_id": STATION_KEY_COUNTER},
+            {"$set": {"built": True}, "$setOnInsert": {"next": 0}},
+            upsert=True,
+        )
+        self._built = True
+
+    def keys(self) -> dict:
+        """
+        Returns the key of every known station, read once per instance.
+
+        Returns:
+            dict: Keys by station ID.
+        """
+        with self._lock:
+            if self._keys is None:
+                keys = {}
+                for station in self.collection.find({}, {"station_id": 1, "name": 1}):
+                    keys[station["station_id"]] = station["_id"]
+                    self._names[station["_id"]] = station.get("name")
+                self._keys = keys
+            return self._keys
+
+    def keys_for_names(self, names: Iterable) -> list:
+        """
+        Returns the keys of the stations currently named any of the given names.
+
+        Args:
+            names (Iterable): Station names, None standing for trips without a station.
+
+        Returns:
+            list: The keys, with None kept for a None name.
+        """
+        names = list(names)
+        keys = self.collection.distinct(
+            "_id", {"name": {"$in": [name for name in names if name is not None]}}
+        )
+        return keys + [None] if None in names else keys
+
+    def key_condition(self, condition):
+        """
+        Turns a condition on a station name field into one on its key field.
+
+        Args:
+            condition: A name, None, or an operator document with `$eq`,
+                `$ne`, `$in`, `$nin` or `$exists`.
+
+        Returns:
+            The condition on the station keys of those names.
+
+        Raises:
+            ValueError: If the condition uses another operator.
+        """
+        if not isinstance(condition, dict):
+            return (
+                None if condition is None else {"$in": self.keys_for_names([condition])}
+            )
+        translated = {}
+        for operator, value in condition.items():
+            if operator in ("$in", "$nin"):
+                translated[operator] = self.keys_for_names(value)
+            elif operator in ("$eq", "$ne"):
+                keys = None if value is None else self.keys_for_names([value])
+                if keys is None:
+                    translated[operator] = None
+                else:
+                    translated["$in" if operator == "$eq" else "$nin"] = keys
+            elif operator == "$exists":
+                translated[operator] = value
+            else:
+                raise ValueError(f"{operator} is not supported on station names")
+        return translated
+
+    def station_query(self, query: dict) -> dict:
+        """
+        Matches the station name conditions of a trip query on the station keys.
+
+        Trips only keep their station keys, so a condition on
+        `start_station_name` or `end_station_name` becomes a condition on
+        the keys of the stations with those names, also inside `$and`,
+        `$or` and `$nor`.
+
+        Args:
+            query (dict): A query on trip fields.
+
+        Returns:
+            dict: The equivalent query on the keyed trips.
+        """
+        translated = {}
+        for field, condition in query.items():
+            if field in ("$and", "$or", "$nor"):
+                translated[field] = [self.station_query(part) for part in condition]
+            elif field in STATION_NAME_KEYS:
+                translated[STATION_NAME_KEYS[field]] = self.key_condition(condition)
+            else:
+                translated[field] = condition
+        return translated
+
+    def lookup_stages(self, roles: Iterable[str] = STATION_ROLES) -> list:
+        """
+        Returns the stages setting the station names and coordinates of trips from their keys.
+
+        Trips without a key, such as those of an undocked e-bike or loaded
+        before the dimension was built, keep their own fields.
+
+        Args:
+            roles (Iterable[str]): The roles of `STATION_ROLES` to look up.
+
+        Returns:
+            list: The `$lookup` stages, one per role.
+        """
+        stages = []
+        for role in roles:
+            fields = STATION_ROLES[role]
+            stages += [
+                {
+                    "$lookup": {
+                        "from": self.collection.name,
+                        "localField": f"{role}_station_key",
+                        "foreignField": "_id",
+                        "as": "station",
+                    }
+                },
+                {
+                    "$addFields": {
+                        field: {
+                            "$ifNull": [
+                                {"$arrayElemAt": [f"$station.{attribute}", 0]},
+                                f"${field}",
+                            ]
+                        }
+                        for attribute, field in fields.items()
+                        if attribute != "station_id"
+                    }
+                },
+                {"$project": {"station": 0}},
+            ]
+        return stages
+
+    def register(self, stations: dict) -> dict:
+        """
+        Gives a key to each station that does not have one yet and renames the others.
+
+        Args:
+            stations (dict): Station IDs mapped to their `name`, `lat` and
+                `lng`; the coordinates are only used if the station is new.
+
+        Returns:
+            dict: The keys of the given stations, by station ID.
+
+        Raises:
+            BulkWriteError: If a write fails for a reason other than another
+                loader registering the same station first.
+        """
+        with self._lock:
+            return self._register(stations)
+
+    def _register(self, stations: dict) -> dict:
+        known = self.keys()
+        new = [station_id for station_id in stations if station_id not in known]
+        renamed = [
+            UpdateOne({"_id": known[station_id]}, {"$set": {"name": station["name"]}})
+            for station_id, station in stations.items()
+            if station_id in known
+            and self._names.get(known[station_id]) != station["name"]
+        ]
+        if renamed:
+            self.collection.bulk_write(renamed, ordered=False)
+        if new:
+            self.collection.create_index("station_id", unique=True)
+            # `keys_for_names` matches station name filters on it
+            self.collection.create_index("name")
+            counter = self.counters.find_one_and_update(
+                {"_id": STATION_KEY_COUNTER},
+                {"$inc": {"next": len(new)}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER,
+            )
+            first = counter["next"] - len(new) + 1
+            upserts = [
+                UpdateOne(
+                    {"station_id": station_id},
+                    {
+                        "$set": {"name": stations[station_id]["name"]},
+                        "$setOnInsert": {
+                            "_id": key,
+                            "lat": stations[station_id]["lat"],
+                            "lng": stations[station_id]["lng"],
+                        },
+                    },
+                    upsert=True,
+                )
+                for key, station_id in enumerate(new, start=first)
+            ]
+            try:
+                self.collection.bulk_write(upserts, ordered=False)
+            except BulkWriteError as e:
+                # a concurrent upsert of the same station raises a duplicate
+                # key error instead of matching the station it inserted
+                if any(error["code"] != 11000 for error in e.details["writeErrors"]):
+                    raise
+            # another loader may have registered some of them first
+            for station in self.collection.find(
+                {"station_id": {"$in": new}}, {"station_id": 1}
+            ):
+                known[station["station_id"]] = station["_id"]
+        for station_id, station in stations.items():
+            self._names[known[station_id]] = station["name"]
+        return {station_id: known[station_id] for station_id in stations}
+
+    @staticmethod
+    def station_of(document: dict, fields: dict) -> Optional[str]:
+        """
+        Returns the station ID a trip refers to in one role, its name if it has no ID.
+        """
+        station_id = document.get(fields["station_id"])
+        return station_id if station_id is not None else document.get(fields["name"])
+
+    def assign(self, documents: Iterable[dict]) -> list:
+        """
+        Sets the station keys of trips in place and drops the station fields they replace.
+
+        Args:
+            documents (Iterable[dict]): Transformed trips.
+
+        Returns:
+            list: The same trips.
+        """
+        documents = list(documents)
+        stations = {}
+        for document in documents:
+            for fields in STATION_ROLES.values():
+                station_id = self.station_of(document, fields)
+                if station_id is not None and station_id not in stations:
+                    stations[station_id] = {
+                        attribute: document.get(field)
+                        for attribute, field in fields.items()
+                        if attribute != "station_id"
+                    }
+        keys = self.register(stations)
+        for document in documents:
+            for role, fields in STATION_ROLES.items():
+                station_id = self.station_of(document, fields)
+                if station_id is not None:
+                    document[f"{role}_station_key"] = keys[station_id]
+                    for field in fields.values():
+                        document.pop(field, None)
+        return documents
+
+    def backfill(self, trips: Collection) -> int:
+        """
+        Sets the station keys of trips loaded before the dimension existed.
+
+        Stations are registered from one `$group` per role, then each
+        station's trips are updated with a bulk `update_many` that sets the
+        key and unsets the fields it replaces.
+
+        Args:
+            trips (Collection): The trips collection.
+
+        Returns:
+            int: The number of stations in the dimension.
+        """
+        for role, fields in STATION_ROLES.items():
+            found = trips.aggregate(
+                [
+                    {
+                        "$match": {
+                            "$or": [
+                                {fields["name"]: {"$ne": None}},
+                                {fields["station_id"]: {"$ne": None}},
+                            ]
+                        }
+                    },
+                    {
+                        "$group": {
+                            "_id": {
+                                "station_id": f"${fields['station_id']}",
+                                "name": f"${fields['name']}",
+                            },
+                            "lat": {"$first": f"${fields['lat']}"},
+                            "lng": {"$first": f"${fields['lng']}"},
+                        }
+                    },
+                ],
+                allowDiskUse=True,
+            )
+            groups = []
+            stations = {}
+            for group in found:
+                trip = {
+                    fields["station_id"]: group["_id"].get("station_id"),
+                    fields["name"]: group["_id"].get("name"),
+                }
+                station_id = self.station_of(trip, fields)
+                groups.append((trip, station_id))
+                stations.setdefault(
+                    station_id,
+                    {
+                        "name": trip[fields["name"]],
+                        "lat": group["lat"],
+                        "lng": group["lng"],
+                    },
+                )
+            keys = self.register(stations)
+            if not keys:
+                continue
+            trips.bulk_write(
+                [
+                    UpdateMany(
+                        trip,
+                        {
+                            "$set": {f"{role}_station_key": keys[station_id]},
+                            "$unset": {field: "" for field in fields.values()},
+                        },
+                    )
+                    for trip, station_id in groups
+                ],
+                ordered=False,
+            )
+        self.mark_built()
+        return len(self.keys())
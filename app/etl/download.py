@@ -0,0 +1,251 @@
+import base64
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from typing import Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Name of the cache index kept next to the downloaded archives
+CACHE_INDEX = ".download_cache.json"
+CHUNK_SIZE = 1024 * 1024
+# An S3 ETag is the MD5 of the file unless it was uploaded in parts
+MD5_ETAG = re.compile(r'^"([0-9a-f]{32})"$')
+
+
+class Downloader:
+    """
+    Streams files over HTTP with resume support and a local content cache.
+
+    A single `requests.Session` is reused for every download so connections
+    to the same host are kept alive. Each completed download is recorded in
+    a JSON index in `cache_dir`, keyed by URL with the server's ETag and
+    size, so a later run skips archives that have not changed on the server.
+    The index also holds the SHA-256 of each file, checked before a cached
+    copy is reused so a truncated or altered file is downloaded again. An
+    interrupted download is kept as a `.part` file and resumed with an HTTP
+    range request. A finished download is checked against the MD5 the
+    server reports, and against the SHA-256 of an earlier download of the
+    same version, when either is known.
+    """
+
+    def __init__(
+        self,
+        cache_dir: str,
+        session: Optional[requests.Session] = None,
+        chunk_size: int = CHUNK_SIZE,
+        timeout: float = 60,
+    ) -> None:
+        self.cache_dir = cache_dir
+        self.chunk_size = chunk_size
+        self.timeout = timeout
+        self.index_path = os.path.join(cache_dir, CACHE_INDEX)
+        self.rates = {}
+        self._lock = threading.Lock()
+
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+        self.session = session
+        self.index = self._read_index()
+
+    def _read_index(self) -> dict:
+        try:
+            with open(self.index_path) as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _write_index(self) -> None:
+        tmp_path = f"{self.index_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.index, f, indent=2)
+        os.replace(tmp_path, self.index_path)
+
+    def remote_version(self, url: str) -> dict:
+        """
+        Looks up the ETag, size and MD5 of a remote file without downloading it.
+
+        Args:
+            url (str): The URL of the file.
+
+        Returns:
+            dict: The `etag` and `size` reported by the server, and the hex
+            `md5` from its Content-MD5 header or an S3 ETag; any may be None.
+        """
+        response = self.session.head(url, allow_redirects=True, timeout=self.timeout)
+        response.raise_for_status()
+        size = response.headers.get("Content-Length")
+        etag = response.headers.get("ETag")
+        md5 = response.headers.get("Content-MD5")
+        if md5:
+            md5 = base64.b64decode(md5).hex()
+        elif etag and MD5_ETAG.match(etag):
+            md5 = MD5_ETAG.match(etag).group(1)
+        return {
+            "etag": etag,
+            "size": int(size) if size is not None else None,
+            "md5": md5 or None,
+        }
+
+    def file_digest(
+        self, path: str, digest: Optional["hashlib._Hash"] = None
+    ) -> "hashlib._Hash":
+        """
+        Hashes a file in chunks.
+
+        Args:
+            path (str): The path of the file.
+            digest (hashlib._Hash, optional): A digest to update, a new SHA-256 by default.
+
+        Returns:
+            hashlib._Hash: The updated digest.
+        """
+        digest = digest or hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(self.chunk_size), b""):
+                digest.update(block)
+        return digest
+
+    @staticmethod
+    def expected_digests(entry: dict, version: dict) -> dict:
+        """
+        Returns the checksums a download can be checked against.
+
+        Args:
+            entry (dict): The cache index entry of the URL.
+            version (dict): The remote version, see `remote_version`.
+
+        Returns:
+            dict: Hex digests keyed by `hashlib` name: the MD5 the server
+            reports, and the SHA-256 recorded for the same ETag and size.
+        """
+        expected = {}
+        if version.get("md5"):
+            expected["md5"] = version["md5"]
+        if (
+            entry.get("sha256")
+            and version["etag"]
+            and entry.get("etag") == version["etag"]
+            and entry.get("size") == version["size"]
+        ):
+            expected["sha256"] = entry["sha256"]
+        return expected
+
+    def is_cached(self, url: str, dest: str, version: dict) -> bool:
+        entry = self.index.get(url)
+        if not entry or not entry.get("complete") or not os.path.exists(dest):
+            return False
+        if entry.get("etag") != version["etag"] or entry.get("size") != version["size"]:
+            return False
+        if os.path.getsize(dest) != entry["size"]:
+            return False
+        if self.file_digest(dest).hexdigest() != entry.get("sha256"):
+            print(f"{os.path.basename(dest)}: checksum mismatch, downloading again")
+            return False
+        return True
+
+    def download(self, url: str, dest: str) -> str:
+        """
+        Downloads a URL to a file, reusing the cached copy when it is unchanged.
+
+        Args:
+            url (str): The URL of the file.
+            dest (str): The path to write the file to.
+
+        Returns:
+            str: The path of the downloaded file.
+
+        Raises:
+            requests.HTTPError: If the server returns an error status.
+            IOError: If the downloaded size does not match the advertised size,
+                or the file does not match a checksum from `expected_digests`.
+        """
+        name = os.path.basename(dest)
+        version = self.remote_version(url)
+        with self._lock:
+            if self.is_cached(url, dest, version):
+                print(f"{name}: unchanged, using cached copy")
+                return dest
+            entry = self.index.get(url, {})
+
+        part_path = f"{dest}.part"
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        if offset and (
+            entry.get("etag") != version["etag"] or entry.get("size") != version["size"]
+        ):
+            # the partial file belongs to a different version of the archive
+            offset = 0
+
+        expected = self.expected_digests(entry, version)
+        with self._lock:
+            self.index[url] = {**version, "complete": False}
+            if "sha256" in expected:
+                # kept so the download can still be checked after another interruption
+                self.index[url]["sha256"] = expected["sha256"]
+            self._write_index()
+
+        headers = {}
+        if offset:
+            headers["Range"] = f"bytes={offset}-"
+            if version["etag"]:
+                headers["If-Range"] = version["etag"]
+
+        digests = {
+            algorithm: hashlib.new(algorithm) for algorithm in {"sha256", *expected}
+        }
+        received = 0
+        start = time.perf_counter()
+        with self.session.get(
+            url, headers=headers, stream=True, timeout=self.timeout
+        ) as response:
+            response.raise_for_status()
+            if offset and response.status_code != 206:
+                # the server ignored the range, start over
+                offset = 0
+            if offset:
+                for digest in digests.values():
+                    self.file_digest(part_path, digest)
+            with open(part_path, "ab" if offset else "wb") as f:
+                for chunk in response.iter_content(self.chunk_size):
+                    f.write(chunk)
+                    for digest in digests.values():
+                        digest.update(chunk)
+                    received += len(chunk)
+        elapsed = time.perf_counter() - start
+
+        size = os.path.getsize(part_path)
+        if version["size"] is not None and size != version["size"]:
+            raise IOError(
+                f"{name}: expected {version['size']} bytes, got {size}; "
+                "rerun to resume"
+            )
+        for algorithm, value in expected.items():
+            if digests[algorithm].hexdigest() != value:
+                # a corrupt partial file would be resumed again, so start over
+                os.remove(part_path)
+                raise IOError(f"{name}: {algorithm} checksum mismatch; rerun")
+        os.replace(part_path, dest)
+
+        rate = received / elapsed if elapsed else 0.0
+        with self._lock:
+            self.rates[url] = rate
+            self.index[url] = {
+                "etag": version["etag"],
+                "size": size,
+                "sha256": digests["sha256"].hexdigest(),
+                "complete": True,
+            }
+            self._write_index()
+        resumed = f", resumed at {offset} bytes" if offset else ""
+        print(
+            f"{name}: {received / 1e6:.1f} MB in {elapsed:.1f}s "
+            f"({rate / 1e6:.2f} MB/s{resumed})"
+        )
+        return dest
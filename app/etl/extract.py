@@ -1,10 +1,43 @@
 import os
+import re
 import zipfile
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
 
 import pandas as pd
 import streamlit as st
-from pymongo import MongoClient
-from typing import Optional
+from pymongo import MongoClient, ReplaceOne
+from typing import Iterator, Optional
+
+from app.etl.arrow_reader import read_csv_batches, read_csv_tables
+from app.etl.client import registry
+from app.etl.dimensions import StationDimension
+from app.etl.download import Downloader
+from app.etl.manifest import MANIFEST_SUFFIX, LoadManifest
+from app.etl.rollups import Rollups
+from app.etl.schema import (
+    TRIP_DTYPES,
+    coerce_types,
+    derive_fields,
+    describe_metrics,
+    null_masks,
+    to_documents,
+    validate,
+)
+from app.etl.staging import ParquetStore
+from app.etl.timeseries import (
+    add_meta,
+    create_timeseries,
+    is_timeseries,
+    meta_query,
+    meta_stage,
+)
+
+# Rows read, converted and written per batch in streaming mode
+DEFAULT_BATCH_SIZE = 100_000
+# CSV readers: pandas' C parser or the pyarrow CSV reader
+PARSE_BACKENDS = ("pandas", "arrow")
 
 
 class ExtractTransformLoad:
@@ -16,17 +49,16 @@ class ExtractTransformLoad:
         port: Optional[int] = None,
         uri: Optional[str] = None,
     ) -> None:
-        client: MongoClient
-        if uri:
-            client = MongoClient(uri)
-        elif host and port:
-            client = MongoClient(host, port)
-        else:
-            raise ValueError("Either `host` and `port` or `uri` must be provided.")
-
-        self.client = client
+        # clients are shared per server across instances and Streamlit reruns
+        self.client_key = registry.key(uri, host, port)
+        self.client: MongoClient = registry.get_client(uri, host, port)
         self.db = self.client[db_name]
         self.default_collection = None
+        self.downloader: Optional[Downloader] = None
+        self.station_dimensions: dict = {}
+        self.timeseries_collections: dict = {}
+        # trip start ranges whose rollup refresh waits for `deferred_rollups` to exit
+        self.deferred_ranges: Optional[dict] = None
 
         if collection_name:
             self.default_collection = self.get_collection(collection_name)
@@ -39,6 +71,156 @@ class ExtractTransformLoad:
         else:
             raise ValueError("No collection specified")
 
+    def pool_metrics(self) -> dict:
+        """
+        Returns the connection pool counters of the shared client.
+
+        Returns:
+            dict: Open and checked-out connections, checkouts, failures and wait times.
+        """
+        return registry.pool_metrics(self.client_key)
+
+    def get_manifest(self, collection_name: str = None) -> LoadManifest:
+        collection = self.get_collection(collection_name)
+        return LoadManifest(self.db[f"{collection.name}{MANIFEST_SUFFIX}"])
+
+    def is_timeseries(self, collection_name: str = None) -> bool:
+        """
+        Tells whether a trips collection is stored as a time-series collection.
+
+        Args:
+            collection_name (str): The name of the MongoDB collection.
+
+        Returns:
+            bool: True for a time-series collection, checked once per instance.
+        """
+        collection = self.get_collection(collection_name)
+        if collection.name not in self.timeseries_collections:
+            self.timeseries_collections[collection.name] = is_timeseries(collection)
+        return self.timeseries_collections[collection.name]
+
+    def prepare_timeseries(self, collection_name: str) -> None:
+        """
+        Creates the trips collection as a time-series collection on `started_at`.
+
+        An existing collection is left as it is, time-series or not.
+
+        Args:
+            collection_name (str): The name of the MongoDB collection.
+        """
+        create_timeseries(self.db, collection_name)
+        self.timeseries_collections.pop(collection_name, None)
+
+    def trip_query(self, query: dict, collection_name: str = None) -> dict:
+        """
+        Adapts a query on trip fields to the way the trips collection is stored.
+
+        Args:
+            query (dict): The query.
+            collection_name (str): The name of the MongoDB collection.
+
+        Returns:
+            dict: The query, matching station names on the station keys once
+            the station dimension is built, and on the meta field of a
+            time-series collection.
+        """
+        stations = self.get_station_dimension(collection_name)
+        if stations.is_built():
+            query = stations.station_query(query)
+        if self.is_timeseries(collection_name):
+            return meta_query(query)
+        return query
+
+    def read_stages(self, collection_name: str = None) -> list:
+        """
+        Returns the stages that follow the leading `$match` of a trips aggregation.
+
+        Args:
+            collection_name (str): The name of the MongoDB collection.
+
+        Returns:
+            list: `meta_stage` for a time-series collection, which keeps the
+            `META_FIELDS` only in its meta field, otherwise nothing.
+        """
+        return [meta_stage()] if self.is_timeseries(collection_name) else []
+
+    def trip_pipeline(self, pipeline: list, collection_name: str = None) -> list:
+        """
+        Adapts a trips aggregation to the way the trips collection is stored.
+
+        The leading `$match` goes through `trip_query` and is followed by
+        the `read_stages`, so the other stages read trip fields as usual.
+
+        Args:
+            pipeline (list): The aggregation stages.
+            collection_name (str): The name of the MongoDB collection.
+
+        Returns:
+            list: The stages to run on the trips collection.
+        """
+        match = []
+        if pipeline and "$match" in pipeline[0]:
+            match = [
+                {"$match": self.trip_query(pipeline[0]["$match"], collection_name)}
+            ]
+            pipeline = pipeline[1:]
+        return match + self.read_stages(collection_name) + pipeline
+
+    def get_station_dimension(self, collection_name: str = None) -> StationDimension:
+        """
+        Returns the station dimension of a collection, shared by its loads.
+
+        Args:
+            collection_name (str): The name of the MongoDB collection.
+
+        Returns:
+            StationDimension: The dimension, with its station keys read once.
+        """
+        collection = self.get_collection(collection_name)
+        if collection.name not in self.station_dimensions:
+            self.station_dimensions[collection.name] = StationDimension(collection)
+        return self.station_dimensions[collection.name]
+
+    def backfill_station_keys(self, collection_name: str = None) -> None:
+        """
+        Gives the trips loaded before the station dimension existed their station keys.
+
+        Does nothing once the dimension is built, so it is cheap to call
+        before every load.
+
+        Args:
+            collection_name (str): The name of the MongoDB collection.
+        """
+        try:
+            stations = self.get_station_dimension(collection_name)
+            if stations.is_built():
+                return
+            count = stations.backfill(self.get_collection(collection_name))
+            print(f"Built the station dimension with {count} stations")
+        except Exception as e:
+            print(f"Error occurred while building the station dimension: {e}")
+
+    def data_version(self, collection_name: str = None) -> tuple:
+        """
+        Identifies the state of the loaded data and of the rollups derived from it.
+
+        Combines the load manifest's version with the time the collection
+        stats were last refreshed, which is the last step of every rollup
+        refresh, so cached results read from the rollups are dropped once
+        the rollups have caught up with a load.
+
+        Args:
+            collection_name (str): The name of the MongoDB collection.
+
+        Returns:
+            tuple: The manifest version and the stats refresh time.
+        """
+        totals = Rollups(self.get_collection(collection_name)).stats.totals()
+        return (
+            self.get_manifest(collection_name).data_version(),
+            totals.get("updated_at") if totals else None,
+        )
+
     @staticmethod
     def generate_monthly_urls(base_url: str, year: int) -> list:
         urls = []
@@ -48,86 +230,578 @@ class ExtractTransformLoad:
             urls.append(url)
         return urls
 
-    def extract_data(self, url: str, path: str) -> list:
+    def get_downloader(self, path: str) -> Downloader:
         """
-        Extracts data from a given URL and saves it to the specified path.
+        Returns the downloader whose cache lives in the given directory.
+
+        Args:
+            path (str): The directory where downloaded archives are stored.
+
+        Returns:
+            Downloader: A downloader reused across months so its connections stay open.
+        """
+        if self.downloader is None or self.downloader.cache_dir != path:
+            self.downloader = Downloader(path)
+        return self.downloader
+
+    def extract_data(self, url: str, path: str) -> Optional[str]:
+        """
+        Downloads the archive at a given URL to the specified path.
         Args:
             url (str): The URL of the data to be extracted.
-            path (str): The path where the extracted data will be saved.
+            path (str): The path where the downloaded archive will be saved.
         Returns:
-            str: The path of the extracted file if successful, None otherwise.
+            str: The path of the archive if it contains CSV files, None otherwise.
+        Raises:
+            requests.HTTPError: If the archive cannot be downloaded.
         """
         zip_name = os.path.join(path, url.split("/")[-1])
-        os.system(f"wget {url} -O {zip_name}")
+        self.get_downloader(path).download(url, zip_name)
         with zipfile.ZipFile(zip_name, "r") as zip_ref:
-            for file in zip_ref.namelist():
-                if file.endswith(".csv") and "__MACOSX" not in file:
-                    zip_ref.extract(file, path)
-                    return os.path.join(path, file)
+            if self.csv_members(zip_ref):
+                return zip_name
         return None
 
-    def process_data(self, csv_path: str, collection_name: str) -> list:
+    @staticmethod
+    def csv_members(zip_ref: zipfile.ZipFile) -> list:
+        """
+        Lists the CSV files in an archive, skipping macOS metadata entries.
+
+        Args:
+            zip_ref (zipfile.ZipFile): The open archive.
+
+        Returns:
+            list: The names of the CSV members.
+        """
+        return [
+            file
+            for file in zip_ref.namelist()
+            if file.endswith(".csv") and "__MACOSX" not in file
+        ]
+
+    @staticmethod
+    def transform_data(df: pd.DataFrame, metrics: Optional[Counter] = None) -> list:
+        """
+        Validates a DataFrame of trips and converts it into documents.
+
+        Besides parsing the timestamps this adds the duration, hour, day of
+        week, month and distance of each trip. Trips missing a required
+        field or with a negative duration are rejected, while missing
+        optional fields are left out of the document, see
+        `app.etl.schema.validate`.
+
+        Args:
+            df (pd.DataFrame): The raw trips read from a CSV file.
+            metrics (Counter, optional): Counts rows read, rejected and flagged per reason.
+
+        Returns:
+            list: The transformed trips as a list of dictionaries.
+        """
+        coerce_types(df)
+        derive_fields(df)
+        missing, has_null = null_masks(df)
+        keep = validate(df, missing, has_null, metrics)
+        return to_documents(df, keep, has_null)
+
+    @classmethod
+    def read_member_batches(
+        cls,
+        zip_ref: zipfile.ZipFile,
+        member: str,
+        batch_size: Optional[int] = None,
+        skip_rows: int = 0,
+        parse_backend: str = "pandas",
+        metrics: Optional[Counter] = None,
+    ) -> Iterator[list]:
         """
-        Transforms data from a CSV file
+        Reads a CSV member straight out of an archive and yields its transformed trips.
+
+        The member is decompressed as a stream, so it is never written to
+        disk. With a batch size it is read in chunks of that many rows, so
+        only one chunk is held in memory at a time. Without one the whole
+        member is read and yielded as a single batch.
+
+        Args:
+            zip_ref (zipfile.ZipFile): The open archive.
+            member (str): The name of the CSV member.
+            batch_size (int, optional): The number of rows per batch.
+            skip_rows (int): The number of data rows to skip, used to resume a member.
+            parse_backend (str): "pandas", or "arrow" to parse with pyarrow
+                and build documents without pandas.
+            metrics (Counter, optional): Updated with each batch's validation
+                counts before the batch is yielded.
+
+        Yields:
+            list: A batch of transformed trips.
+        """
+        skiprows = range(1, skip_rows + 1) if skip_rows else None
+        with zip_ref.open(member) as csv_file:
+            if parse_backend == "arrow":
+                yield from read_csv_batches(csv_file, batch_size, skip_rows, metrics)
+            elif batch_size:
+                with pd.read_csv(
+                    csv_file,
+                    dtype=TRIP_DTYPES,
+                    chunksize=batch_size,
+                    skiprows=skiprows,
+                ) as reader:
+                    for chunk in reader:
+                        yield cls.transform_data(chunk, metrics)
+            else:
+                df = pd.read_csv(csv_file, dtype=TRIP_DTYPES, skiprows=skiprows)
+                yield cls.transform_data(df, metrics)
+
+    def load_member(
+        self,
+        collection_name: str,
+        source: str,
+        member: str,
+        batches: Iterator[list],
+        batch_size: Optional[int] = None,
+        offset: int = 0,
+        upsert: bool = False,
+        metrics: Optional[Counter] = None,
+    ) -> bool:
+        """
+        Loads the batches of a CSV member and records each one in the manifest.
+
+        Each batch gets its station keys from the station dimension, the
+        `source` it was loaded from, and its meta field if the collection is
+        a time-series collection, before it is written. When `metrics` is
+        given it must be the counter the batches update as they are read,
+        and each committed batch adds its share of the validation counts to
+        the manifest.
 
         Args:
-            csv_path (str): The path to the CSV file.
             collection_name (str): The name of the MongoDB collection.
+            source (str): The archive file name.
+            member (str): The CSV member name.
+            batches (Iterator[list]): The transformed batches of the member.
+            batch_size (int, optional): The number of CSV rows per batch.
+            offset (int): The CSV row offset the batches start at.
+            upsert (bool): Upsert trips on `ride_id` instead of inserting them,
+                which is always done for a member a previous load started.
+            metrics (Counter, optional): The validation counts of the batches.
 
         Returns:
-            list: The processed data as a list of dictionaries.
+            bool: True if every batch was written and the member is complete.
+        """
+        manifest = self.get_manifest(collection_name)
+        if not upsert and manifest.get(source, member):
+            # the last batch may have been written without being committed
+            self.prepare_upsert(collection_name)
+            upsert = True
+        manifest.start(source, member, offset)
+        stations = self.get_station_dimension(collection_name)
+        timeseries = self.is_timeseries(collection_name)
+        committed = Counter()
+        for data in batches:
+            data = stations.assign(data)
+            # the manifest key of the trip, so `delete_month` removes what it forgets
+            for document in data:
+                document["source"] = source
+            if timeseries:
+                add_meta(data)
+            if not self.load_data(collection_name, data, upsert):
+                print(f"Stopped loading {member} at row {offset}, rerun to resume")
+                return False
+            if batch_size:
+                offset += batch_size
+            delta = metrics - committed if metrics is not None else None
+            started = [document["started_at"] for document in data]
+            started_range = (min(started), max(started)) if started else None
+            manifest.commit(source, member, offset, len(data), delta, started_range)
+            if metrics is not None:
+                committed = metrics.copy()
+        manifest.complete(source, member)
+        if metrics is not None:
+            print(f"Loaded {member}: {describe_metrics(metrics)}")
+        return True
+
+    def process_data(
+        self,
+        zip_path: str,
+        collection_name: str,
+        batch_size: Optional[int] = None,
+        upsert: bool = False,
+        parse_backend: str = "pandas",
+    ) -> None:
+        """
+        Transforms the CSV files in an archive and loads them into the database.
+
+        Each batch is written before the next one is read, so with a batch
+        size peak memory is bounded by the batch rather than the month.
+        Members the manifest marks as complete are skipped and interrupted
+        ones resume from their last committed batch.
+
+        Args:
+            zip_path (str): The path to the zip archive.
+            collection_name (str): The name of the MongoDB collection.
+            batch_size (int, optional): Stream the files in batches of this many rows.
+            upsert (bool): Upsert trips on `ride_id` instead of inserting them.
+            parse_backend (str): The CSV reader, "pandas" or "arrow".
 
         Raises:
             Exception: If an error occurs while processing the data.
         """
         try:
-            if csv_path:
-                df = pd.read_csv(csv_path)
-                df["started_at"] = pd.to_datetime(df["started_at"])
-                df["ended_at"] = pd.to_datetime(df["ended_at"])
-                df.dropna(inplace=True)
-                data = df.to_dict("records")
-
-                self.load_data(collection_name, data)
-                os.remove(csv_path)
+            if zip_path:
+                source = os.path.basename(zip_path)
+                manifest = self.get_manifest(collection_name)
+                self.prepare_resume(collection_name, source)
+                complete = True
+                with zipfile.ZipFile(zip_path, "r") as zip_ref:
+                    for member in self.csv_members(zip_ref):
+                        offset = manifest.resume_offset(source, member)
+                        if offset is None:
+                            print(f"{member} already loaded, skipping")
+                            continue
+                        metrics = Counter()
+                        batches = self.read_member_batches(
+                            zip_ref, member, batch_size, offset, parse_backend, metrics
+                        )
+                        complete &= self.load_member(
+                            collection_name,
+                            source,
+                            member,
+                            batches,
+                            batch_size,
+                            offset,
+                            upsert,
+                            metrics,
+                        )
+                if complete:
+                    manifest.complete(source)
             else:
                 print("No csv file found")
         except Exception as e:
             print(f"Error occurred while processing data: {e}")
 
-    def load_data(self, collection_name: str, data: list) -> None:
+    def load_data(self, collection_name: str, data: list, upsert: bool = False) -> bool:
         """
         Loads the given data into database.
 
         Args:
             collection_name (str): The name of the collection to load the data into.
             data (list): The list of data to be inserted into the collection.
+            upsert (bool): Replace trips with the same `ride_id` using an
+                unordered bulk write instead of inserting them.
 
         Returns:
-            None
+            bool: True if the data was written, False otherwise.
         """
         try:
+            if not data:
+                return True
             collection = self.get_collection(collection_name)
-            collection.insert_many(data)
+            if upsert:
+                collection.bulk_write(
+                    [
+                        ReplaceOne({"ride_id": trip["ride_id"]}, trip, upsert=True)
+                        for trip in data
+                    ],
+                    ordered=False,
+                )
+            else:
+                collection.insert_many(data)
+            return True
         except Exception as e:
             print(f"Error occurred while loading data: {e}")
+            return False
+
+    def refresh_rollups(self, collection_name: str, source: str) -> None:
+        """
+        Merges the months an archive touched into the dashboard rollups.
+
+        The months are taken from the range of trip start times the load
+        manifest recorded for the archive, so trips that started before the
+        archive's month are counted in their own month. Nothing is done
+        until the rollups have been built in full once, and inside
+        `deferred_rollups` the range is only recorded.
+
+        Args:
+            collection_name (str): The name of the MongoDB collection.
+            source (str): The archive file name.
+        """
+        try:
+            rollups = Rollups(self.get_collection(collection_name))
+            if not rollups.is_built():
+                return
+            first, last = self.get_manifest(collection_name).started_range(source)
+            if self.deferred_ranges is not None:
+                if first is not None and last is not None:
+                    known = self.deferred_ranges.get(collection_name, (first, last))
+                    self.deferred_ranges[collection_name] = (
+                        min(known[0], first),
+                        max(known[1], last),
+                    )
+                return
+            periods = rollups.refresh_range(first, last)
+            if periods:
+                print(f"Refreshed rollups for {', '.join(periods)}")
+        except Exception as e:
+            print(f"Error occurred while refreshing rollups: {e}")
+
+    @contextmanager
+    def deferred_rollups(self) -> Iterator[None]:
+        """
+        Holds back the rollup refreshes of the loads in the block until it exits.
+
+        Meant to wrap `IndexManager.deferred`, so the months loaded are
+        refreshed in one pass once the `started_at` indexes are back instead
+        of with collection scans after every archive.
+        """
+        self.deferred_ranges = {}
+        try:
+            yield
+        finally:
+            ranges, self.deferred_ranges = self.deferred_ranges, None
+            for collection_name, (first, last) in ranges.items():
+                try:
+                    rollups = Rollups(self.get_collection(collection_name))
+                    periods = rollups.refresh_range(first, last)
+                    if periods:
+                        print(f"Refreshed rollups for {', '.join(periods)}")
+                except Exception as e:
+                    print(f"Error occurred while refreshing rollups: {e}")
+
+    def delete_month(self, collection_name: str, year: int, month: int) -> int:
+        """
+        Deletes the trips loaded from a month's archive and removes them from the rollups.
+
+        Trips are matched on the `source` they were loaded from, the same
+        key as the load manifest records that are removed with them, so the
+        next ingest loads exactly the deleted trips again. The archive of a
+        month can hold trips that started in the previous month, so every
+        month the deleted trips started in is refreshed in the rollups.
+
+        In a time-series collection `source` is part of the meta field, and
+        deletes that only filter on the meta field are supported by every
+        MongoDB version `--timeseries` runs on.
+
+        Args:
+            collection_name (str): The name of the MongoDB collection.
+            year (int): The year of the month.
+            month (int): The month number.
+
+        Returns:
+            int: The number of trips deleted.
+        """
+        collection = self.get_collection(collection_name)
+        manifest = self.get_manifest(collection_name)
+        pattern = f"^({year}{month:02d}|{re.escape(ParquetStore.source(year, month))}$)"
+        sources = manifest.sources(pattern)
+        ranges = [manifest.started_range(source) for source in sources]
+        starts = [first for first, _ in ranges if first is not None]
+        ends = [last for _, last in ranges if last is not None]
+        deleted = collection.delete_many(
+            self.trip_query({"source": {"$in": sources}}, collection_name)
+        ).deleted_count
+        manifest.forget(pattern)
+        rollups = Rollups(collection)
+        if rollups.is_built() and starts:
+            rollups.refresh_range(min(starts), max(ends))
+        return deleted
+
+    def prepare_resume(self, collection_name: str, source: str) -> None:
+        """
+        Makes an interrupted archive safe to load again on a time-series collection.
+
+        A load can stop after a batch is written but before it is committed
+        to the manifest, or part way through `insert_many`, so the batch
+        the archive resumes at may already be partly stored. `load_member`
+        upserts a resumed member on `ride_id` to write it again without
+        duplicates, but a time-series collection cannot have the unique
+        index that needs. There the trips of the archive are deleted on
+        their `source` and its manifest records forgotten, so the archive
+        is loaded again from the start.
+
+        Args:
+            collection_name (str): The name of the MongoDB collection.
+            source (str): The archive file name.
+        """
+        manifest = self.get_manifest(collection_name)
+        if not self.is_timeseries(collection_name) or not manifest.is_interrupted(
+            source
+        ):
+            return
+        deleted = (
+            self.get_collection(collection_name)
+            .delete_many(self.trip_query({"source": source}, collection_name))
+            .deleted_count
+        )
+        manifest.forget(f"^{re.escape(source)}$")
+        print(f"{source} was interrupted, deleted its {deleted} trips to load it again")
+
+    def prepare_upsert(self, collection_name: str) -> None:
+        """
+        Creates the unique `ride_id` index that upsert mode matches on.
+
+        Args:
+            collection_name (str): The name of the MongoDB collection.
+        """
+        self.get_collection(collection_name).create_index("ride_id", unique=True)
 
     def ingest_data(
-        self, base_url: str, year: int, path: str, collection_name: str
+        self,
+        base_url: str,
+        year: int,
+        path: str,
+        collection_name: str,
+        batch_size: Optional[int] = None,
+        keep_downloads: bool = False,
+        upsert: bool = False,
+        parse_backend: str = "pandas",
     ) -> None:
         """
         Perfoms the ETL process.
 
+        Archives the load manifest marks as complete are skipped, so a rerun
+        after a failure only loads what is missing.
+
         Args:
             base_url (str): The base URL for the data.
             year (int): The year for which the data is to be ingested.
             path (str): The path where the downloaded zip files are stored.
             collection_name (str): The name of the collection in which the processed data will be stored.
+            batch_size (int, optional): Stream each CSV in batches of this many rows.
+            keep_downloads (bool): Keep the zip files so unchanged months are not downloaded again.
+            upsert (bool): Upsert trips on `ride_id` instead of inserting them.
+            parse_backend (str): The CSV reader, "pandas" or "arrow".
         """
         urls = self.generate_monthly_urls(base_url, year)
+        manifest = self.get_manifest(collection_name)
+        if upsert:
+            self.prepare_upsert(collection_name)
         for url in urls:
-            csv_path = self.extract_data(url, path)
-            self.process_data(csv_path, collection_name)
+            source = url.split("/")[-1]
+            if manifest.is_complete(source):
+                print(f"{source} already loaded, skipping")
+                continue
+            try:
+                zip_path = self.extract_data(url, path)
+            except Exception as e:
+                print(f"Error occurred while downloading {url}: {e}")
+                continue
+            self.process_data(
+                zip_path, collection_name, batch_size, upsert, parse_backend
+            )
+            self.refresh_rollups(collection_name, source)
 
             zip_name = os.path.join(path, url.split("/")[-1])
-            os.remove(zip_name)
+            if not keep_downloads and os.path.exists(zip_name):
+                os.remove(zip_name)
+
+    def stage_data(
+        self,
+        base_url: str,
+        year: int,
+        path: str,
+        store_root: str,
+        batch_size: Optional[int] = DEFAULT_BATCH_SIZE,
+        keep_downloads: bool = False,
+    ) -> None:
+        """
+        Downloads and cleans a year of trips into a local Parquet store.
+
+        Months that are already staged are skipped. Parsing always uses the
+        pyarrow reader, so the cleaned batches are written without being
+        converted to documents.
+
+        Args:
+            base_url (str): The base URL for the data.
+            year (int): The year for which the data is to be staged.
+            path (str): The path where the downloaded zip files are stored.
+            store_root (str): The root directory of the Parquet store.
+            batch_size (int, optional): The number of CSV rows parsed per batch.
+            keep_downloads (bool): Keep the zip files so unchanged months are not downloaded again.
+        """
+        store = ParquetStore(store_root)
+        urls = self.generate_monthly_urls(base_url, year)
+        for month, url in enumerate(urls, start=1):
+            if store.is_staged(year, month):
+                print(f"{year}-{month:02d} already staged, skipping")
+                continue
+            try:
+                zip_path = self.extract_data(url, path)
+            except Exception as e:
+                print(f"Error occurred while downloading {url}: {e}")
+                continue
+            if not zip_path:
+                print("No csv file found")
+                continue
+
+            try:
+                with zipfile.ZipFile(zip_path, "r") as zip_ref:
+                    for member in self.csv_members(zip_ref):
+                        metrics = Counter()
+                        with zip_ref.open(member) as csv_file:
+                            rows = store.write_member(
+                                year,
+                                month,
+                                member,
+                                read_csv_tables(csv_file, batch_size, 0, metrics),
+                            )
+                        print(
+                            f"Staged {rows} trips from {member}: "
+                            f"{describe_metrics(metrics)}"
+                        )
+                store.mark_staged(year, month)
+            except Exception as e:
+                print(f"Error occurred while staging data: {e}")
+
+            if not keep_downloads and os.path.exists(zip_path):
+                os.remove(zip_path)
+
+    def load_staged(
+        self,
+        store_root: str,
+        year: int,
+        collection_name: str,
+        batch_size: Optional[int] = DEFAULT_BATCH_SIZE,
+        upsert: bool = False,
+    ) -> None:
+        """
+        Loads a year of staged trips from the Parquet store into the database.
+
+        Progress is recorded in the load manifest the same way as for CSV
+        archives, so a rerun skips loaded months and resumes interrupted files.
+
+        Args:
+            store_root (str): The root directory of the Parquet store.
+            year (int): The year to load.
+            collection_name (str): The name of the MongoDB collection.
+            batch_size (int, optional): The number of trips per insert.
+            upsert (bool): Upsert trips on `ride_id` instead of inserting them.
+        """
+        store = ParquetStore(store_root)
+        manifest = self.get_manifest(collection_name)
+        if upsert:
+            self.prepare_upsert(collection_name)
+        for month in range(1, 13):
+            if not store.is_staged(year, month):
+                continue
+            source = store.source(year, month)
+            if manifest.is_complete(source):
+                print(f"{source} already loaded, skipping")
+                continue
+            self.prepare_resume(collection_name, source)
+            complete = True
+            for file in store.month_files(year, month):
+                member = os.path.basename(file)
+                offset = manifest.resume_offset(source, member)
+                if offset is None:
+                    continue
+                batches = store.read_batches(file, batch_size, offset)
+                complete &= self.load_member(
+                    collection_name,
+                    source,
+                    member,
+                    batches,
+                    batch_size,
+                    offset,
+                    upsert,
+                )
+            if complete:
+                manifest.complete(source)
+            self.refresh_rollups(collection_name, source)
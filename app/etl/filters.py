@@ -0,0 +1,161 @@
+from dataclasses import dataclass
+from datetime import date, datetime, time, timedelta
+from typing import Optional
+
+# Trip fields filtered on by the members of `TripFilter`
+FILTER_FIELDS = {
+    "start_stations": "start_station_name",
+    "end_stations": "end_station_name",
+    "rideable_types": "rideable_type",
+    "member_types": "member_casual",
+}
+
+
+def and_match(*matches: dict) -> dict:
+    """
+    Combines `$match` conditions, keeping a flat document when the fields differ.
+
+    Args:
+        matches (dict): The conditions, empty ones are ignored.
+
+    Returns:
+        dict: A condition matching documents that meet all of them.
+    """
+    matches = [match for match in matches if match]
+    fields = [field for match in matches for field in match]
+    if len(fields) == len(set(fields)):
+        return {field: match[field] for match in matches for field in match}
+    return {"$and": matches}
+
+
+def match_stage(match: dict) -> list:
+    """
+    Returns the `$match` stage leading a pipeline, none for an empty condition.
+    """
+    return [{"$match": match}] if match else []
+
+
+@dataclass(frozen=True)
+class TripFilter:
+    """
+    Restricts the `Queries` methods to some trips.
+
+    Every member is optional and an empty filter selects every trip. Dates
+    are inclusive and apply to `started_at`; the other members keep trips
+    whose field is any of the given values. Filters are hashable, so they
+    can be part of a query cache key.
+
+    Args:
+        start (date, optional): The first day of the window.
+        end (date, optional): The last day of the window.
+        start_stations (tuple): Start station names.
+        end_stations (tuple): End station names.
+        rideable_types (tuple): Bike types.
+        member_types (tuple): User types.
+    """
+
+    start: Optional[date] = None
+    end: Optional[date] = None
+    start_stations: tuple = ()
+    end_stations: tuple = ()
+    rideable_types: tuple = ()
+    member_types: tuple = ()
+
+    def __post_init__(self) -> None:
+        for name in FILTER_FIELDS:
+            object.__setattr__(self, name, tuple(getattr(self, name)))
+
+    def is_empty(self) -> bool:
+        return self == TripFilter()
+
+    def time_range(self) -> tuple:
+        """
+        Returns the window as `started_at` bounds.
+
+        Returns:
+            tuple: The inclusive start and exclusive end datetimes, None where open.
+        """
+        start = datetime.combine(self.start, time.min) if self.start else None
+        end = (
+            datetime.combine(self.end + timedelta(days=1), time.min)
+            if self.end
+            else None
+        )
+        return start, end
+
+    def trip_match(self) -> dict:
+        """
+        Builds the `$match` condition selecting the filtered trips.
+
+        The window is a range on `started_at` and the other members are
+        `$in` conditions, so the condition can use the trip indexes when it
+        leads a pipeline.
+
+        Returns:
+            dict: The condition, empty for an empty filter.
+        """
+        match = {}
+        start, end = self.time_range()
+        if start or end:
+            match["started_at"] = {}
+            if start:
+                match["started_at"]["$gte"] = start
+            if end:
+                match["started_at"]["$lt"] = end
+        for name, field in FILTER_FIELDS.items():
+            values = getattr(self, name)
+            if values:
+                match[field] = {"$in": list(values)}
+        return match
+
+    def period_match(self) -> Optional[dict]:
+        """
+        Builds the condition on the `period` of rollup documents for the window.
+
+        Rollups are kept per calendar month, so they can only answer a
+        window made of whole months.
+
+        Returns:
+            dict: The condition, empty without a window, or None if the
+            window starts or ends within a month.
+        """
+        if self.start and self.start.day != 1:
+            return None
+        if self.end and (self.end + timedelta(days=1)).day != 1:
+            return None
+        period = {}
+        if self.start:
+            period["$gte"] = f"{self.start.year}-{self.start.month:02d}"
+        if self.end:
+            period["$lte"] = f"{self.end.year}-{self.end.month:02d}"
+        return {"period": period} if period else {}
+
+    def usage_match(self) -> Optional[dict]:
+        """
+        Builds the `$match` condition on the usage rollup for the filter.
+
+        Returns:
+            dict: The condition, or None if the rollup cannot answer the
+            filter because it has stations or a window of partial months.
+        """
+        period = self.period_match()
+        if period is None or self.start_stations or self.end_stations:
+            return None
+        match = dict(period)
+        for name in ("rideable_types", "member_types"):
+            values = getattr(self, name)
+            if values:
+                match[FILTER_FIELDS[name]] = {"$in": list(values)}
+        return match
+
+    def station_match(self) -> Optional[dict]:
+        """
+        Builds the `$match` condition on the station rollup for the filter.
+
+        Returns:
+            dict: The condition, or None if the rollup cannot answer the
+            filter, which is the case for anything but a window of whole months.
+        """
+        if any(getattr(self, name) for name in FILTER_FIELDS):
+            return None
+        return self.period_match()
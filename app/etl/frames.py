@@ -0,0 +1,423 @@
+import struct
+from datetime import datetime, timezone
+from typing import Callable, Iterable
+
+import bson
+import numpy as np
+import pandas as pd
+
+# Column types a result schema can declare, and the dtype each one becomes.
+# A value whose BSON type does not match its column, or a missing field,
+# becomes a missing value, as in PyMongoArrow.
+SCHEMA_TYPES = {
+    "float": "float64, NaN when missing; doubles and integers",
+    "int": "int64, or nullable Int64 when a value is missing; 32 and 64-bit integers",
+    "string": "object, None when missing",
+    "category": "pandas Categorical, for strings with few distinct values",
+    "datetime": "datetime64[ms], NaT when missing",
+    "bool": "bool, or nullable boolean when a value is missing",
+}
+
+
+def check_schema(schema: dict) -> dict:
+    """
+    Checks that every column of a result schema has a known type.
+
+    Args:
+        schema (dict): Column types keyed by field, see `SCHEMA_TYPES`.
+
+    Returns:
+        dict: The schema.
+
+    Raises:
+        ValueError: If a column type is unknown.
+    """
+    for field, kind in schema.items():
+        if kind not in SCHEMA_TYPES:
+            raise ValueError(
+                f"Unknown type {kind!r} for {field!r}, expected one of {list(SCHEMA_TYPES)}"
+            )
+    return schema
+
+
+def result_schema(schema, raw_batches: bool = False) -> Callable:
+    """
+    Declares the columns of the documents a query method returns.
+
+    The schema is stored on the method as `result_schema`, so
+    `Queries.frame` can decode its results into typed columns.
+
+    Args:
+        schema (dict or Callable): Column types keyed by field, in column
+            order, or a function of the method's arguments returning them.
+        raw_batches (bool): Whether the method takes a `raw_batches` flag to
+            return its cursor as raw BSON batches for `frame_from_batches`.
+    """
+    if not callable(schema):
+        check_schema(schema)
+
+    def decorator(method: Callable) -> Callable:
+        method.result_schema = schema
+        method.raw_batches = raw_batches
+        return method
+
+    return decorator
+
+
+def schema_of(method: Callable, *args, **kwargs) -> dict:
+    """
+    Returns the result schema a query method declared for some arguments.
+
+    Args:
+        method (Callable): A method decorated with `result_schema`.
+
+    Returns:
+        dict: Column types keyed by field.
+
+    Raises:
+        ValueError: If the method has no declared schema.
+    """
+    schema = getattr(method, "result_schema", None)
+    if schema is None:
+        raise ValueError(f"{method.__name__} has no declared result schema")
+    return check_schema(schema(*args, **kwargs) if callable(schema) else schema)
+
+
+# BSON element types the columns read values of
+BSON_DOUBLE = 0x01
+BSON_STRING = 0x02
+BSON_BOOL = 0x08
+BSON_DATETIME = 0x09
+BSON_INT32 = 0x10
+BSON_INT64 = 0x12
+# Size of the value of each fixed-size BSON element type, -1 for the others
+FIXED_SIZES = np.full(256, -1, dtype=np.int64)
+for _type, _size in {
+    BSON_DOUBLE: 8,
+    0x06: 0,  # undefined
+    0x07: 12,  # ObjectId
+    BSON_BOOL: 1,
+    BSON_DATETIME: 8,
+    0x0A: 0,  # null
+    BSON_INT32: 4,
+    0x11: 8,  # timestamp
+    BSON_INT64: 8,
+    0x13: 16,  # decimal128
+    0x7F: 0,  # max key
+    0xFF: 0,  # min key
+}.items():
+    FIXED_SIZES[_type] = _size
+# Variable-size types, by the bytes their value has besides the int32 length
+# it starts with: strings, JavaScript and symbols also count the length
+# itself, documents, arrays and code with scope include it in the length.
+# -1 for the fixed-size types and those that are not length-prefixed.
+PREFIX_EXTRAS = np.full(256, -1, dtype=np.int64)
+for _type, _extra in {
+    0x02: 4,
+    0x0D: 4,
+    0x0E: 4,
+    0x03: 0,
+    0x04: 0,
+    0x0F: 0,
+    0x05: 5,  # binary, with its subtype byte
+    0x0C: 16,  # DBPointer, with its ObjectId
+}.items():
+    PREFIX_EXTRAS[_type] = _extra
+
+
+# Widest strings `_strings` pads into a fixed-width array
+MAX_PADDED_WIDTH = 256
+
+
+class _Column:
+    """
+    Collects the values of one column across the batches of a result.
+    """
+
+    def __init__(self, kind: str) -> None:
+        self.kind = kind
+        self.raw: list = []
+        self.valid: list = []
+
+    def add(self, raw: np.ndarray, valid: np.ndarray) -> None:
+        self.raw.append(raw)
+        self.valid.append(valid)
+
+    def finish(self):
+        if not self.raw:
+            return _finish(self.kind, *_raw_values(self.kind, []))
+        return _finish(self.kind, np.concatenate(self.raw), np.concatenate(self.valid))
+
+
+def frame_from_batches(batches: Iterable[bytes], schema: dict) -> pd.DataFrame:
+    """
+    Builds a DataFrame from raw BSON batches without decoding documents into dicts.
+
+    Each batch is read a column at a time with `_decode_batch`, so only
+    the typed arrays of the schema fields are ever built.
+
+    Args:
+        batches (Iterable[bytes]): Batches of concatenated BSON documents,
+            such as a `RawBatchCursor`.
+        schema (dict): Column types keyed by field, see `SCHEMA_TYPES`.
+
+    Returns:
+        pd.DataFrame: One typed column per schema field, in schema order.
+    """
+    columns = {field: _Column(kind) for field, kind in check_schema(schema).items()}
+    for data in batches:
+        for field, (raw, valid) in _decode_batch(data, schema).items():
+            columns[field].add(raw, valid)
+    return pd.DataFrame({field: column.finish() for field, column in columns.items()})
+
+
+def _gather(buffer: np.ndarray, positions: np.ndarray, dtype: str) -> np.ndarray:
+    """
+    Reads one little-endian value of a fixed-size type at each position of a buffer.
+    """
+    width = np.dtype(dtype).itemsize
+    return buffer[positions[:, None] + np.arange(width)].view(dtype).ravel()
+
+
+def _decode_batch(data: bytes, schema: dict) -> dict:
+    """
+    Reads the schema fields of a batch of BSON documents into raw arrays.
+
+    Only the document lengths are read one document at a time. The
+    elements are then walked in lockstep across every document with
+    NumPy: each step reads the type and name of the next element of every
+    document, records the value offset of those that are schema fields
+    and skips to the element after. Documents holding an element whose
+    size cannot be worked out this way, such as a regular expression, are
+    decoded with `bson.decode` instead.
+
+    Args:
+        data (bytes): Concatenated BSON documents.
+        schema (dict): Column types keyed by field, see `SCHEMA_TYPES`.
+
+    Returns:
+        dict: A raw value array and a mask of the values of the right type
+        for each field, as `_finish` takes them.
+    """
+    starts = []
+    offset = 0
+    read_length = struct.Struct("<i").unpack_from
+    while offset < len(data):
+        starts.append(offset)
+        offset += read_length(data, offset)[0]
+    count = len(starts)
+    buffer = np.frombuffer(data, dtype=np.uint8)
+    last = len(buffer) - 1
+    starts = np.array(starts, dtype=np.int64)
+    ends = np.append(starts[1:], len(buffer)) - 1
+    fields = {field.encode(): field for field in schema}
+    types = {field: np.zeros(count, dtype=np.uint8) for field in schema}
+    positions = {field: np.zeros(count, dtype=np.int64) for field in schema}
+    fallback = np.zeros(count, dtype=bool)
+
+    position = starts + 4
+    active = np.flatnonzero(position < ends)
+    while active.size:
+        element = position[active]
+        element_types = buffer[element]
+        name_starts = element + 1
+        name_lengths = np.full(active.size, -1, dtype=np.int64)
+        # documents mostly list their fields in the same order, so the name
+        # of the first unmatched element is matched against all the others
+        unmatched = np.arange(active.size)
+        while unmatched.size:
+            first = int(name_starts[unmatched[0]])
+            name = data[first : data.index(b"\0", first)]
+            candidates = name_starts[unmatched]
+            same = buffer[np.minimum(candidates + len(name), last)] == 0
+            if name:
+                indexes = np.minimum(candidates[:, None] + np.arange(len(name)), last)
+                same &= (buffer[indexes] == np.frombuffer(name, np.uint8)).all(axis=1)
+            matched = unmatched[same]
+            name_lengths[matched] = len(name)
+            field = fields.get(name)
+            if field is not None:
+                types[field][active[matched]] = element_types[matched]
+                positions[field][active[matched]] = name_starts[matched] + len(name) + 1
+            unmatched = unmatched[~same]
+        values = name_starts + name_lengths + 1
+        sizes = FIXED_SIZES[element_types]
+        prefixed = np.flatnonzero(PREFIX_EXTRAS[element_types] >= 0)
+        if prefixed.size:
+            sizes[prefixed] = (
+                _gather(buffer, values[prefixed], "<i4")
+                + PREFIX_EXTRAS[element_types[prefixed]]
+            )
+        unsupported = sizes < 0
+        fallback[active[unsupported]] = True
+        position[active] = values + sizes
+        active = active[~unsupported]
+        active = active[position[active] < ends[active]]
+
+    columns = {}
+    for field, kind in schema.items():
+        raw, valid = _typed_values(data, buffer, kind, types[field], positions[field])
+        columns[field] = (raw, valid)
+    for index in np.flatnonzero(fallback):
+        document = bson.decode(data[starts[index] : ends[index] + 1])
+        for field, kind in schema.items():
+            raw, valid = _raw_values(kind, [document.get(field)])
+            columns[field][0][index] = raw[0]
+            columns[field][1][index] = valid[0]
+    return columns
+
+
+def _strings(
+    data: bytes, buffer: np.ndarray, starts: np.ndarray, lengths: np.ndarray
+) -> np.ndarray:
+    """
+    Decodes the UTF-8 strings of a batch, each distinct value once.
+
+    Stations and types repeat, so the strings are padded into a fixed-width
+    array and deduplicated with NumPy. Long strings, or strings holding a
+    zero byte that the padding would not tell apart, are sliced one by one.
+    """
+    width = max(int(lengths.max()), 1)
+    if width <= MAX_PADDED_WIDTH:
+        offsets = np.arange(width)
+        inside = offsets < lengths[:, None]
+        indexes = np.where(inside, starts[:, None] + offsets, 0)
+        padded = np.where(inside, buffer[indexes], 0).astype(np.uint8)
+        if not (inside & (padded == 0)).any():
+            uniques, codes = np.unique(
+                padded.view(f"S{width}").ravel(), return_inverse=True
+            )
+            decoded = np.array([value.decode() for value in uniques], dtype=object)
+            return decoded[codes]
+    ends = starts + lengths
+    uniques, codes = np.unique(
+        np.fromiter(
+            (data[start:end] for start, end in zip(starts.tolist(), ends.tolist())),
+            dtype=object,
+            count=starts.size,
+        ),
+        return_inverse=True,
+    )
+    return np.array([value.decode() for value in uniques], dtype=object)[codes]
+
+
+def _typed_values(
+    data: bytes, buffer: np.ndarray, kind: str, types: np.ndarray, positions: np.ndarray
+) -> tuple:
+    """
+    Reads the values of one field from their BSON types and offsets in a batch.
+    """
+    count = types.size
+    if kind in ("string", "category"):
+        objects = np.full(count, None, dtype=object)
+        valid = types == BSON_STRING
+        strings = np.flatnonzero(valid)
+        if strings.size:
+            objects[strings] = _strings(
+                data,
+                buffer,
+                positions[strings] + 4,
+                _gather(buffer, positions[strings], "<i4") - 1,
+            )
+        return objects, valid
+    if kind == "datetime":
+        valid = types == BSON_DATETIME
+        values = np.zeros(count, dtype=np.int64)
+        values[valid] = _gather(buffer, positions[valid], "<i8")
+        return values, valid
+    if kind == "bool":
+        valid = types == BSON_BOOL
+        values = np.zeros(count, dtype=np.bool_)
+        values[valid] = buffer[positions[valid]] != 0
+        return values, valid
+    readers = {BSON_INT32: "<i4", BSON_INT64: "<i8"}
+    if kind == "float":
+        readers[BSON_DOUBLE] = "<f8"
+    values = np.zeros(count, dtype=np.float64 if kind == "float" else np.int64)
+    valid = np.zeros(count, dtype=bool)
+    for element_type, dtype in readers.items():
+        matched = types == element_type
+        values[matched] = _gather(buffer, positions[matched], dtype)
+        valid |= matched
+    return values, valid
+
+
+def frame_from_documents(documents: Iterable[dict], schema: dict) -> pd.DataFrame:
+    """
+    Builds a DataFrame with the column types of a schema from decoded documents.
+
+    Used for results that are already dicts, such as cached aggregations,
+    so they get the same columns as `frame_from_batches` would give.
+
+    Args:
+        documents (Iterable[dict]): The documents.
+        schema (dict): Column types keyed by field, see `SCHEMA_TYPES`.
+
+    Returns:
+        pd.DataFrame: One typed column per schema field, in schema order.
+    """
+    documents = list(documents)
+    return pd.DataFrame(
+        {
+            field: _finish(
+                kind,
+                *_raw_values(kind, [document.get(field) for document in documents]),
+            )
+            for field, kind in check_schema(schema).items()
+        }
+    )
+
+
+def _raw_values(kind: str, values: list) -> tuple:
+    """
+    Converts decoded values into a raw array and a mask of the values of the right type.
+    """
+    # from an iterator, numpy skips checking every item for nested sequences
+    objects = np.fromiter(values, dtype=object, count=len(values))
+    if kind in ("string", "category"):
+        valid = [isinstance(value, str) for value in values]
+    elif kind == "datetime":
+        valid = [isinstance(value, datetime) for value in values]
+    elif kind == "bool":
+        valid = [isinstance(value, bool) for value in values]
+    else:
+        accepted = (int, float) if kind == "float" else int
+        valid = [
+            isinstance(value, accepted) and not isinstance(value, bool)
+            for value in values
+        ]
+    valid = np.array(valid, dtype=bool)
+    if kind in ("string", "category"):
+        objects[~valid] = None
+        return objects, valid
+    if kind == "datetime":
+        objects[~valid] = None
+        # naive datetimes from pymongo are UTC already, aware ones are converted
+        return pd.to_datetime(objects, utc=True).as_unit("ms").asi8, valid
+    objects[~valid] = 0
+    return (
+        objects.astype({"float": np.float64, "int": np.int64, "bool": np.bool_}[kind]),
+        valid,
+    )
+
+
+def _finish(kind: str, values: np.ndarray, valid: np.ndarray):
+    """
+    Turns raw values and their validity into the column dtype of a schema type.
+    """
+    if kind == "string":
+        return values
+    if kind == "category":
+        return pd.Categorical(values)
+    if kind == "float":
+        return np.where(valid, values.astype(np.float64), np.nan)
+    if kind == "datetime":
+        result = values.astype(np.int64).view("datetime64[ms]").copy()
+        result[~valid] = np.datetime64("NaT")
+        return result
+    dtype = np.int64 if kind == "int" else np.bool_
+    if valid.all():
+        return values.astype(dtype)
+    if kind == "int":
+        return pd.arrays.IntegerArray(values.astype(dtype), ~valid)
+    return pd.arrays.BooleanArray(values.astype(dtype), ~valid)
@@ -0,0 +1,146 @@
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+from pymongo import ASCENDING, IndexModel
+from pymongo.collection import Collection
+
+from app.etl.timeseries import is_timeseries, meta_field
+
+# Secondary indexes of the trips collection, chosen from the filters and
+# groupings used by `Queries` and `CustomQuery`:
+# - the custom query filters on a `started_at` range plus member and bike type
+# - the custom query and station pages filter on station keys
+# - `get_bikes_used_by_member` matches on member type and groups on bike type
+# - the custom query table pages through trips in `started_at`, `_id` order
+TRIP_INDEXES = [
+    IndexModel(
+        [
+            ("started_at", ASCENDING),
+            ("member_casual", ASCENDING),
+            ("rideable_type", ASCENDING),
+        ],
+        name="started_member_bike",
+    ),
+    IndexModel(
+        [("start_station_key", ASCENDING), ("started_at", ASCENDING)],
+        name="start_station_key_started",
+    ),
+    IndexModel(
+        [("end_station_key", ASCENDING), ("started_at", ASCENDING)],
+        name="end_station_key_started",
+    ),
+    IndexModel(
+        [("member_casual", ASCENDING), ("rideable_type", ASCENDING)],
+        name="member_bike",
+    ),
+    IndexModel([("started_at", ASCENDING), ("_id", ASCENDING)], name="started_id"),
+]
+# Indexes earlier versions created on fields trips no longer keep
+RETIRED_INDEXES = ["start_station_started", "end_station_started"]
+
+
+def trip_indexes(timeseries: bool = False) -> list:
+    """
+    Returns the `TRIP_INDEXES` as they are built on a trips collection.
+
+    A time-series collection keeps the `META_FIELDS` in its meta field, so
+    their keys are indexed there. None of the indexes is unique, which
+    time-series collections do not support, and the other keys are the
+    time field or measurements, which they index from MongoDB 6.0.
+
+    Args:
+        timeseries (bool): Whether the trips are a time-series collection.
+
+    Returns:
+        list: The index models.
+    """
+    if not timeseries:
+        return TRIP_INDEXES
+    return [
+        IndexModel(
+            [
+                (meta_field(field), direction)
+                for field, direction in model.document["key"].items()
+            ],
+            name=model.document["name"],
+        )
+        for model in TRIP_INDEXES
+    ]
+
+
+class IndexManager:
+    """
+    Creates, lists and drops the `TRIP_INDEXES` of a trips collection.
+
+    Bulk loads are much faster without secondary indexes to maintain, so
+    `deferred` drops them for the duration of a load and builds them again
+    once all the data is in.
+    """
+
+    def __init__(self, collection: Collection) -> None:
+        self.collection = collection
+        self._models: Optional[list] = None
+
+    def models(self) -> list:
+        if self._models is None:
+            self._models = trip_indexes(is_timeseries(self.collection))
+        return self._models
+
+    def index_names(self) -> list:
+        return [index["name"] for index in self.collection.list_indexes()]
+
+    def missing_indexes(self) -> list:
+        existing = set(self.index_names())
+        return [
+            model for model in self.models() if model.document["name"] not in existing
+        ]
+
+    def build_indexes(self) -> list:
+        """
+        Creates any of `TRIP_INDEXES` that do not exist yet and drops the `RETIRED_INDEXES`.
+
+        Returns:
+            list: The names of the indexes that were created.
+        """
+        for name in set(RETIRED_INDEXES) & set(self.index_names()):
+            self.collection.drop_index(name)
+        missing = self.missing_indexes()
+        if not missing:
+            return []
+        return self.collection.create_indexes(missing)
+
+    def drop_secondary_indexes(self) -> list:
+        """
+        Drops the existing `TRIP_INDEXES`.
+
+        Other indexes, such as `_id` and the unique `ride_id` index that
+        upserts match on, are left alone.
+
+        Returns:
+            list: The names of the indexes that were dropped.
+        """
+        managed = {model.document["name"] for model in TRIP_INDEXES}
+        dropped = []
+        for name in self.index_names():
+            if name in managed:
+                self.collection.drop_index(name)
+                dropped.append(name)
+        return dropped
+
+    @contextmanager
+    def deferred(self) -> Iterator[None]:
+        """
+        Drops the managed indexes and builds them again when the block exits.
+
+        The indexes are rebuilt even if the load fails, so the dashboard is
+        never left scanning the whole collection.
+        """
+        dropped = self.drop_secondary_indexes()
+        if dropped:
+            print(f"Dropped indexes for bulk load: {', '.join(dropped)}")
+        try:
+            yield
+        finally:
+            built = self.build_indexes()
+            if built:
+                print(f"Built indexes: {', '.join(built)}")
@@ -0,0 +1,206 @@
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Optional, Tuple
+
+from pymongo.collection import Collection
+
+# Suffix of the collection that records the loads of a trips collection
+MANIFEST_SUFFIX = "_manifest"
+
+
+class LoadManifest:
+    """
+    Records which archives, CSV members and chunks have been loaded.
+
+    There is one document per CSV member, holding the number of CSV rows
+    whose batches have been committed, and one per archive once all of its
+    members are complete. A rerun skips complete archives and members and
+    resumes an interrupted member from its committed row offset.
+    """
+
+    def __init__(self, collection: Collection) -> None:
+        self.collection = collection
+
+    @staticmethod
+    def key(source: str, member: Optional[str] = None) -> str:
+        return f"{source}::{member}" if member else source
+
+    def get(self, source: str, member: Optional[str] = None) -> Optional[dict]:
+        return self.collection.find_one({"_id": self.key(source, member)})
+
+    def is_complete(self, source: str, member: Optional[str] = None) -> bool:
+        entry = self.get(source, member)
+        return bool(entry) and entry.get("status") == "complete"
+
+    def data_version(self) -> tuple:
+        """
+        Identifies the state of the loaded data for cache invalidation.
+
+        Every committed batch updates a record and forgetting a month
+        removes records, so either changes the version.
+
+        Returns:
+            tuple: The number of records and the latest `updated_at`.
+        """
+        latest = self.collection.find_one(
+            {}, {"updated_at": 1}, sort=[("updated_at", -1)]
+        )
+        return (
+            self.collection.estimated_document_count(),
+            latest.get("updated_at") if latest else None,
+        )
+
+    def resume_offset(self, source: str, member: str) -> Optional[int]:
+        """
+        Returns the CSV row offset a member should be loaded from.
+
+        Args:
+            source (str): The archive file name.
+            member (str): The CSV member name.
+
+        Returns:
+            int: The number of rows already committed, or None if the member is complete.
+        """
+        entry = self.get(source, member)
+        if not entry:
+            return 0
+        if entry.get("status") == "complete":
+            return None
+        return entry.get("offset", 0)
+
+    def is_interrupted(self, source: str) -> bool:
+        """
+        Tells whether a member of an archive was started and not completed.
+
+        Args:
+            source (str): The archive file name.
+
+        Returns:
+            bool: True if a previous load of the archive stopped part way.
+        """
+        entry = self.collection.find_one(
+            {"source": source, "member": {"$ne": None}, "status": "in_progress"},
+            {"_id": 1},
+        )
+        return entry is not None
+
+    def start(self, source: str, member: str, offset: int = 0) -> None:
+        self.collection.update_one(
+            {"_id": self.key(source, member)},
+            {
+                "$set": {
+                    "source": source,
+                    "member": member,
+                    "status": "in_progress",
+                    "offset": offset,
+                    "updated_at": datetime.now(timezone.utc),
+                },
+                "$setOnInsert": {"rows": 0},
+            },
+            upsert=True,
+        )
+
+    def commit(
+        self,
+        source: str,
+        member: str,
+        offset: int,
+        rows: int,
+        metrics: Optional[Counter] = None,
+        started_range: Optional[Tuple[datetime, datetime]] = None,
+    ) -> None:
+        """
+        Records that a batch has been written.
+
+        Args:
+            source (str): The archive file name.
+            member (str): The CSV member name.
+            offset (int): The number of CSV rows read once the batch is committed.
+            rows (int): The number of documents written for the batch.
+            metrics (Counter, optional): The batch's validation counts, added
+                to the member's `metrics` field.
+            started_range (tuple, optional): The earliest and latest `started_at`
+                of the batch, widening the member's `first_started_at` and
+                `last_started_at`.
+        """
+        increments = {"rows": rows}
+        for reason, count in (metrics or {}).items():
+            increments[f"metrics.{reason}"] = count
+        update = {
+            "$set": {"offset": offset, "updated_at": datetime.now(timezone.utc)},
+            "$inc": increments,
+        }
+        if started_range:
+            update["$min"] = {"first_started_at": started_range[0]}
+            update["$max"] = {"last_started_at": started_range[1]}
+        self.collection.update_one({"_id": self.key(source, member)}, update)
+
+    def started_range(self, source: str) -> tuple:
+        """
+        Returns the span of trip start times loaded from an archive.
+
+        Args:
+            source (str): The archive file name.
+
+        Returns:
+            tuple: The earliest and latest `started_at` over its members, or (None, None).
+        """
+        result = list(
+            self.collection.aggregate(
+                [
+                    {"$match": {"source": source, "member": {"$ne": None}}},
+                    {
+                        "$group": {
+                            "_id": None,
+                            "first": {"$min": "$first_started_at"},
+                            "last": {"$max": "$last_started_at"},
+                        }
+                    },
+                ]
+            )
+        )
+        if not result:
+            return None, None
+        return result[0]["first"], result[0]["last"]
+
+    def sources(self, source_pattern: str) -> list:
+        """
+        Lists the recorded archives whose names match a pattern.
+
+        Args:
+            source_pattern (str): A regular expression matched against the source names.
+
+        Returns:
+            list: The matching source names.
+        """
+        return self.collection.distinct(
+            "source", {"source": {"$regex": source_pattern}}
+        )
+
+    def forget(self, source_pattern: str) -> int:
+        """
+        Removes the records of matching archives so they are loaded again.
+
+        Args:
+            source_pattern (str): A regular expression matched against the source names.
+
+        Returns:
+            int: The number of records removed.
+        """
+        return self.collection.delete_many(
+            {"source": {"$regex": source_pattern}}
+        ).deleted_count
+
+    def complete(self, source: str, member: Optional[str] = None) -> None:
+        self.collection.update_one(
+            {"_id": self.key(source, member)},
+            {
+                "$set": {
+                    "source": source,
+                    "member": member,
+                    "status": "complete",
+                    "updated_at": datetime.now(timezone.utc),
+                }
+            },
+            upsert=True,
+        )
@@ -0,0 +1,282 @@
+from functools import reduce
+from operator import and_
+from typing import Optional
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from app.etl.arrow_reader import table_to_documents
+from app.etl.filters import FILTER_FIELDS, TripFilter
+from app.etl.frames import frame_from_documents, schema_of
+from app.etl.queries import DASHBOARD_METHODS, DashboardSnapshot, Queries
+from app.etl.reducer import REDUCE_BATCH_SIZE, StreamingReducer, reduce_blocks
+from app.etl.staging import ParquetStore
+
+
+def arrow_filter(trip_filter: Optional[TripFilter] = None) -> Optional[pc.Expression]:
+    """
+    Translates a trip filter into a dataset filter expression.
+
+    Args:
+        trip_filter (TripFilter, optional): The trips to read.
+
+    Returns:
+        pc.Expression: The expression, or None to read every trip.
+    """
+    if trip_filter is None:
+        return None
+    conditions = []
+    start, end = trip_filter.time_range()
+    if start:
+        conditions.append(pc.field("started_at") >= pa.scalar(start))
+    if end:
+        conditions.append(pc.field("started_at") < pa.scalar(end))
+    for name, field in FILTER_FIELDS.items():
+        values = getattr(trip_filter, name)
+        if values:
+            conditions.append(pc.field(field).isin(list(values)))
+    return reduce(and_, conditions) if conditions else None
+
+
+def batch_columns(batch: pa.RecordBatch, dtypes: dict) -> dict:
+    """
+    Converts the columns of a record batch into the NumPy arrays a reducer takes.
+
+    Args:
+        batch (pa.RecordBatch): The batch.
+        dtypes (dict): The NumPy dtype of each column to convert.
+
+    Returns:
+        dict: The arrays, keyed by column, with nulls as NaN or None.
+    """
+    return {
+        field: batch.column(field).to_numpy(zero_copy_only=False).astype(dtype)
+        for field, dtype in dtypes.items()
+    }
+
+
+class ParquetQueries:
+    """
+    Answers the dashboard queries from the Parquet store instead of MongoDB.
+
+    Each method mirrors the `Queries` method of the same name and returns
+    a list of documents with the same fields, so the dashboard views can
+    use either class. Only the columns a query needs are read, and groups
+    are aggregated with a `StreamingReducer` one record batch at a time,
+    so memory does not grow with the number of trips.
+    """
+
+    def __init__(self, store_root: str, year: Optional[int] = None) -> None:
+        self.store = ParquetStore(store_root)
+        self.dataset = self.store.dataset(year)
+
+    def _group(
+        self,
+        keys: list,
+        fields: list = (),
+        trip_filter: Optional[TripFilter] = None,
+        condition: Optional[pc.Expression] = None,
+        **options,
+    ) -> pd.DataFrame:
+        reducer = StreamingReducer(keys, fields, **options)
+        return self.reduce_trips(reducer, trip_filter, condition)
+
+    # Reduce matching trips one record batch at a time, see `StreamingReducer`
+    def reduce_trips(
+        self,
+        reducer: StreamingReducer,
+        trip_filter: Optional[TripFilter] = None,
+        condition: Optional[pc.Expression] = None,
+        batch_size: int = REDUCE_BATCH_SIZE,
+    ) -> pd.DataFrame:
+        trips = arrow_filter(trip_filter)
+        if condition is not None:
+            trips = condition if trips is None else condition & trips
+        # columns the reducer derives itself are not read
+        dtypes = {
+            field: dtype
+            for field, dtype in reducer.columns.items()
+            if field in self.dataset.schema.names
+        }
+        batches = self.dataset.to_batches(
+            columns=list(dtypes), filter=trips, batch_size=batch_size
+        )
+        reduce_blocks((batch_columns(batch, dtypes) for batch in batches), [reducer])
+        return reducer.result()
+
+    # Build a DataFrame with the columns `Queries` declares for the same method
+    def frame(self, name: str, *args, **kwargs) -> pd.DataFrame:
+        schema = schema_of(getattr(Queries, name), *args, **kwargs)
+        return frame_from_documents(getattr(self, name)(*args, **kwargs), schema)
+
+    # count total documents
+    def count_documents(self) -> int:
+        return self.dataset.count_rows()
+
+    # count total trips
+    def get_total_trips(self, trip_filter: Optional[TripFilter] = None) -> int:
+        return self.dataset.count_rows(filter=arrow_filter(trip_filter))
+
+    # Get trip data without any transformations
+    def get_raw_trip_data(self, trip_filter: Optional[TripFilter] = None) -> list:
+        table = self.dataset.to_table(
+            columns=[
+                "member_casual",
+                "rideable_type",
+                "started_at",
+                "ended_at",
+                "start_lat",
+                "start_lng",
+                "end_lat",
+                "end_lng",
+            ],
+            filter=arrow_filter(trip_filter),
+        )
+        return table_to_documents(table)
+
+    # get bike type count
+    def bike_count(self, trip_filter: Optional[TripFilter] = None) -> list:
+        groups = self._group(["rideable_type"], trip_filter=trip_filter)
+        return [
+            {"bike type": row["rideable_type"], "count": row["rows"]}
+            for row in groups.to_dict("records")
+        ]
+
+    # Average Trip Duration in seconds
+    def get_average_trip_duration(
+        self, trip_filter: Optional[TripFilter] = None
+    ) -> list:
+        groups = self._group([], ["duration_seconds"], trip_filter)
+        average = groups["duration_seconds_mean"]
+        return [
+            {
+                "_id": None,
+                "avg_duration": float(average[0]) if average.notna().any() else None,
+            }
+        ]
+
+    # Average Trip Duration by Bike Type in seconds
+    def get_average_trip_duration_by_bike(
+        self, trip_filter: Optional[TripFilter] = None
+    ) -> list:
+        groups = self._group(["rideable_type"], ["duration_seconds"], trip_filter)
+        return [
+            {"_id": row["rideable_type"], "avg_duration": row["duration_seconds_mean"]}
+            for row in groups.to_dict("records")
+        ]
+
+    # Count by User Type: Count the number of records for each 'usertype'.
+    def count_by_user_type(self, trip_filter: Optional[TripFilter] = None) -> list:
+        groups = self._group(["member_casual"], trip_filter=trip_filter)
+        return [
+            {"usertype": row["member_casual"], "count": row["rows"]}
+            for row in groups.to_dict("records")
+        ]
+
+    # Month-wise Trip Count: Count the number of trips made in each month.
+    def get_total_trips_per_month(
+        self, trip_filter: Optional[TripFilter] = None
+    ) -> list:
+        groups = self._group(["month"], trip_filter=trip_filter)
+        return [
+            {"month": row["month"], "total_trips": row["rows"]}
+            for row in groups.sort_values("month").to_dict("records")
+        ]
+
+    # Average Trip Duration by User Type in seconds
+    def get_average_trip_duration_by_user_type(
+        self, trip_filter: Optional[TripFilter] = None
+    ) -> list:
+        groups = self._group(["member_casual"], ["duration_seconds"], trip_filter)
+        return [
+            {
+                "member_type": row["member_casual"],
+                "average_duration": row["duration_seconds_mean"],
+            }
+            for row in groups.to_dict("records")
+        ]
+
+    # Most Popular Stations: Find the most popular start and end stations.
+    def most_popular_stations(self, trip_filter: Optional[TripFilter] = None) -> list:
+        stations = {}
+        for role in ("start", "end"):
+            column = f"{role}_station_name"
+            groups = self._group([column], trip_filter=trip_filter)
+            groups = groups.sort_values("rows", ascending=False, kind="stable")
+            stations[f"popular_{role}_stations"] = [
+                {f"{role} station name": row[column], "count": row["rows"]}
+                for row in groups.head(10).to_dict("records")
+            ]
+        return [stations]
+
+    # Get bikes used by members
+    def get_bikes_used_by_member(
+        self, trip_filter: Optional[TripFilter] = None
+    ) -> list:
+        groups = self._group(
+            ["rideable_type"],
+            trip_filter=trip_filter,
+            condition=pc.field("member_casual") == "member",
+        )
+        return [
+            {
+                "bike_type": row["rideable_type"],
+                "count": row["rows"],
+                "member_type": "member",
+            }
+            for row in groups.sort_values("rows", ascending=False).to_dict("records")
+        ]
+
+    # Peak Usage Hours
+    def get_peak_usage_hours(self, trip_filter: Optional[TripFilter] = None) -> list:
+        groups = self._group(["hour"], trip_filter=trip_filter)
+        return [
+            {"hour": row["hour"], "count": row["rows"]}
+            for row in groups.sort_values("rows", ascending=False).to_dict("records")
+        ]
+
+    # Peak Usage Hours by Day of Week
+    def get_peak_usage_hours_with_day(
+        self, trip_filter: Optional[TripFilter] = None
+    ) -> list:
+        groups = self._group(["hour", "day_of_week"], trip_filter=trip_filter)
+        return [
+            {
+                "hour": row["hour"],
+                "day": row["day_of_week"],
+                "count": row["rows"],
+            }
+            for row in groups.sort_values("hour", kind="stable").to_dict("records")
+        ]
+
+    # Average Speed in km/h, the mean of trip speeds, by user type or bike type
+    def get_average_speed(
+        self, group_by: str, trip_filter: Optional[TripFilter] = None
+    ) -> list:
+        groups = self._group(
+            [group_by],
+            ["speed"],
+            trip_filter,
+            condition=(pc.field("duration_seconds") > 0)
+            & pc.field("distance_km").is_valid(),
+            columns={"distance_km": float, "duration_seconds": float},
+            derive=lambda trips: {
+                "speed": trips["distance_km"] * 3600.0 / trips["duration_seconds"]
+            },
+        )
+        groups = groups.sort_values("speed_mean", ascending=False)
+        return [
+            {group_by: row[group_by], "speed": row["speed_mean"]}
+            for row in groups.to_dict("records")
+        ]
+
+    # Dashboard Snapshot: the charts of `Queries.dashboard_snapshot`, one dataset scan each
+    def dashboard_snapshot(
+        self, trip_filter: Optional[TripFilter] = None
+    ) -> DashboardSnapshot:
+        documents = {
+            name: getattr(self, name)(trip_filter) for name in DASHBOARD_METHODS
+        }
+        documents.update(self.most_popular_stations(trip_filter)[0])
+        return DashboardSnapshot.from_documents(documents)
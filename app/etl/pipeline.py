@@ -0,0 +1,347 @@
+import os
+import queue
+import threading
+import time
+import zipfile
+from collections import Counter, defaultdict, deque
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Future,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
+from contextlib import contextmanager
+from itertools import groupby
+from multiprocessing import get_context
+from operator import itemgetter
+from typing import Iterable, Iterator, Optional
+
+from app.etl.extract import ExtractTransformLoad
+
+# Parsed batches of an archive a parse worker may send ahead of the load stage
+QUEUED_BATCHES = 4
+
+
+class StageTimer:
+    """
+    Accumulates the busy time and item count of each pipeline stage.
+
+    Stage times are summed across workers, so a stage can report more busy
+    time than the wall time of the run when it has several workers.
+    """
+
+    def __init__(self) -> None:
+        self.seconds = defaultdict(float)
+        self.items = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def add(self, stage: str, seconds: float, items: int = 1) -> None:
+        with self._lock:
+            self.seconds[stage] += seconds
+            self.items[stage] += items
+
+    @contextmanager
+    def time(self, stage: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - start)
+
+    def summary(self, wall_seconds: float) -> str:
+        """
+        Formats the per-stage totals as a table.
+
+        Args:
+            wall_seconds (float): The wall time of the whole run.
+
+        Returns:
+            str: One line per stage with its busy time, items and share of wall time.
+        """
+        lines = [f"{'stage':<10}{'busy (s)':>12}{'items':>8}{'% wall':>9}"]
+        for stage, seconds in self.seconds.items():
+            share = 100 * seconds / wall_seconds if wall_seconds else 0.0
+            lines.append(
+                f"{stage:<10}{seconds:>12.2f}{self.items[stage]:>8}{share:>8.1f}%"
+            )
+        lines.append(f"{'wall':<10}{wall_seconds:>12.2f}")
+        return "\n".join(lines)
+
+
+def replay_batches(batches: Iterable, metrics: Counter) -> Iterator[list]:
+    """
+    Yields parsed batches, restoring the validation counts recorded with each.
+
+    Args:
+        batches (Iterable): (documents, metrics) pairs, with the metrics cumulative per member.
+        metrics (Counter): Set to the recorded counts before each batch is yielded.
+
+    Yields:
+        list: A batch of trips.
+    """
+    for documents, counts in batches:
+        metrics.clear()
+        metrics.update(counts)
+        yield documents
+
+
+def parse_archive(
+    zip_path: str,
+    offsets: dict,
+    batches,
+    batch_size: Optional[int] = None,
+    parse_backend: str = "pandas",
+) -> float:
+    """
+    Parses the CSV files of an archive inside a worker process, sending each batch as it is read.
+
+    Every member is announced with a (member, offset, None, None) message,
+    followed by a (member, offset, documents, counts) message per batch,
+    where the counts are the member's validation counts up to and
+    including the batch, and None ends the archive. The queue is bounded,
+    so the worker waits while the load stage is `QUEUED_BATCHES` batches
+    behind instead of holding the whole archive.
+
+    Args:
+        zip_path (str): The path to the zip archive.
+        offsets (dict): The CSV row offset to start each member to load at.
+        batches (Queue): The queue the messages are put on.
+        batch_size (int, optional): The number of rows per batch.
+        parse_backend (str): The CSV reader, "pandas" or "arrow".
+
+    Returns:
+        float: The seconds spent parsing, not counting waits on the queue.
+    """
+    seconds = 0.0
+    with zipfile.ZipFile(zip_path, "r") as zip_ref:
+        for member, offset in offsets.items():
+            batches.put((member, offset, None, None))
+            metrics = Counter()
+            reader = ExtractTransformLoad.read_member_batches(
+                zip_ref, member, batch_size, offset, parse_backend, metrics
+            )
+            while True:
+                start = time.perf_counter()
+                documents = next(reader, None)
+                seconds += time.perf_counter() - start
+                if documents is None:
+                    break
+                batches.put((member, offset, documents, metrics.copy()))
+    batches.put(None)
+    return seconds
+
+
+def receive_batches(batches, parse: Future, waits: Counter) -> Iterator[tuple]:
+    """
+    Yields the messages a parse worker puts on its queue, see `parse_archive`.
+
+    Args:
+        batches (Queue): The queue of the archive.
+        parse (Future): The parse task, whose error is raised once the
+            messages it sent before failing are consumed.
+        waits (Counter): Its "seconds" are increased by the time spent
+            waiting for the worker.
+
+    Yields:
+        tuple: The next (member, offset, documents, counts) message.
+    """
+    while True:
+        start = time.perf_counter()
+        try:
+            message = batches.get(timeout=1)
+        except queue.Empty:
+            if parse.done():
+                # the worker stopped without ending the archive
+                parse.result()
+                raise RuntimeError("the parse worker stopped early")
+            continue
+        finally:
+            waits["seconds"] += time.perf_counter() - start
+        if message is None:
+            return
+        yield message
+
+
+class IngestPipeline:
+    """
+    Runs the ETL stages concurrently across months.
+
+    Downloads run in a thread pool, CSV parsing in a process pool and
+    MongoDB writes in a second thread pool, so one month can be written
+    while later ones are downloading. Each month is written as it is
+    parsed: the parse worker sends its batches through a queue bounded to
+    `QUEUED_BATCHES`, so neither process holds a whole month and the
+    `batch_size` bound holds as it does without the pipeline. At most
+    `load_workers` months are parsed and written at a time, and downloaded
+    archives queue on disk until a slot frees up.
+
+    Parse workers are spawned rather than forked, so they never inherit the
+    threaded `MongoClient` of the main process.
+    """
+
+    def __init__(
+        self,
+        etl: ExtractTransformLoad,
+        download_workers: int = 4,
+        parse_workers: int = 2,
+        load_workers: int = 2,
+        batch_size: Optional[int] = None,
+        keep_downloads: bool = False,
+        upsert: bool = False,
+        parse_backend: str = "pandas",
+    ) -> None:
+        self.etl = etl
+        self.download_workers = download_workers
+        self.parse_workers = parse_workers
+        self.load_workers = load_workers
+        self.batch_size = batch_size
+        self.keep_downloads = keep_downloads
+        self.upsert = upsert
+        self.parse_backend = parse_backend
+        self.timer = StageTimer()
+        # refreshes of neighbouring archives can share a month
+        self._refresh_lock = threading.Lock()
+
+    def _download(self, url: str, path: str) -> Optional[str]:
+        with self.timer.time("download"):
+            return self.etl.extract_data(url, path)
+
+    def _resume_offsets(self, collection_name: str, zip_path: str) -> dict:
+        source = os.path.basename(zip_path)
+        manifest = self.etl.get_manifest(collection_name)
+        self.etl.prepare_resume(collection_name, source)
+        with zipfile.ZipFile(zip_path, "r") as zip_ref:
+            members = self.etl.csv_members(zip_ref)
+        offsets = {}
+        for member in members:
+            offset = manifest.resume_offset(source, member)
+            if offset is None:
+                print(f"{member} already loaded, skipping")
+            else:
+                offsets[member] = offset
+        return offsets
+
+    def _load(
+        self, collection_name: str, batches, parse: Future, zip_path: str
+    ) -> None:
+        source = os.path.basename(zip_path)
+        complete = True
+        waits = Counter()
+        messages = receive_batches(batches, parse, waits)
+        start = time.perf_counter()
+        try:
+            for member, member_messages in groupby(messages, key=itemgetter(0)):
+                _, offset, _, _ = next(member_messages)
+                metrics = Counter()
+                complete &= self.etl.load_member(
+                    collection_name,
+                    source,
+                    member,
+                    replay_batches(
+                        (
+                            (documents, counts)
+                            for _, _, documents, counts in member_messages
+                        ),
+                        metrics,
+                    ),
+                    self.batch_size,
+                    offset,
+                    self.upsert,
+                    metrics,
+                )
+        finally:
+            # the worker waits on a full queue, so let it run to the end
+            for _ in messages:
+                pass
+            # time spent waiting for batches belongs to the parse stage
+            self.timer.add("load", time.perf_counter() - start - waits["seconds"])
+        if complete:
+            self.etl.get_manifest(collection_name).complete(source)
+        with self.timer.time("rollups"), self._refresh_lock:
+            self.etl.refresh_rollups(collection_name, source)
+        if not self.keep_downloads and os.path.exists(zip_path):
+            os.remove(zip_path)
+
+    def run(self, base_url: str, year: int, path: str, collection_name: str) -> None:
+        """
+        Performs the ETL process for a year with the stages overlapped.
+
+        Archives and members the load manifest marks as complete are skipped.
+
+        Args:
+            base_url (str): The base URL for the data.
+            year (int): The year for which the data is to be ingested.
+            path (str): The path where the downloaded zip files are stored.
+            collection_name (str): The name of the collection in which the processed data will be stored.
+        """
+        wall_start = time.perf_counter()
+        urls = self.etl.generate_monthly_urls(base_url, year)
+        # share one downloader, and its connection pool, across download threads
+        self.etl.get_downloader(path)
+        manifest = self.etl.get_manifest(collection_name)
+        if self.upsert:
+            self.etl.prepare_upsert(collection_name)
+        pending_urls = []
+        for url in urls:
+            if manifest.is_complete(url.split("/")[-1]):
+                print(f"{url.split('/')[-1]} already loaded, skipping")
+            else:
+                pending_urls.append(url)
+
+        # months being parsed and written
+        parse_slots = threading.BoundedSemaphore(self.load_workers)
+        downloaded = deque()
+        context = get_context("spawn")
+        with context.Manager() as manager, ThreadPoolExecutor(
+            self.download_workers
+        ) as downloaders, ProcessPoolExecutor(
+            self.parse_workers, mp_context=context
+        ) as parsers, ThreadPoolExecutor(
+            self.load_workers
+        ) as loaders:
+            pending: dict[Future, tuple] = {
+                downloaders.submit(self._download, url, path): ("download", url)
+                for url in pending_urls
+            }
+            while pending or downloaded:
+                while downloaded and parse_slots.acquire(blocking=False):
+                    url, zip_path = downloaded.popleft()
+                    offsets = self._resume_offsets(collection_name, zip_path)
+                    batches = manager.Queue(QUEUED_BATCHES)
+                    parse = parsers.submit(
+                        parse_archive,
+                        zip_path,
+                        offsets,
+                        batches,
+                        self.batch_size,
+                        self.parse_backend,
+                    )
+                    pending[parse] = ("parse", url)
+                    zip_name = os.path.join(path, url.split("/")[-1])
+                    load = loaders.submit(
+                        self._load, collection_name, batches, parse, zip_name
+                    )
+                    pending[load] = ("load", url)
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    stage, url = pending.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        print(f"Error occurred in the {stage} stage for {url}: {e}")
+                        if stage == "load":
+                            parse_slots.release()
+                        continue
+
+                    if stage == "download":
+                        if not result:
+                            print(f"No csv file found in {url}")
+                            continue
+                        downloaded.append((url, result))
+                    elif stage == "parse":
+                        self.timer.add("parse", result)
+                    else:
+                        parse_slots.release()
+
+        print(self.timer.summary(time.perf_counter() - wall_start))
@@ -1,27 +1,289 @@
+from dataclasses import dataclass
+from typing import Optional
+
+import pandas as pd
+from app.etl.cache import cached, shared_cache
 from app.etl.extract import ExtractTransformLoad
+from app.etl.filters import TripFilter, and_match, match_stage
+from app.etl.frames import (
+    frame_from_batches,
+    frame_from_documents,
+    result_schema,
+    schema_of,
+)
+from app.etl.reducer import REDUCE_BATCH_SIZE, StreamingReducer
+from app.etl.rollups import USAGE_SUMS, Rollups
+from pymongo.collection import Collection
 from pymongo.cursor import Cursor
 
+# Columns of the trip-level query results
+RAW_TRIP_SCHEMA = {
+    "member_casual": "category",
+    "rideable_type": "category",
+    "started_at": "datetime",
+    "ended_at": "datetime",
+    "start_lat": "float",
+    "start_lng": "float",
+    "end_lat": "float",
+    "end_lng": "float",
+}
+TRIP_SCHEMA = {
+    "start_lat": "float",
+    "start_lng": "float",
+    "end_lat": "float",
+    "end_lng": "float",
+    "member_casual": "category",
+    "started_at": "datetime",
+    "ended_at": "datetime",
+    "start_station_name": "category",
+    "end_station_name": "category",
+}
+
+# Chart methods whose results `Queries.dashboard_snapshot` computes together
+DASHBOARD_METHODS = [
+    "bike_count",
+    "count_by_user_type",
+    "get_peak_usage_hours",
+    "get_peak_usage_hours_with_day",
+    "get_total_trips_per_month",
+    "get_average_trip_duration_by_user_type",
+]
+
+
+@dataclass(frozen=True)
+class DashboardSnapshot:
+    """
+    The dashboard overview charts, each with the columns of the method computing it alone.
+    """
+
+    bike_count: pd.DataFrame
+    count_by_user_type: pd.DataFrame
+    get_peak_usage_hours: pd.DataFrame
+    get_peak_usage_hours_with_day: pd.DataFrame
+    get_total_trips_per_month: pd.DataFrame
+    get_average_trip_duration_by_user_type: pd.DataFrame
+    popular_start_stations: pd.DataFrame
+    popular_end_stations: pd.DataFrame
+
+    @classmethod
+    def from_documents(cls, documents: dict) -> "DashboardSnapshot":
+        """
+        Decodes the result documents of each chart into its DataFrame.
+
+        Args:
+            documents (dict): The documents of each of `DASHBOARD_METHODS`,
+                plus `popular_start_stations` and `popular_end_stations`.
+
+        Returns:
+            DashboardSnapshot: The charts.
+        """
+        frames = {
+            name: frame_from_documents(
+                documents[name], schema_of(getattr(Queries, name))
+            )
+            for name in DASHBOARD_METHODS
+        }
+        for role in ("start", "end"):
+            frames[f"popular_{role}_stations"] = frame_from_documents(
+                documents[f"popular_{role}_stations"],
+                {f"{role} station name": "string", "count": "int"},
+            )
+        return cls(**frames)
+
+
+def usage_facets(sums: dict) -> dict:
+    """
+    Builds the usage pipelines the dashboard charts are drawn from.
+
+    Each pipeline groups the trips or the usage rollup with the `$sum`
+    accumulators `Queries.usage_source` returns, so one can run alone
+    after the source's leading `$match` or side by side in a `$facet`.
+
+    Args:
+        sums (dict): A `$sum` accumulator for each of `USAGE_SUMS`.
+
+    Returns:
+        dict: The stages of each pipeline, keyed by the `Queries` method running it.
+    """
+    return {
+        "bike_count": [
+            {"$group": {"_id": "$rideable_type", "count": sums["count"]}},
+            {"$project": {"bike type": "$_id", "_id": 0, "count": 1}},
+        ],
+        "count_by_user_type": [
+            {"$group": {"_id": "$member_casual", "count": sums["count"]}},
+            {"$project": {"usertype": "$_id", "_id": 0, "count": 1}},
+        ],
+        "get_total_trips_per_month": [
+            {"$group": {"_id": "$month", "total_trips": sums["count"]}},
+            {"$sort": {"_id": 1}},
+            {"$project": {"month": "$_id", "total_trips": 1, "_id": 0}},
+        ],
+        "get_average_trip_duration_by_user_type": [
+            {
+                "$group": {
+                    "_id": "$member_casual",
+                    "trips": sums["count"],
+                    "duration": sums["duration_sum"],
+                }
+            },
+            {
+                "$project": {
+                    "member_type": "$_id",
+                    "_id": 0,
+                    "average_duration": {"$divide": ["$duration", "$trips"]},
+                }
+            },
+        ],
+        "get_peak_usage_hours": [
+            {"$group": {"_id": "$hour", "count": sums["count"]}},
+            {"$sort": {"count": -1}},
+            {"$project": {"hour": "$_id", "count": 1, "_id": 0}},
+        ],
+        "get_peak_usage_hours_with_day": [
+            {
+                "$group": {
+                    "_id": {"hour": "$hour", "dayOfWeek": "$day_of_week"},
+                    "count": sums["count"],
+                }
+            },
+            {"$sort": {"_id.hour": 1}},
+            {
+                "$project": {
+                    "hour": "$_id.hour",
+                    "day": "$_id.dayOfWeek",
+                    "count": 1,
+                    "_id": 0,
+                }
+            },
+        ],
+    }
+
 
 class Queries(ExtractTransformLoad):
     def __init__(self, db_name: str, collection_name: str, **kwargs):
         super().__init__(db_name, collection_name, **kwargs)
+        self.rollups = Rollups(self.default_collection)
+        self.stations = self.get_station_dimension()
+        # results are shared by every instance on the same collection and
+        # dropped whenever the load manifest or the rollups record new data
+        self.cache = shared_cache(
+            f"{self.client_key}/{db_name}.{collection_name}", self.data_version
+        )
+
+    def usage_source(
+        self, trip_filter: Optional[TripFilter] = None
+    ) -> tuple[Collection, dict, list]:
+        """
+        Picks the collection to group trip counts, durations and speeds on.
+
+        The usage rollup is used once the ETL has built it and it can answer
+        the filter, otherwise the trips collection itself, so grouping
+        pipelines work on either.
+
+        Args:
+            trip_filter (TripFilter, optional): The trips to group.
+
+        Returns:
+            tuple: The collection, a `$sum` accumulator for each of
+            `USAGE_SUMS` and the stages selecting the filtered trips on it.
+        """
+        trip_filter = trip_filter or TripFilter()
+        match = trip_filter.usage_match()
+        if match is not None and self.rollups.is_built():
+            return (
+                self.rollups.usage,
+                {field: {"$sum": f"${field}"} for field in USAGE_SUMS},
+                match_stage(match),
+            )
+        return (
+            self.default_collection,
+            {field: {"$sum": value} for field, value in USAGE_SUMS.items()},
+            self._trip_stages(trip_filter),
+        )
+
+    # The leading `$match` selecting the filtered trips on the trips collection, and the `read_stages`
+    def _trip_stages(self, trip_filter: Optional[TripFilter] = None) -> list:
+        match = trip_filter.trip_match() if trip_filter is not None else {}
+        return self.trip_pipeline(match_stage(match))
+
+    # Stages replacing a station key in `field` by the station's name from the station dimension
+    def _station_names(self, field: str) -> list:
+        return [
+            {
+                "$lookup": {
+                    "from": self.stations.collection.name,
+                    "localField": field,
+                    "foreignField": "_id",
+                    "as": "station",
+                }
+            },
+            {
+                "$addFields": {
+                    field: {"$ifNull": [{"$arrayElemAt": ["$station.name", 0]}, None]}
+                }
+            },
+            {"$project": {"station": 0}},
+        ]
+
+    # Run a trips aggregation, as raw BSON batches for `frame_from_batches` if asked
+    def _aggregate(
+        self,
+        pipeline: list,
+        raw_batches: bool = False,
+        trip_filter: Optional[TripFilter] = None,
+    ):
+        match = trip_filter.trip_match() if trip_filter is not None else {}
+        if pipeline and "$match" in pipeline[0]:
+            match = and_match(match, pipeline[0]["$match"])
+            pipeline = pipeline[1:]
+        pipeline = self.trip_pipeline(match_stage(match) + pipeline)
+        if raw_batches:
+            return self.default_collection.aggregate_raw_batches(pipeline)
+        return self.default_collection.aggregate(pipeline)
+
+    # Decode the results of a query method into a DataFrame with its declared columns
+    def frame(self, name: str, *args, **kwargs) -> pd.DataFrame:
+        method = getattr(self, name)
+        schema = schema_of(method, *args, **kwargs)
+        if method.raw_batches:
+            return frame_from_batches(method(*args, raw_batches=True, **kwargs), schema)
+        return frame_from_documents(method(*args, **kwargs), schema)
 
     # count total documents
+    @cached
     def count_documents(self) -> int:
         return self.default_collection.count_documents({})
 
-    # count total trips
-    def get_total_trips(self) -> int:
-        return self.default_collection.count_documents({})
+    # count total trips, read from the collection stats the ETL maintains
+    @cached
+    def get_total_trips(self, trip_filter: Optional[TripFilter] = None) -> int:
+        if trip_filter is None or trip_filter.is_empty():
+            totals = self.rollups.stats.totals()
+            if totals:
+                return totals["trips"]
+            return self.default_collection.estimated_document_count()
+        collection, sums, match = self.usage_source(trip_filter)
+        results = list(
+            collection.aggregate(
+                match + [{"$group": {"_id": None, "trips": sums["count"]}}]
+            )
+        )
+        return results[0]["trips"] if results else 0
 
     # get unique start stations
+    @cached
     def get_unique_start_stations(self) -> list[str]:
         return self.default_collection.distinct("start station name")
 
-    # Get trip data without any transformations
-    def get_raw_trip_data(self) -> Cursor:
-        return self.default_collection.aggregate(
-            [
+    # Get trip data without any transformations, with coordinates from the station dimension
+    @result_schema(RAW_TRIP_SCHEMA, raw_batches=True)
+    def get_raw_trip_data(
+        self, trip_filter: Optional[TripFilter] = None, raw_batches: bool = False
+    ) -> Cursor:
+        return self._aggregate(
+            self.stations.lookup_stages()
+            + [
                 {
                     "$project": {
                         "_id": 0,
@@ -35,14 +297,35 @@ class Queries(ExtractTransformLoad):
                         "end_lng": 1,
                     }
                 }
-            ]
+            ],
+            raw_batches,
+            trip_filter,
+        )
+
+    # Reduce matching trips client-side in bounded memory, see `StreamingReducer`
+    def reduce_trips(
+        self,
+        reducer: StreamingReducer,
+        query: Optional[dict] = None,
+        batch_size: int = REDUCE_BATCH_SIZE,
+        trip_filter: Optional[TripFilter] = None,
+    ) -> pd.DataFrame:
+        projection = {"_id": 0, **{field: 1 for field in reducer.columns}}
+        cursor = self._aggregate(
+            match_stage(query or {}) + [{"$project": projection}],
+            trip_filter=trip_filter,
         )
+        return reducer.consume(cursor, batch_size).result()
 
     # Get 1000 random trips
-    def get_trip_data(self) -> Cursor:
-        return self.default_collection.aggregate(
-            [
-                {"$sample": {"size": 1000}},
+    @result_schema(TRIP_SCHEMA, raw_batches=True)
+    def get_trip_data(
+        self, trip_filter: Optional[TripFilter] = None, raw_batches: bool = False
+    ) -> Cursor:
+        return self._aggregate(
+            [{"$sample": {"size": 1000}}]
+            + self.stations.lookup_stages()
+            + [
                 {
                     "$project": {
                         "start_lat": 1,
@@ -56,196 +339,268 @@ class Queries(ExtractTransformLoad):
                         "end_station_name": 1,
                     }
                 },
-            ]
+            ],
+            raw_batches,
+            trip_filter,
         )
 
     # get bike type count
-    def bike_count(self) -> Cursor:
-        return self.default_collection.aggregate(
-            [
-                {"$group": {"_id": "$rideable_type", "count": {"$sum": 1}}},
-                {"$project": {"bike type": "$_id", "_id": 0, "count": 1}},
-            ]
-        )
+    @result_schema({"count": "int", "bike type": "string"})
+    @cached
+    def bike_count(self, trip_filter: Optional[TripFilter] = None) -> list:
+        collection, sums, match = self.usage_source(trip_filter)
+        return collection.aggregate(match + usage_facets(sums)["bike_count"])
 
-    # Average Trip Duration
-    def get_average_trip_duration(self) -> Cursor:
-        return self.default_collection.aggregate(
-            [
-                {
-                    "$addFields": {
-                        "converted_starttime": {"$toDate": "$started_at"},
-                        "converted_stoptime": {"$toDate": "$ended_at"},
-                    }
-                },
+    # Average Trip Duration in seconds
+    @result_schema({"avg_duration": "float"})
+    @cached
+    def get_average_trip_duration(
+        self, trip_filter: Optional[TripFilter] = None
+    ) -> list:
+        totals = self.rollups.stats.totals()
+        if totals and (trip_filter is None or trip_filter.is_empty()):
+            average = totals["duration_sum"] / totals["trips"] if totals["trips"] else 0
+            return [{"_id": None, "avg_duration": average}]
+        collection, sums, match = self.usage_source(trip_filter)
+        return collection.aggregate(
+            match
+            + [
                 {
                     "$group": {
                         "_id": None,
-                        "avg_duration": {
-                            "$avg": {
-                                "$subtract": [
-                                    "$converted_stoptime",
-                                    "$converted_starttime",
-                                ]
-                            }
-                        },
+                        "trips": sums["count"],
+                        "duration": sums["duration_sum"],
                     }
                 },
+                {"$project": {"avg_duration": {"$divide": ["$duration", "$trips"]}}},
             ]
         )
 
-    # Average Trip Duration by Bike ID
-    def get_average_trip_duration_by_bike(self) -> Cursor:
-        return self.default_collection.aggregate(
-            [
-                {
-                    "$addFields": {
-                        "converted_starttime": {"$toDate": "$started_at"},
-                        "converted_stoptime": {"$toDate": "$ended_at"},
-                    }
-                },
+    # Average Trip Duration by Bike Type in seconds
+    @result_schema({"_id": "string", "avg_duration": "float"})
+    @cached
+    def get_average_trip_duration_by_bike(
+        self, trip_filter: Optional[TripFilter] = None
+    ) -> list:
+        collection, sums, match = self.usage_source(trip_filter)
+        return collection.aggregate(
+            match
+            + [
                 {
                     "$group": {
                         "_id": "$rideable_type",
-                        "avg_duration": {
-                            "$avg": {
-                                "$subtract": [
-                                    "$converted_stoptime",
-                                    "$converted_starttime",
-                                ]
-                            }
-                        },
+                        "trips": sums["count"],
+                        "duration": sums["duration_sum"],
                     }
                 },
+                {"$project": {"avg_duration": {"$divide": ["$duration", "$trips"]}}},
             ]
         )
 
     # Filter by User Type: Find all records where 'usertype' is 'Subscriber'.
-    def filter_by_user_type(self) -> Cursor:
-        return self.default_collection.find(
-            {"member_casual": "member"},
-            {"member_casual": 1, "rideable_type": 1, "_id": 0},
+    @result_schema(
+        {"member_casual": "category", "rideable_type": "category"}, raw_batches=True
+    )
+    def filter_by_user_type(
+        self, trip_filter: Optional[TripFilter] = None, raw_batches: bool = False
+    ) -> Cursor:
+        return self._aggregate(
+            [
+                {"$match": {"member_casual": "member"}},
+                {"$project": {"member_casual": 1, "rideable_type": 1, "_id": 0}},
+            ],
+            raw_batches,
+            trip_filter,
         )
 
     # Count by User Type: Count the number of records for each 'usertype'.
-    def count_by_user_type(self) -> Cursor:
-        return self.default_collection.aggregate(
-            [
-                {"$group": {"_id": "$member_casual", "count": {"$sum": 1}}},
-                {"$project": {"usertype": "$_id", "_id": 0, "count": 1}},
-            ]
-        )
+    @result_schema({"count": "int", "usertype": "string"})
+    @cached
+    def count_by_user_type(self, trip_filter: Optional[TripFilter] = None) -> list:
+        collection, sums, match = self.usage_source(trip_filter)
+        return collection.aggregate(match + usage_facets(sums)["count_by_user_type"])
 
     # Group by Start Station: Count the number of trips that started from each 'start station name'.
-    def group_by_start_station(self) -> Cursor:
+    @result_schema({"_id": "string", "count": "int"})
+    @cached
+    def group_by_start_station(self, trip_filter: Optional[TripFilter] = None) -> list:
+        match = (trip_filter or TripFilter()).station_match()
+        if match is not None and self.rollups.is_built():
+            return self.rollups.stations.aggregate(
+                [
+                    {"$match": and_match(match, {"start_count": {"$gt": 0}})},
+                    {
+                        "$group": {
+                            "_id": "$station_key",
+                            "count": {"$sum": "$start_count"},
+                        }
+                    },
+                ]
+                + self._station_names("_id")
+            )
+        trips = self._trip_stages(trip_filter)
+        if self.stations.is_built():
+            return self.default_collection.aggregate(
+                trips
+                + [{"$group": {"_id": "$start_station_key", "count": {"$sum": 1}}}]
+                + self._station_names("_id")
+            )
         return self.default_collection.aggregate(
-            [{"$group": {"_id": "$start_station_name", "count": {"$sum": 1}}}]
+            trips + [{"$group": {"_id": "$start_station_name", "count": {"$sum": 1}}}]
         )
 
     # Start and Stop Station Same: Find records where the start and end stations are the same.
-    def find_same_start_end_stations(self) -> Cursor:
-        return self.default_collection.find(
-            {"$expr": {"$eq": ["$start_station_name", "$end_station_name"]}},
-            {
-                "_id": 0,
-                "start_station_name": 1,
-                "end_station_name": 1,
-            },
+    @result_schema(
+        {"start_station_name": "category", "end_station_name": "category"},
+        raw_batches=True,
+    )
+    def find_same_start_end_stations(
+        self, trip_filter: Optional[TripFilter] = None, raw_batches: bool = False
+    ) -> Cursor:
+        if self.stations.is_built():
+            fields = ["start_station_key", "end_station_key"]
+        else:
+            fields = ["start_station_name", "end_station_name"]
+        # `$expr` follows the `read_stages`, which set meta fields back on time-series trips
+        return self._aggregate(
+            [
+                {"$match": {fields[0]: {"$ne": None}}},
+                {"$match": {"$expr": {"$eq": [f"${field}" for field in fields]}}},
+            ]
+            + self.stations.lookup_stages()
+            + [
+                {
+                    "$project": {
+                        "_id": 0,
+                        "start_station_name": 1,
+                        "end_station_name": 1,
+                    }
+                }
+            ],
+            raw_batches,
+            trip_filter,
         )
 
     # Month-wise Trip Count: Count the number of trips made in each month.
-    def get_total_trips_per_month(self) -> Cursor:
-        return self.default_collection.aggregate(
-            [
-                {"$addFields": {"converted_starttime": {"$toDate": "$started_at"}}},
-                {"$addFields": {"month": {"$month": "$converted_starttime"}}},
-                {"$group": {"_id": "$month", "total_trips": {"$sum": 1}}},
-                {"$sort": {"_id": 1}},
-                {"$project": {"month": "$_id", "total_trips": 1, "_id": 0}},
-            ]
+    @result_schema({"month": "int", "total_trips": "int"})
+    @cached
+    def get_total_trips_per_month(
+        self, trip_filter: Optional[TripFilter] = None
+    ) -> list:
+        collection, sums, match = self.usage_source(trip_filter)
+        return collection.aggregate(
+            match + usage_facets(sums)["get_total_trips_per_month"]
         )
 
-    # Average Trip Duration by User Type
-    def get_average_trip_duration_by_user_type(self) -> Cursor:
-        return self.default_collection.aggregate(
-            [
-                {
-                    "$addFields": {
-                        "converted_starttime": {"$toDate": "$started_at"},
-                        "converted_stoptime": {"$toDate": "$ended_at"},
+    # Average Trip Duration by User Type in seconds
+    @result_schema({"member_type": "string", "average_duration": "float"})
+    @cached
+    def get_average_trip_duration_by_user_type(
+        self, trip_filter: Optional[TripFilter] = None
+    ) -> list:
+        collection, sums, match = self.usage_source(trip_filter)
+        return collection.aggregate(
+            match + usage_facets(sums)["get_average_trip_duration_by_user_type"]
+        )
+
+    # Source, leading stages and `$facet` of the most popular stations of both roles
+    def _popular_stations_query(
+        self, trip_filter: Optional[TripFilter] = None
+    ) -> tuple[Collection, list, dict]:
+        match = (trip_filter or TripFilter()).station_match()
+        from_rollup = match is not None and self.rollups.is_built()
+        collection = self.rollups.stations if from_rollup else self.default_collection
+        leading = match_stage(match) if from_rollup else self._trip_stages(trip_filter)
+        # the station rollup always counts station keys
+        keyed = from_rollup or self.stations.is_built()
+
+        def popular(role: str) -> list:
+            if from_rollup:
+                group = [
+                    {
+                        "$group": {
+                            "_id": "$station_key",
+                            "count": {"$sum": f"${role}_count"},
+                        }
                     }
-                },
-                {
-                    "$group": {
-                        "_id": "$member_casual",
-                        "average_duration": {
-                            "$avg": {
-                                "$subtract": [
-                                    "$converted_stoptime",
-                                    "$converted_starttime",
-                                ]
-                            }
-                        },
+                ]
+            elif keyed:
+                group = [
+                    {"$match": {f"{role}_station_key": {"$ne": None}}},
+                    {
+                        "$group": {
+                            "_id": f"${role}_station_key",
+                            "count": {"$sum": 1},
+                        }
+                    },
+                ]
+            else:
+                group = [
+                    {"$match": {f"{role}_station_name": {"$ne": None}}},
+                    {
+                        "$group": {
+                            "_id": f"${role}_station_name",
+                            "count": {"$sum": 1},
+                        }
+                    },
+                ]
+            top = [{"$sort": {"count": -1}}, {"$limit": 10}]
+            if keyed:
+                top += self._station_names("_id")
+            return (
+                group
+                + top
+                + [
+                    {
+                        "$project": {
+                            f"{role} station name": "$_id",
+                            "count": 1,
+                            "_id": 0,
+                        }
                     }
-                },
-                {"$project": {"member_type": "$_id", "_id": 0, "average_duration": 1}},
-            ]
+                ]
+            )
+
+        return (
+            collection,
+            leading,
+            {
+                "popular_start_stations": popular("start"),
+                "popular_end_stations": popular("end"),
+            },
         )
 
     # Most Popular Stations: Find the most popular start and end stations.
-    def most_popular_stations(self) -> Cursor:
-        return self.default_collection.aggregate(
-            [
-                {
-                    "$facet": {
-                        "popular_start_stations": [
-                            {
-                                "$group": {
-                                    "_id": "$start_station_name",
-                                    "count": {"$sum": 1},
-                                }
-                            },
-                            {"$sort": {"count": -1}},
-                            {"$limit": 10},
-                            {
-                                "$project": {
-                                    "start station name": "$_id",
-                                    "count": 1,
-                                    "_id": 0,
-                                }
-                            },
-                        ],
-                        "popular_end_stations": [
-                            {
-                                "$group": {
-                                    "_id": "$end_station_name",
-                                    "count": {"$sum": 1},
-                                }
-                            },
-                            {"$sort": {"count": -1}},
-                            {"$limit": 10},
-                            {
-                                "$project": {
-                                    "end station name": "$_id",
-                                    "count": 1,
-                                    "_id": 0,
-                                }
-                            },
-                        ],
-                    }
-                }
-            ]
-        )
+    @cached
+    def most_popular_stations(self, trip_filter: Optional[TripFilter] = None) -> list:
+        collection, leading, facets = self._popular_stations_query(trip_filter)
+        return collection.aggregate(leading + [{"$facet": facets}])
 
     # Get bikes used by members
-    def get_bikes_used_by_member(self) -> Cursor:
-        return self.default_collection.aggregate(
-            [
-                {"$match": {"member_casual": "member"}},
+    @result_schema({"count": "int", "member_type": "string", "bike_type": "string"})
+    @cached
+    def get_bikes_used_by_member(
+        self, trip_filter: Optional[TripFilter] = None
+    ) -> list:
+        collection, sums, match = self.usage_source(trip_filter)
+        member = {"member_casual": "member"}
+        if collection is self.default_collection:
+            leading = self.trip_pipeline(
+                match_stage(
+                    and_match((trip_filter or TripFilter()).trip_match(), member)
+                )
+            )
+        else:
+            leading = match_stage(
+                and_match(match[0]["$match"] if match else {}, member)
+            )
+        return collection.aggregate(
+            leading
+            + [
                 {
                     "$group": {
                         "_id": "$rideable_type",
-                        "count": {"$sum": 1},
+                        "count": sums["count"],
                         "member_type": {"$first": "$member_casual"},
                     }
                 },
@@ -262,40 +617,98 @@ class Queries(ExtractTransformLoad):
         )
 
     # Peak Usage Hours
-    def get_peak_usage_hours(self) -> Cursor:
-        return self.default_collection.aggregate(
-            [
-                {"$addFields": {"hour": {"$hour": {"$toDate": "$started_at"}}}},
-                {"$group": {"_id": "$hour", "count": {"$sum": 1}}},
-                {"$sort": {"count": -1}},
-                {"$project": {"hour": "$_id", "count": 1, "_id": 0}},
-            ]
-        )
+    @result_schema({"hour": "int", "count": "int"})
+    @cached
+    def get_peak_usage_hours(self, trip_filter: Optional[TripFilter] = None) -> list:
+        collection, sums, match = self.usage_source(trip_filter)
+        return collection.aggregate(match + usage_facets(sums)["get_peak_usage_hours"])
 
     # Peak Usage Hours by Day of Week
-    def get_peak_usage_hours_with_day(self) -> Cursor:
-        return self.default_collection.aggregate(
-            [
-                {
-                    "$project": {
-                        "hour_started": {"$hour": "$started_at"},
-                        "day_of_week": {"$dayOfWeek": "$started_at"},
-                    }
-                },
+    @result_schema({"hour": "int", "day": "int", "count": "int"})
+    @cached
+    def get_peak_usage_hours_with_day(
+        self, trip_filter: Optional[TripFilter] = None
+    ) -> list:
+        collection, sums, match = self.usage_source(trip_filter)
+        return collection.aggregate(
+            match + usage_facets(sums)["get_peak_usage_hours_with_day"]
+        )
+
+    # Average Speed in km/h, the mean of trip speeds, by user type or bike type
+    @result_schema(
+        lambda group_by, trip_filter=None: {group_by: "string", "speed": "float"}
+    )
+    @cached
+    def get_average_speed(
+        self, group_by: str, trip_filter: Optional[TripFilter] = None
+    ) -> list:
+        collection, sums, match = self.usage_source(trip_filter)
+        return collection.aggregate(
+            match
+            + [
                 {
                     "$group": {
-                        "_id": {"hour": "$hour_started", "dayOfWeek": "$day_of_week"},
-                        "count": {"$sum": 1},
+                        "_id": f"${group_by}",
+                        "speed_sum": sums["speed_sum"],
+                        "speed_trips": sums["speed_trips"],
                     }
                 },
-                {"$sort": {"_id.hour": 1}},
+                {"$match": {"speed_trips": {"$gt": 0}}},
                 {
                     "$project": {
-                        "hour": "$_id.hour",
-                        "day": "$_id.dayOfWeek",
-                        "count": 1,
+                        group_by: "$_id",
                         "_id": 0,
+                        "speed": {"$divide": ["$speed_sum", "$speed_trips"]},
                     }
                 },
+                {"$sort": {"speed": -1}},
             ]
         )
+
+    # Dashboard Snapshot: the usage charts and popular stations in one `$facet` per source
+    @cached
+    def _dashboard_documents(self, trip_filter: Optional[TripFilter] = None) -> list:
+        collection, sums, match = self.usage_source(trip_filter)
+        facets = usage_facets(sums)
+        stations, leading, station_facets = self._popular_stations_query(trip_filter)
+        results = {}
+        if stations is collection:
+            # both read the trips, so a single scan feeds every facet
+            facets.update(station_facets)
+        else:
+            results.update(
+                next(stations.aggregate(leading + [{"$facet": station_facets}]))
+            )
+        results.update(next(collection.aggregate(match + [{"$facet": facets}])))
+        # answer the separate chart methods from the same results
+        for name in DASHBOARD_METHODS:
+            self.cache.put(getattr(self, name).cache_key(trip_filter), results[name])
+        self.cache.put(
+            self.most_popular_stations.cache_key(trip_filter),
+            [{name: results[name] for name in station_facets}],
+        )
+        return [results]
+
+    def dashboard_snapshot(
+        self, trip_filter: Optional[TripFilter] = None
+    ) -> DashboardSnapshot:
+        """
+        Computes every chart of the dashboard overview in one aggregation.
+
+        The usage charts are `$facet`s of one pass over the usage rollup, or
+        over the trips before it is built or when it cannot answer the
+        filter. The popular stations come from the station rollup in a
+        second, small aggregation, or join the same `$facet` when they are
+        read from the trips too. The results are also stored in the query
+        cache under the methods that compute each chart on its own, so a
+        snapshot warms every page it covers.
+
+        Args:
+            trip_filter (TripFilter, optional): The trips to summarize.
+
+        Returns:
+            DashboardSnapshot: One DataFrame per chart.
+        """
+        return DashboardSnapshot.from_documents(
+            self._dashboard_documents(trip_filter)[0]
+        )
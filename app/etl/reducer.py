@@ -0,0 +1,273 @@
+from itertools import islice
+from typing import Callable, Iterable, Iterator, Optional
+
+import numpy as np
+import pandas as pd
+
+# Documents pulled from a cursor and decoded per block
+REDUCE_BATCH_SIZE = 50_000
+
+
+def iter_batches(
+    cursor: Iterable, batch_size: int = REDUCE_BATCH_SIZE
+) -> Iterator[list]:
+    """
+    Pulls documents from a cursor in lists of at most `batch_size`.
+
+    Args:
+        cursor (Iterable): A pymongo cursor, or any iterable of documents.
+        batch_size (int): The number of documents per list.
+
+    Yields:
+        list: The next documents.
+    """
+    if hasattr(cursor, "batch_size"):
+        # fetch as many documents per round trip as are decoded per block
+        cursor.batch_size(batch_size)
+    iterator = iter(cursor)
+    while True:
+        batch = list(islice(iterator, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+def to_columns(documents: list, dtypes: dict) -> dict:
+    """
+    Decodes a batch of documents into one NumPy array per field.
+
+    Missing values become NaN for floats, NaT for datetimes and None for
+    objects.
+
+    Args:
+        documents (list): The documents of the batch.
+        dtypes (dict): The NumPy dtype of each field to decode.
+
+    Returns:
+        dict: The arrays, keyed by field.
+    """
+    return {
+        field: np.array([document.get(field) for document in documents], dtype=dtype)
+        for field, dtype in dtypes.items()
+    }
+
+
+class StreamingReducer:
+    """
+    Running per-group aggregates over columnar blocks of documents.
+
+    Each block updates the row count of every group and the sum, count of
+    non-missing values and, where bins are given, the histogram of every
+    value field. Only the aggregates are kept between blocks, so memory is
+    bounded by one block plus the number of groups, however many rows are
+    reduced.
+
+    Args:
+        group_by (list): The fields to group on, none for a single total.
+        fields (list): The numeric fields to aggregate.
+        histograms (dict, optional): Bin edges per field to count values into.
+        columns (dict, optional): The dtype of each field to decode; group
+            fields default to objects and value fields to floats.
+        derive (Callable, optional): Computes extra columns from a decoded
+            block, such as a date from a timestamp, before it is reduced.
+    """
+
+    def __init__(
+        self,
+        group_by: list,
+        fields: Iterable = (),
+        histograms: Optional[dict] = None,
+        columns: Optional[dict] = None,
+        derive: Optional[Callable[[dict], dict]] = None,
+    ) -> None:
+        self.group_by = list(group_by)
+        self.fields = list(fields)
+        self.histograms = {
+            field: np.asarray(edges, dtype=float)
+            for field, edges in (histograms or {}).items()
+        }
+        self.columns = {field: object for field in self.group_by}
+        self.columns.update({field: float for field in self.fields})
+        self.columns.update({field: float for field in self.histograms})
+        self.columns.update(columns or {})
+        self.derive = derive
+
+        self._index: dict = {}
+        self.keys: list = []
+        self.rows = np.zeros(0, dtype=np.int64)
+        self.sums = {field: np.zeros(0) for field in self.fields}
+        self.counts = {field: np.zeros(0, dtype=np.int64) for field in self.fields}
+        self.hists = {
+            field: np.zeros((0, len(edges) - 1), dtype=np.int64)
+            for field, edges in self.histograms.items()
+        }
+
+    def _group_codes(self, columns: dict, rows: int) -> np.ndarray:
+        """
+        Maps every row of a block to the index of its group, adding new groups.
+        """
+        codes = np.zeros(rows, dtype=np.int64)
+        uniques = []
+        for field in self.group_by:
+            field_codes, field_uniques = pd.factorize(
+                columns[field], use_na_sentinel=False
+            )
+            codes = codes * len(field_uniques) + field_codes
+            uniques.append(field_uniques)
+        codes, combined = pd.factorize(codes)
+
+        local_to_global = np.empty(len(combined), dtype=np.int64)
+        for local, value in enumerate(combined):
+            key = []
+            for field_uniques in reversed(uniques):
+                value, position = divmod(value, len(field_uniques))
+                part = field_uniques[position]
+                # NaN never equals itself, so missing keys share one None group
+                key.append(None if pd.isna(part) else part)
+            key = tuple(reversed(key))
+            if key not in self._index:
+                self._index[key] = len(self.keys)
+                self.keys.append(key)
+            local_to_global[local] = self._index[key]
+        self._grow(len(self.keys))
+        return local_to_global[codes]
+
+    def _grow(self, groups: int) -> None:
+        extra = groups - len(self.rows)
+        if extra <= 0:
+            return
+        self.rows = np.concatenate([self.rows, np.zeros(extra, dtype=np.int64)])
+        for field in self.fields:
+            self.sums[field] = np.concatenate([self.sums[field], np.zeros(extra)])
+            self.counts[field] = np.concatenate(
+                [self.counts[field], np.zeros(extra, dtype=np.int64)]
+            )
+        for field, hist in self.hists.items():
+            self.hists[field] = np.vstack(
+                [hist, np.zeros((extra, hist.shape[1]), dtype=np.int64)]
+            )
+
+    def update(self, columns: dict) -> None:
+        """
+        Adds a decoded block to the aggregates.
+
+        Args:
+            columns (dict): Equal-length arrays keyed by field, see `to_columns`.
+        """
+        if self.derive:
+            columns = {**columns, **self.derive(columns)}
+        rows = len(next(iter(columns.values()))) if columns else 0
+        if not rows:
+            return
+        codes = self._group_codes(columns, rows)
+        groups = len(self.keys)
+        self.rows += np.bincount(codes, minlength=groups)
+        for field in self.fields:
+            values = columns[field]
+            valid = ~np.isnan(values)
+            self.sums[field] += np.bincount(
+                codes[valid], weights=values[valid], minlength=groups
+            )
+            self.counts[field] += np.bincount(codes[valid], minlength=groups)
+        for field, edges in self.histograms.items():
+            bins = len(edges) - 1
+            positions = np.searchsorted(edges, columns[field], side="right") - 1
+            # the last edge closes the last bin, as in `np.histogram`
+            positions[columns[field] == edges[-1]] = bins - 1
+            inside = (positions >= 0) & (positions < bins)
+            self.hists[field] += np.bincount(
+                codes[inside] * bins + positions[inside], minlength=groups * bins
+            ).reshape(groups, bins)
+
+    def consume(
+        self, cursor: Iterable, batch_size: int = REDUCE_BATCH_SIZE
+    ) -> "StreamingReducer":
+        """
+        Reduces every document of a cursor, one block at a time.
+
+        Args:
+            cursor (Iterable): The documents to reduce.
+            batch_size (int): The number of documents per block.
+
+        Returns:
+            StreamingReducer: The reducer itself, to chain `result()`.
+        """
+        return reduce_cursor(cursor, [self], batch_size)[0]
+
+    def result(self) -> pd.DataFrame:
+        """
+        Returns the aggregates as one row per group.
+
+        Returns:
+            pd.DataFrame: The group fields, `rows`, and for each value field
+            `<field>_sum`, `<field>_count` and `<field>_mean`, plus a
+            `<field>_hist` list of bin counts per histogram.
+        """
+        data = {
+            field: [key[position] for key in self.keys]
+            for position, field in enumerate(self.group_by)
+        }
+        data["rows"] = self.rows
+        for field in self.fields:
+            data[f"{field}_sum"] = self.sums[field]
+            data[f"{field}_count"] = self.counts[field]
+            with np.errstate(invalid="ignore", divide="ignore"):
+                data[f"{field}_mean"] = self.sums[field] / self.counts[field]
+        for field, hist in self.hists.items():
+            data[f"{field}_hist"] = list(hist)
+        return pd.DataFrame(data)
+
+
+def reduce_cursor(
+    cursor: Iterable, reducers: list, batch_size: int = REDUCE_BATCH_SIZE
+) -> list:
+    """
+    Feeds one pass over a cursor to several reducers.
+
+    Each batch is decoded once into the union of the columns the reducers
+    need.
+
+    Args:
+        cursor (Iterable): The documents to reduce.
+        reducers (list): The `StreamingReducer`s to update.
+        batch_size (int): The number of documents per block.
+
+    Returns:
+        list: The same reducers.
+    """
+    dtypes = reducer_columns(reducers)
+    return reduce_blocks(
+        (
+            to_columns(documents, dtypes)
+            for documents in iter_batches(cursor, batch_size)
+        ),
+        reducers,
+    )
+
+
+def reducer_columns(reducers: list) -> dict:
+    """
+    Returns the union of the columns several reducers decode, with their dtypes.
+    """
+    dtypes = {}
+    for reducer in reducers:
+        dtypes.update(reducer.columns)
+    return dtypes
+
+
+def reduce_blocks(blocks: Iterable, reducers: list) -> list:
+    """
+    Feeds already decoded blocks, such as Arrow record batches, to several reducers.
+
+    Args:
+        blocks (Iterable): Dicts of equal-length arrays keyed by field, each
+            holding at least the columns of every reducer.
+        reducers (list): The `StreamingReducer`s to update.
+
+    Returns:
+        list: The same reducers.
+    """
+    for columns in blocks:
+        for reducer in reducers:
+            reducer.update(columns)
+    return reducers
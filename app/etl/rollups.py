@@ -0,0 +1,248 @@
+from datetime import datetime
+from typing import Optional
+
+from bson import ObjectId
+from pymongo.collection import Collection
+
+from app.etl.dimensions import Dimensions
+from app.etl.stats import CollectionStats
+from app.etl.timeseries import is_timeseries, meta_stage
+
+# Suffixes of the rollup collections kept next to a trips collection
+USAGE_ROLLUP_SUFFIX = "_usage_rollup"
+STATION_ROLLUP_SUFFIX = "_station_rollup"
+
+# Dimensions of the usage rollup, one document per combination and period
+USAGE_DIMENSIONS = ["month", "day_of_week", "hour", "member_casual", "rideable_type"]
+
+# Sums kept by the usage rollup and the per-trip value each one adds up.
+# Speeds are summed per trip, in km/h, so the rollup gives the mean of trip
+# speeds; trips without a distance or with no duration are left out of it.
+HAS_SPEED = {
+    "$and": [
+        {"$gt": ["$duration_seconds", 0]},
+        {"$gte": ["$distance_km", 0]},
+    ]
+}
+USAGE_SUMS = {
+    "count": 1,
+    "duration_sum": "$duration_seconds",
+    "speed_sum": {
+        "$cond": [
+            HAS_SPEED,
+            {
+                "$divide": [
+                    {"$multiply": ["$distance_km", 3600]},
+                    "$duration_seconds",
+                ]
+            },
+            0,
+        ]
+    },
+    "speed_trips": {"$cond": [HAS_SPEED, 1, 0]},
+}
+
+# Rollup documents are partial aggregates per calendar month of `started_at`,
+# so one month's contribution can be replaced without touching the others
+PERIOD = {"$dateToString": {"format": "%Y-%m", "date": "$started_at"}}
+
+
+def period_name(year: int, month: int) -> str:
+    return f"{year}-{month:02d}"
+
+
+def months_between(first: datetime, last: datetime) -> list:
+    """
+    Lists the calendar months from the one containing `first` to the one containing `last`.
+
+    Args:
+        first (datetime): The earliest time.
+        last (datetime): The latest time.
+
+    Returns:
+        list: (year, month) pairs in order.
+    """
+    months = []
+    year, month = first.year, first.month
+    while (year, month) <= (last.year, last.month):
+        months.append((year, month))
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return months
+
+
+def usage_pipeline() -> list:
+    """
+    Groups trips into the usage rollup.
+
+    Each document is keyed on its period and `USAGE_DIMENSIONS` in `_id`
+    and repeats them as top-level fields, so a `$group` written for trips
+    can run on the rollup by summing the `USAGE_SUMS` fields, such as
+    `{"$sum": "$count"}` in place of `{"$sum": 1}`.
+
+    Returns:
+        list: The aggregation stages, without an output stage.
+    """
+    key = {"period": PERIOD}
+    key.update({dimension: f"${dimension}" for dimension in USAGE_DIMENSIONS})
+    return [
+        {
+            "$group": {
+                "_id": key,
+                **{field: {"$sum": value} for field, value in USAGE_SUMS.items()},
+            }
+        },
+        {"$addFields": {field: f"$_id.{field}" for field in key}},
+    ]
+
+
+def station_pipeline() -> list:
+    """
+    Counts the trips starting and ending at each station per period in a single pass.
+
+    Every trip is unwound into its start and its end station key, so one
+    scan produces both counts. Trips without a station, such as undocked
+    e-bikes, are not counted for it. Names are read from the station
+    dimension, so a renamed station keeps its counts.
+
+    Returns:
+        list: The aggregation stages, without an output stage.
+    """
+    return [
+        {
+            "$project": {
+                "period": PERIOD,
+                "stations": [
+                    {"key": "$start_station_key", "start": 1, "end": 0},
+                    {"key": "$end_station_key", "start": 0, "end": 1},
+                ],
+            }
+        },
+        {"$unwind": "$stations"},
+        {"$match": {"stations.key": {"$ne": None}}},
+        {
+            "$group": {
+                "_id": {"period": "$period", "station_key": "$stations.key"},
+                "start_count": {"$sum": "$stations.start"},
+                "end_count": {"$sum": "$stations.end"},
+            }
+        },
+        {"$addFields": {"period": "$_id.period", "station_key": "$_id.station_key"}},
+    ]
+
+
+class Rollups:
+    """
+    Maintains the pre-aggregated collections the dashboard reads from.
+
+    The usage rollup holds trip counts and duration sums per month, day of
+    week, hour, member type and bike type, a few thousand documents for a
+    year of trips. The station rollup holds the start and end counts of
+    each station key. `Queries` answers from them instead of grouping the
+    whole trips collection on every page load.
+
+    Both are kept per calendar month of `started_at`. `rebuild` computes
+    every month from scratch, while `refresh_month` replaces the partial
+    aggregates of one month after it is loaded, re-ingested or deleted.
+    """
+
+    def __init__(self, trips: Collection) -> None:
+        self.trips = trips
+        self.usage = trips.database[f"{trips.name}{USAGE_ROLLUP_SUFFIX}"]
+        self.stations = trips.database[f"{trips.name}{STATION_ROLLUP_SUFFIX}"]
+        self.stats = CollectionStats(trips)
+        self.dimensions = Dimensions(trips)
+
+    def is_built(self) -> bool:
+        return self.usage.find_one({}, {"_id": 1}) is not None
+
+    # Stages reading time-series trips, which keep some fields only in their meta field
+    def _read_stages(self) -> list:
+        return [meta_stage()] if is_timeseries(self.trips) else []
+
+    def rebuild(self) -> None:
+        """
+        Recomputes both rollups, the dimensions and the collection stats from the trips collection.
+
+        `$out` replaces each rollup atomically once its aggregation has
+        finished, so the dashboard never reads a partial rollup.
+        """
+        read = self._read_stages()
+        self.trips.aggregate(
+            read + usage_pipeline() + [{"$out": self.usage.name}], allowDiskUse=True
+        )
+        self.trips.aggregate(
+            read + station_pipeline() + [{"$out": self.stations.name}],
+            allowDiskUse=True,
+        )
+        self.dimensions.refresh(self.usage, self.stations)
+        self.stats.refresh(self.usage)
+
+    def refresh_month(self, year: int, month: int) -> None:
+        """
+        Replaces one month's contribution to both rollups, the dimensions and the collection stats.
+
+        Only the trips that started in the month are aggregated, using the
+        `started_at` index. The new partial aggregates are merged into the
+        rollups first and the month's documents they did not overwrite are
+        removed afterwards, so readers never see the month missing. A month
+        whose trips were deleted ends up with no rollup documents.
+
+        Args:
+            year (int): The year of the month.
+            month (int): The month number.
+        """
+        start = datetime(year, month, 1)
+        end = datetime(year + 1, 1, 1) if month == 12 else datetime(year, month + 1, 1)
+        match = {"$match": {"started_at": {"$gte": start, "$lt": end}}}
+        read = self._read_stages()
+        refresh_id = ObjectId()
+        for rollup, pipeline in (
+            (self.usage, usage_pipeline()),
+            (self.stations, station_pipeline()),
+        ):
+            self.trips.aggregate(
+                [match]
+                + read
+                + pipeline
+                + [
+                    {"$addFields": {"refresh_id": refresh_id}},
+                    {
+                        "$merge": {
+                            "into": rollup.name,
+                            "on": "_id",
+                            "whenMatched": "replace",
+                            "whenNotMatched": "insert",
+                        }
+                    },
+                ],
+                allowDiskUse=True,
+            )
+            rollup.delete_many(
+                {
+                    "period": period_name(year, month),
+                    "refresh_id": {"$ne": refresh_id},
+                }
+            )
+        # the stats are refreshed last, their update time marks the refresh done
+        self.dimensions.refresh(self.usage, self.stations)
+        self.stats.refresh(self.usage, [period_name(year, month)])
+
+    def refresh_range(
+        self, first: Optional[datetime], last: Optional[datetime]
+    ) -> list:
+        """
+        Refreshes every month between two trip start times.
+
+        Args:
+            first (datetime, optional): The earliest `started_at` loaded.
+            last (datetime, optional): The latest `started_at` loaded.
+
+        Returns:
+            list: The names of the refreshed periods.
+        """
+        if first is None or last is None:
+            return []
+        months = months_between(first, last)
+        for year, month in months:
+            self.refresh_month(year, month)
+        return [period_name(year, month) for year, month in months]
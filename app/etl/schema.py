@@ -0,0 +1,242 @@
+from collections import Counter
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from app.etl.geo import haversine_vectorized
+
+# Column types of a Citi Bike trip CSV, passed to `pd.read_csv`.
+# Station IDs are kept as strings since they mix values like "5329.03" and
+# "JC013"; low-cardinality text columns are read as categories.
+TRIP_DTYPES = {
+    "ride_id": str,
+    "rideable_type": "category",
+    "start_station_name": "category",
+    "start_station_id": str,
+    "end_station_name": "category",
+    "end_station_id": str,
+    "start_lat": "float64",
+    "start_lng": "float64",
+    "end_lat": "float64",
+    "end_lng": "float64",
+    "member_casual": "category",
+}
+TRIP_DATE_COLUMNS = ["started_at", "ended_at"]
+
+# Fields computed once at ingest so queries do not derive them per document.
+# `day_of_week` follows MongoDB's `$dayOfWeek`: 1 is Sunday, 7 is Saturday.
+DERIVED_FIELDS = ["duration_seconds", "hour", "day_of_week", "month", "distance_km"]
+
+# Trips missing any of these are rejected. Every other column is optional:
+# a trip without an end station or end coordinates is kept without them.
+REQUIRED_COLUMNS = [
+    "ride_id",
+    "rideable_type",
+    "started_at",
+    "ended_at",
+    "member_casual",
+    "start_lat",
+    "start_lng",
+]
+# Service area bounding box, coordinates outside it are flagged, not dropped
+LAT_BOUNDS = (40.4, 41.0)
+LNG_BOUNDS = (-74.3, -73.6)
+# Boolean fields only stored on the trips where they are true
+FLAG_FIELDS = ["coordinate_outlier"]
+
+
+def coerce_types(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Parses the timestamp columns of a trips DataFrame in place.
+
+    Args:
+        df (pd.DataFrame): Trips read with `TRIP_DTYPES`.
+
+    Returns:
+        pd.DataFrame: The same DataFrame.
+    """
+    for column in TRIP_DATE_COLUMNS:
+        df[column] = pd.to_datetime(df[column], format="ISO8601")
+    return df
+
+
+def derive_fields(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Adds the precomputed trip fields in place.
+
+    Args:
+        df (pd.DataFrame): Trips with parsed timestamps.
+
+    Returns:
+        pd.DataFrame: The same DataFrame with `DERIVED_FIELDS` added.
+    """
+    started_at = df["started_at"].dt
+    df["duration_seconds"] = (df["ended_at"] - df["started_at"]).dt.total_seconds()
+    # nullable integers, so a trip without a start time does not turn the
+    # whole column into floats
+    df["hour"] = started_at.hour.astype("Int16")
+    df["day_of_week"] = ((started_at.dayofweek + 1) % 7 + 1).astype("Int16")
+    df["month"] = started_at.month.astype("Int16")
+    df["distance_km"] = haversine_vectorized(
+        df["start_lat"], df["start_lng"], df["end_lat"], df["end_lng"]
+    )
+    return df
+
+
+def reject_mask(
+    missing: np.ndarray,
+    negative: np.ndarray,
+    outlier: np.ndarray,
+    has_null: np.ndarray,
+    metrics: Optional[Counter] = None,
+) -> np.ndarray:
+    """
+    Combines the per-row checks of a batch and counts them.
+
+    Shared by the pandas and Arrow readers so both report the same metrics:
+    `read`, `rejected`, `missing_<column>`, `negative_duration`, and for kept
+    trips `incomplete` (missing optional fields) and `coordinate_outlier`.
+    A rejected trip counts under every reason it fails.
+
+    Args:
+        missing (np.ndarray): One column per `REQUIRED_COLUMNS`, true where the value is missing.
+        negative (np.ndarray): True where the trip ends before it starts.
+        outlier (np.ndarray): True where a coordinate is outside the service area.
+        has_null (np.ndarray): True where any field is missing.
+        metrics (Counter, optional): The counter to add the counts to.
+
+    Returns:
+        np.ndarray: A boolean mask of the trips to keep.
+    """
+    reject = missing.any(axis=1) | negative
+    keep = ~reject
+    if metrics is not None:
+        metrics["read"] += len(keep)
+        metrics["rejected"] += int(reject.sum())
+        for column, count in zip(REQUIRED_COLUMNS, missing.sum(axis=0)):
+            if count:
+                metrics[f"missing_{column}"] += int(count)
+        metrics["negative_duration"] += int(negative.sum())
+        metrics["coordinate_outlier"] += int((outlier & keep).sum())
+        metrics["incomplete"] += int((has_null & keep).sum())
+    return keep
+
+
+def null_masks(df: pd.DataFrame) -> tuple:
+    """
+    Finds the missing values of a batch one column at a time.
+
+    The masks are shared by `validate` and `to_documents`, so a batch is
+    scanned for nulls once and no boolean copy of the whole DataFrame is made.
+
+    Args:
+        df (pd.DataFrame): Trips with parsed timestamps and derived fields.
+
+    Returns:
+        tuple: One column per `REQUIRED_COLUMNS`, true where the value is
+            missing, and a row mask, true where any field is missing.
+    """
+    missing = np.ones((len(df), len(REQUIRED_COLUMNS)), bool)
+    has_null = np.zeros(len(df), bool)
+    for column in df.columns:
+        is_null = df[column].isna().to_numpy()
+        has_null |= is_null
+        if column in REQUIRED_COLUMNS:
+            missing[:, REQUIRED_COLUMNS.index(column)] = is_null
+    return missing, has_null
+
+
+def validate(
+    df: pd.DataFrame,
+    missing: np.ndarray,
+    has_null: np.ndarray,
+    metrics: Optional[Counter] = None,
+) -> np.ndarray:
+    """
+    Validates trips in a single vectorized pass.
+
+    Trips missing a required column or ending before they start are
+    rejected. Trips with coordinates outside the service area are kept and
+    get a `coordinate_outlier` column. The counts are described in
+    `reject_mask`.
+
+    Args:
+        df (pd.DataFrame): Trips with parsed timestamps and derived fields.
+        missing (np.ndarray): The required column mask from `null_masks`.
+        has_null (np.ndarray): The row mask from `null_masks`.
+        metrics (Counter, optional): The counter to add the counts to.
+
+    Returns:
+        np.ndarray: A boolean mask of the trips to keep.
+    """
+    negative = (df["duration_seconds"] < 0).to_numpy()
+
+    def outside(column: str, bounds: tuple) -> pd.Series:
+        return ~df[column].between(*bounds) & df[column].notna()
+
+    df["coordinate_outlier"] = (
+        outside("start_lat", LAT_BOUNDS)
+        | outside("start_lng", LNG_BOUNDS)
+        | outside("end_lat", LAT_BOUNDS)
+        | outside("end_lng", LNG_BOUNDS)
+    )
+    return reject_mask(
+        missing, negative, df["coordinate_outlier"].to_numpy(), has_null, metrics
+    )
+
+
+def describe_metrics(metrics: Counter) -> str:
+    """
+    Formats validation counts for the ingest log.
+
+    Args:
+        metrics (Counter): The counts collected by `validate`.
+
+    Returns:
+        str: The counts, rows read first, e.g. "read 10, rejected 1 (missing_ride_id 1)".
+    """
+    reasons = [
+        f"{reason} {metrics[reason]}"
+        for reason in sorted(metrics)
+        if reason.startswith("missing_") or reason == "negative_duration"
+        if metrics[reason]
+    ]
+    text = f"read {metrics['read']}, rejected {metrics['rejected']}"
+    if reasons:
+        text += f" ({', '.join(reasons)})"
+    return (
+        f"{text}, kept {metrics['incomplete']} incomplete, "
+        f"flagged {metrics['coordinate_outlier']} coordinate outliers"
+    )
+
+
+def to_documents(df: pd.DataFrame, keep: np.ndarray, has_null: np.ndarray) -> list:
+    """
+    Converts the kept trips into documents.
+
+    Missing optional fields are left out of a document rather than stored
+    as NaN, and `FLAG_FIELDS` are only set on the trips where they are true.
+    Only the affected rows are touched in Python, and the DataFrame itself
+    is never copied.
+
+    Args:
+        df (pd.DataFrame): The validated trips.
+        keep (np.ndarray): The mask returned by `validate`.
+        has_null (np.ndarray): The row mask from `null_masks`.
+
+    Returns:
+        list: The kept trips as a list of dictionaries.
+    """
+    flags = {field: df.pop(field).to_numpy() for field in FLAG_FIELDS if field in df}
+    documents = df.to_dict("records")
+    for index in np.flatnonzero(has_null & keep):
+        documents[index] = {
+            key: value for key, value in documents[index].items() if not pd.isna(value)
+        }
+    for field, values in flags.items():
+        for index in np.flatnonzero(values & keep):
+            documents[index][field] = True
+    if keep.all():
+        return documents
+    return [document for document, kept in zip(documents, keep) if kept]
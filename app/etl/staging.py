@@ -0,0 +1,155 @@
+import glob
+import os
+from typing import Iterator, Optional
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from app.etl.arrow_reader import rebatch, table_to_documents
+
+# Marker written once every CSV member of a month has been staged
+STAGED_MARKER = "_SUCCESS"
+
+
+def skip_leading_rows(
+    record_batches: Iterator[pa.RecordBatch], rows: int
+) -> Iterator[pa.RecordBatch]:
+    for record_batch in record_batches:
+        if rows >= record_batch.num_rows:
+            rows -= record_batch.num_rows
+            continue
+        yield record_batch.slice(rows)
+        rows = 0
+
+
+class ParquetStore:
+    """
+    A local store of cleaned trips, partitioned as `year=YYYY/month=MM`.
+
+    Each CSV member of a month's archive becomes one Parquet file holding
+    the cleaned trips with their derived fields, so a month can be loaded
+    into MongoDB again, or analysed offline, without downloading or parsing
+    the CSV a second time.
+    """
+
+    def __init__(self, root: str) -> None:
+        self.root = root
+
+    def month_dir(self, year: int, month: int) -> str:
+        return os.path.join(self.root, f"year={year}", f"month={month:02d}")
+
+    @staticmethod
+    def source(year: int, month: int) -> str:
+        """
+        Names a staged month in the load manifest.
+
+        Args:
+            year (int): The year of the month.
+            month (int): The month number.
+
+        Returns:
+            str: The manifest source of the month.
+        """
+        return f"parquet/year={year}/month={month:02d}"
+
+    def is_staged(self, year: int, month: int) -> bool:
+        return os.path.exists(os.path.join(self.month_dir(year, month), STAGED_MARKER))
+
+    def month_files(self, year: int, month: Optional[int] = None) -> list:
+        """
+        Lists the staged Parquet files of a month, or of a whole year.
+
+        Args:
+            year (int): The year.
+            month (int, optional): The month number, every month if None.
+
+        Returns:
+            list: The sorted file paths.
+        """
+        month_glob = f"month={month:02d}" if month else "month=*"
+        return sorted(
+            glob.glob(os.path.join(self.root, f"year={year}", month_glob, "*.parquet"))
+        )
+
+    def write_member(
+        self, year: int, month: int, member: str, tables: Iterator[pa.Table]
+    ) -> int:
+        """
+        Writes the cleaned trips of a CSV member to the month's partition.
+
+        The file is written under a temporary name and renamed once
+        complete, so an interrupted run never leaves a truncated file.
+
+        Args:
+            year (int): The year of the month.
+            month (int): The month number.
+            member (str): The CSV member name.
+            tables (Iterator[pa.Table]): The cleaned trips.
+
+        Returns:
+            int: The number of rows written.
+        """
+        month_dir = self.month_dir(year, month)
+        os.makedirs(month_dir, exist_ok=True)
+        name = os.path.splitext(os.path.basename(member))[0]
+        path = os.path.join(month_dir, f"{name}.parquet")
+        tmp_path = f"{path}.tmp"
+
+        rows = 0
+        writer = None
+        try:
+            for table in tables:
+                if writer is None:
+                    writer = pq.ParquetWriter(tmp_path, table.schema)
+                writer.write_table(table)
+                rows += table.num_rows
+        finally:
+            if writer is not None:
+                writer.close()
+        if writer is not None:
+            os.replace(tmp_path, path)
+        return rows
+
+    def mark_staged(self, year: int, month: int) -> None:
+        month_dir = self.month_dir(year, month)
+        os.makedirs(month_dir, exist_ok=True)
+        open(os.path.join(month_dir, STAGED_MARKER), "w").close()
+
+    @staticmethod
+    def read_batches(
+        path: str, batch_size: Optional[int] = None, skip_rows: int = 0
+    ) -> Iterator[list]:
+        """
+        Reads a staged file as batches of documents ready to insert.
+
+        Args:
+            path (str): The Parquet file.
+            batch_size (int, optional): The number of rows per batch, the whole file if None.
+            skip_rows (int): The number of rows to skip, used to resume a file.
+
+        Yields:
+            list: A batch of trips.
+        """
+        parquet_file = pq.ParquetFile(path)
+        record_batches = parquet_file.iter_batches(batch_size=batch_size or 65_536)
+        for table in rebatch(skip_leading_rows(record_batches, skip_rows), batch_size):
+            yield table_to_documents(table)
+
+    def dataset(self, year: Optional[int] = None) -> ds.Dataset:
+        """
+        Opens the staged trips as one Arrow dataset.
+
+        Args:
+            year (int, optional): Only include this year.
+
+        Returns:
+            ds.Dataset: The staged trips.
+        """
+        if year:
+            files = self.month_files(year)
+        else:
+            files = sorted(
+                glob.glob(os.path.join(self.root, "year=*", "month=*", "*.parquet"))
+            )
+        return ds.dataset(files, format="parquet")
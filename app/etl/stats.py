@@ -0,0 +1,104 @@
+from datetime import datetime, timezone
+from typing import Iterable, Optional
+
+from pymongo.collection import Collection
+
+# Suffix of the collection holding the headline numbers of a trips collection
+STATS_SUFFIX = "_stats"
+# `_id` of the document summing every month
+TOTAL_ID = "total"
+
+
+class CollectionStats:
+    """
+    Stores the trip count and duration sum of each loaded month and their total.
+
+    The numbers are derived from the usage rollup whenever a month's
+    rollup changes, so the dashboard headline is a single document read
+    instead of a count and an average over every trip.
+    """
+
+    def __init__(self, trips: Collection) -> None:
+        self.collection = trips.database[f"{trips.name}{STATS_SUFFIX}"]
+
+    def totals(self) -> Optional[dict]:
+        """
+        Returns the totals over every loaded month.
+
+        Returns:
+            dict: `trips`, `duration_sum` and `months`, or None before the first load.
+        """
+        return self.collection.find_one({"_id": TOTAL_ID})
+
+    def refresh(
+        self, usage: Collection, periods: Optional[Iterable[str]] = None
+    ) -> None:
+        """
+        Recomputes the stats of some months from the usage rollup, then the totals.
+
+        Args:
+            usage (Collection): The usage rollup.
+            periods (Iterable[str], optional): The months to refresh, every month if None.
+        """
+        periods = None if periods is None else list(periods)
+        match = {} if periods is None else {"period": {"$in": periods}}
+        results = usage.aggregate(
+            [
+                {"$match": match},
+                {
+                    "$group": {
+                        "_id": "$period",
+                        "trips": {"$sum": "$count"},
+                        "duration_sum": {"$sum": "$duration_sum"},
+                    }
+                },
+            ]
+        )
+        now = datetime.now(timezone.utc)
+        refreshed = []
+        for result in results:
+            refreshed.append(result["_id"])
+            self.collection.replace_one(
+                {"_id": result["_id"]},
+                {
+                    "period": result["_id"],
+                    "trips": result["trips"],
+                    "duration_sum": result["duration_sum"],
+                    "updated_at": now,
+                },
+                upsert=True,
+            )
+        # months left without trips, such as a deleted month
+        stale = {"period": {"$exists": True, "$nin": refreshed}}
+        if periods is not None:
+            stale["period"]["$in"] = periods
+        self.collection.delete_many(stale)
+        self._update_totals(now)
+
+    def _update_totals(self, now: datetime) -> None:
+        result = list(
+            self.collection.aggregate(
+                [
+                    {"$match": {"period": {"$exists": True}}},
+                    {
+                        "$group": {
+                            "_id": None,
+                            "trips": {"$sum": "$trips"},
+                            "duration_sum": {"$sum": "$duration_sum"},
+                            "months": {"$sum": 1},
+                        }
+                    },
+                ]
+            )
+        )
+        totals = result[0] if result else {"trips": 0, "duration_sum": 0, "months": 0}
+        self.collection.replace_one(
+            {"_id": TOTAL_ID},
+            {
+                "trips": totals["trips"],
+                "duration_sum": totals["duration_sum"],
+                "months": totals["months"],
+                "updated_at": now,
+            },
+            upsert=True,
+        )
@@ -0,0 +1,111 @@
+from pymongo.collection import Collection
+from pymongo.database import Database
+
+# Field holding the series a trip belongs to in a time-series trips collection
+META_FIELD = "meta"
+# Trip fields moved into `META_FIELD`. Trips of the same archive, start
+# station, bike type and member type are stored together in buckets of
+# consecutive start times, and deleting an archive's trips only filters on
+# the meta field, which every MongoDB version with time-series supports.
+META_FIELDS = ["source", "start_station_key", "rideable_type", "member_casual"]
+# Options of a time-series trips collection. "minutes" suits series that get
+# a trip every few minutes at the busiest stations and far fewer elsewhere.
+TIMESERIES_OPTIONS = {
+    "timeField": "started_at",
+    "metaField": META_FIELD,
+    "granularity": "minutes",
+}
+
+
+def is_timeseries(collection: Collection) -> bool:
+    """
+    Tells whether a collection was created as a time-series collection.
+
+    Args:
+        collection (Collection): The collection.
+
+    Returns:
+        bool: True for a time-series collection, False otherwise or if it does not exist.
+    """
+    return "timeseries" in collection.options()
+
+
+def create_timeseries(database: Database, name: str) -> Collection:
+    """
+    Creates a time-series trips collection, unless the collection already exists.
+
+    Args:
+        database (Database): The database.
+        name (str): The name of the collection.
+
+    Returns:
+        Collection: The collection.
+    """
+    if name not in database.list_collection_names(filter={"name": name}):
+        database.create_collection(name, timeseries=TIMESERIES_OPTIONS)
+    return database[name]
+
+
+def add_meta(documents: list) -> list:
+    """
+    Moves the `META_FIELDS` of trips into their `META_FIELD` in place.
+
+    A time-series collection stores the meta field once per bucket, so
+    the fields are not kept at the top level too; `meta_stage` puts them
+    back when the trips are read.
+
+    Args:
+        documents (list): Transformed trips, with their station keys and source.
+
+    Returns:
+        list: The same trips.
+    """
+    for document in documents:
+        document[META_FIELD] = {
+            field: document.pop(field) for field in META_FIELDS if field in document
+        }
+    return documents
+
+
+def meta_field(field: str) -> str:
+    """
+    Returns the path a trip field is stored at in a time-series collection.
+    """
+    return f"{META_FIELD}.{field}" if field in META_FIELDS else field
+
+
+def meta_query(query: dict) -> dict:
+    """
+    Moves the conditions on `META_FIELDS` of a query onto `META_FIELD`.
+
+    MongoDB filters a time-series collection's buckets on their meta field
+    and time range before unpacking them, so matching the meta field lets
+    whole buckets be skipped. Conditions inside `$and`, `$or` and `$nor`
+    are moved too; `$expr` is left as it is, so it must follow `meta_stage`.
+
+    Args:
+        query (dict): A query on trip fields.
+
+    Returns:
+        dict: The equivalent query on the time-series collection.
+    """
+    moved = {}
+    for field, condition in query.items():
+        if field in ("$and", "$or", "$nor"):
+            moved[field] = [meta_query(part) for part in condition]
+        else:
+            moved[meta_field(field)] = condition
+    return moved
+
+
+def meta_stage() -> dict:
+    """
+    Returns the stage setting the `META_FIELDS` of time-series trips back at the top level.
+
+    Placed right after the leading `$match` of a pipeline, so later stages
+    read either kind of collection alike.
+
+    Returns:
+        dict: The `$addFields` stage.
+    """
+    return {"$addFields": {field: f"${META_FIELD}.{field}" for field in META_FIELDS}}
@@ -1,18 +1,70 @@
 import datetime as dt
 from datetime import datetime
+from typing import Optional
 
 import folium
 import pandas as pd
 import plotly.express as px
 import streamlit as st
+from pymongo import ASCENDING
 from streamlit_folium import folium_static
 
 from app.etl.extract import ExtractTransformLoad
+from app.etl.cache import cached, freeze, shared_cache
+from app.etl.dimensions import STATION_NAME_KEYS, Dimensions
+from app.etl.frames import frame_from_batches, frame_from_documents
+from app.etl.timeseries import meta_field
+
+# Columns of the custom query table and of the trips drawn on the map
+CUSTOM_QUERY_SCHEMA = {
+    "started_at": "datetime",
+    "ended_at": "datetime",
+    "start_station_name": "category",
+    "end_station_name": "category",
+    "rideable_type": "category",
+    "member_casual": "category",
+}
+MAP_QUERY_SCHEMA = {
+    "start_station_name": "category",
+    "end_station_name": "category",
+    "start_lat": "float",
+    "start_lng": "float",
+    "end_lat": "float",
+    "end_lng": "float",
+    "started_at": "datetime",
+    "ended_at": "datetime",
+    "rideable_type": "category",
+    "member_casual": "category",
+}
+# Trips per page of the custom query table, in the order its pages are keyed on
+CUSTOM_QUERY_PAGE_SIZE = 100
+PAGE_ORDER = [("started_at", ASCENDING), ("_id", ASCENDING)]
 
 
 class CustomQuery(ExtractTransformLoad):
     def __init__(self, db_name: str, collection_name: str, **kwargs) -> None:
         super().__init__(db_name, collection_name, **kwargs)
+        self.dimensions = Dimensions(self.default_collection)
+        # the same cache as `Queries` on this collection
+        self.cache = shared_cache(
+            f"{self.client_key}/{db_name}.{collection_name}", self.data_version
+        )
+
+    # Distinct values of a sidebar filter, from the dimensions the ETL maintains
+    @cached
+    def get_dimension_values(self, field: str) -> list:
+        values = self.dimensions.values(field)
+        if values is None:
+            # trips keep station keys, the names are in the station dimension
+            source = (
+                self.get_station_dimension().collection.distinct("name")
+                if field in STATION_NAME_KEYS
+                else self.default_collection.distinct(
+                    meta_field(field) if self.is_timeseries() else field
+                )
+            )
+            values = sorted(value for value in source if value is not None)
+        return values
 
     def sidebar_filter(self):
         """
@@ -29,29 +81,19 @@ class CustomQuery(ExtractTransformLoad):
         end_date = st.sidebar.date_input("End Date", default_end_date)
         start_station = st.sidebar.selectbox(
             "Start Station",
-            ["All"]
-            + [
-                station
-                for station in self.default_collection.distinct("start_station_name")
-            ],
+            ["All"] + self.get_dimension_values("start_station_name"),
         )
         end_station = st.sidebar.selectbox(
             "End Station",
-            ["All"]
-            + [
-                station
-                for station in self.default_collection.distinct("end_station_name")
-            ],
+            ["All"] + self.get_dimension_values("end_station_name"),
         )
         ride_type = st.sidebar.selectbox(
             "Select Ride Type",
-            ["All"]
-            + [ride for ride in self.default_collection.distinct("rideable_type")],
+            ["All"] + self.get_dimension_values("rideable_type"),
         )
         user_type = st.sidebar.selectbox(
             "Select User Type",
-            ["All"]
-            + [user for user in self.default_collection.distinct("member_casual")],
+            ["All"] + self.get_dimension_values("member_casual"),
         )
 
         return start_date, end_date, start_station, end_station, ride_type, user_type
@@ -61,7 +103,9 @@ class CustomQuery(ExtractTransformLoad):
         Constructs a query based on the provided filter parameters.
 
         Returns:
-            A dictionary representing the MongoDB query.
+            A dictionary representing the MongoDB query, matching stations
+            on their keys and, when the trips are a time-series collection,
+            on the meta field.
         """
         (
             start_date,
@@ -87,45 +131,208 @@ class CustomQuery(ExtractTransformLoad):
         if user_type != "All":
             query["member_casual"] = user_type
 
-        return query
+        return self.trip_query(query)
 
-    def get_custom_query(self, query: dict) -> pd.DataFrame:
+    def get_custom_query(
+        self,
+        query: dict,
+        after: Optional[tuple] = None,
+        page_size: int = CUSTOM_QUERY_PAGE_SIZE,
+    ) -> tuple[pd.DataFrame, Optional[tuple]]:
         """
-        Retrieves custom data from the default collection based on the provided query.
+        Retrieves one page of the custom data matching the provided query.
+
+        Trips are ordered by `started_at` then `_id`, and a page starts right
+        after the key of the previous page's last trip, so every page is an
+        index range scan however deep it is, unlike `skip`.
 
         Args:
             query (dict): The query to filter the data.
+            after (tuple, optional): The `(started_at, _id)` key the page
+                starts after, None for the first page.
+            page_size (int): The maximum number of trips in the page.
 
         Returns:
-            pd.DataFrame: A pandas DataFrame containing the retrieved custom data.
+            tuple: A DataFrame of the page, and the key to pass as `after`
+            for the next page, or None if this is the last page.
         """
-        custom_data = self.default_collection.find(
-            query,
-            {
-                "_id": 0,
-                "started_at": 1,
-                "ended_at": 1,
-                "start_station_name": 1,
-                "end_station_name": 1,
-                "rideable_type": 1,
-                "member_casual": 1,
-            },
+        if after is not None:
+            started_at, _id = after
+            query = {
+                "$and": [
+                    query,
+                    {
+                        "$or": [
+                            {"started_at": {"$gt": started_at}},
+                            {"started_at": started_at, "_id": {"$gt": _id}},
+                        ]
+                    },
+                ]
+            }
+        # one extra trip tells whether there is a next page
+        trips = list(
+            self.default_collection.aggregate(
+                [
+                    {"$match": query},
+                    {"$sort": dict(PAGE_ORDER)},
+                    {"$limit": page_size + 1},
+                ]
+                + self.read_stages()
+                + self.get_station_dimension().lookup_stages()
+                + [{"$project": {field: 1 for field in CUSTOM_QUERY_SCHEMA}}]
+            )
         )
-        custom_data_list = list(custom_data)
-        custom_data_df = pd.DataFrame(custom_data_list)
+        page = trips[:page_size]
+        next_after = None
+        if len(trips) > page_size:
+            next_after = (page[-1]["started_at"], page[-1]["_id"])
+        return frame_from_documents(page, CUSTOM_QUERY_SCHEMA), next_after
+
+    @cached
+    def count_custom_query(self, query: dict) -> int:
+        """
+        Counts the trips matching the provided query on the server.
 
-        return custom_data_df
+        The count is kept in the shared query cache, which is cleared when
+        the data version changes, so reruns and page clicks do not count again.
+
+        Args:
+            query (dict): The query to filter the data.
+
+        Returns:
+            int: The number of matching trips.
+        """
+        return self.default_collection.count_documents(query)
+
+    def custom_query_page(self, query: dict, data_col) -> pd.DataFrame:
+        """
+        Shows page controls for the custom query and retrieves the current page.
+
+        The keys of the pages visited so far are kept in the session state,
+        so going back does not need an offset either. They are reset when
+        the filters change.
+
+        Args:
+            query (dict): The query to filter the data.
+            data_col: The column where the controls will be displayed.
+
+        Returns:
+            pd.DataFrame: The trips of the current page.
+        """
+        state = st.session_state.get("custom_query_pages")
+        if state is None or state["query"] != freeze(query):
+            state = {"query": freeze(query), "keys": [None], "page": 0}
+            st.session_state["custom_query_pages"] = state
+
+        total = self.count_custom_query(query)
+        pages = max(1, -(-total // CUSTOM_QUERY_PAGE_SIZE))
+        # the page is read first, so the key of the next page is known
+        page_df, next_after = self.get_custom_query(query, state["keys"][state["page"]])
+        if next_after is not None and len(state["keys"]) == state["page"] + 1:
+            state["keys"].append(next_after)
+
+        def turn(step: int) -> None:
+            # runs before the rerun, so both buttons are drawn for the new page;
+            # a page is only reachable once the key it starts after is known
+            last = min(pages, len(state["keys"])) - 1
+            state["page"] = max(0, min(state["page"] + step, last))
+
+        with data_col:
+            previous_col, caption_col, next_col = st.columns([1, 3, 1])
+            previous_col.button(
+                "Previous",
+                disabled=state["page"] == 0,
+                on_click=turn,
+                args=(-1,),
+            )
+            next_col.button(
+                "Next",
+                disabled=state["page"] + 1 >= min(pages, len(state["keys"])),
+                on_click=turn,
+                args=(1,),
+            )
+            first = state["page"] * CUSTOM_QUERY_PAGE_SIZE
+            caption_col.caption(
+                f"Page {state['page'] + 1} of {pages}, "
+                f"trips {min(first + 1, total):,} to "
+                f"{min(first + CUSTOM_QUERY_PAGE_SIZE, total):,} of {total:,}"
+            )
+
+        return page_df
+
+    def get_custom_summary(self, query: dict) -> dict:
+        """
+        Computes the custom query chart series in one aggregation.
+
+        A `$facet` groups the matching trips by day, bike type and user
+        type in the database, so only the counts are sent back, a few
+        hundred numbers however many trips match.
+
+        Args:
+            query (dict): The query to filter the data.
+
+        Returns:
+            dict: DataFrames of trip counts by "date", "rideable_type" and "member_casual".
+        """
+
+        def count_by(key) -> list:
+            return [
+                {"$group": {"_id": key, "count": {"$sum": 1}}},
+                {"$match": {"_id": {"$ne": None}}},
+                {"$sort": {"_id": 1}},
+            ]
+
+        result = next(
+            self.default_collection.aggregate(
+                [{"$match": query}]
+                + self.read_stages()
+                + [
+                    {
+                        "$facet": {
+                            "date": count_by(
+                                {
+                                    "$dateToString": {
+                                        "format": "%Y-%m-%d",
+                                        "date": "$started_at",
+                                    }
+                                }
+                            ),
+                            "rideable_type": count_by("$rideable_type"),
+                            "member_casual": count_by("$member_casual"),
+                        }
+                    },
+                ]
+            )
+        )
+        summary = {}
+        for name, counts in result.items():
+            summary[name] = pd.DataFrame(
+                {
+                    name: [count["_id"] for count in counts],
+                    "count": pd.Series(
+                        [count["count"] for count in counts], dtype="int64"
+                    ),
+                }
+            )
+        summary["date"]["date"] = pd.to_datetime(summary["date"]["date"])
+        return summary
 
     def custom_visualize_data(
-        self, custom_data_df: pd.DataFrame, data_col, viz_col
+        self,
+        custom_data_df: pd.DataFrame,
+        data_col,
+        viz_col,
+        summary: dict,
     ) -> None:
         """
         Visualizes custom data using various plots based on the columns present in the DataFrame.
 
         Args:
-            custom_data_df (pd.DataFrame): The DataFrame containing the custom data to be visualized.
+            custom_data_df (pd.DataFrame): The page of custom data to be displayed.
             data_col: The column where the data will be displayed.
             viz_col: The column where the visualizations will be displayed.
+            summary (dict): The chart data over every matching trip, from
+                `get_custom_summary`.
 
         Returns:
             None
@@ -141,36 +348,37 @@ class CustomQuery(ExtractTransformLoad):
             if custom_data_df.empty:
                 st.error("No data to be Visualized")
 
-            if "started_at" in custom_data_df.columns:
-                custom_data_df["date"] = custom_data_df["started_at"].dt.date
-                daily_counts = (
-                    custom_data_df.groupby("date").size().reset_index(name="count")
-                )
+            if "date" in summary:
                 fig = px.line(
-                    daily_counts, x="date", y="count", title="Number of Rides Over Time"
+                    summary["date"],
+                    x="date",
+                    y="count",
+                    title="Number of Rides Over Time",
                 )
                 st.plotly_chart(fig)
 
-            if "rideable_type" in custom_data_df.columns:
+            if "rideable_type" in summary:
                 # dont visualize when rideable_type is selected
-                if custom_data_df["rideable_type"].nunique() == 1:
+                if len(summary["rideable_type"]) == 1:
                     pass
                 else:
                     fig = px.pie(
-                        custom_data_df,
+                        summary["rideable_type"],
                         names="rideable_type",
+                        values="count",
                         title="Distribution of Bike Types",
                     )
                     st.plotly_chart(fig)
 
-            if "member_casual" in custom_data_df.columns:
+            if "member_casual" in summary:
                 # dont visualize when member_casual is selected
-                if custom_data_df["member_casual"].nunique() == 1:
+                if len(summary["member_casual"]) == 1:
                     pass
                 else:
                     fig = px.pie(
-                        custom_data_df,
+                        summary["member_casual"],
                         names="member_casual",
+                        values="count",
                         title="Distribution of User Types",
                     )
                     st.plotly_chart(fig)
@@ -185,29 +393,16 @@ class CustomQuery(ExtractTransformLoad):
         Returns:
             pd.DataFrame: A DataFrame containing the map data.
         """
-        map_data = self.default_collection.aggregate(
+        map_data = self.default_collection.aggregate_raw_batches(
             [
                 {"$match": query},
                 {"$sample": {"size": 1000}},
-                {
-                    "$project": {
-                        "_id": 0,
-                        "start_station_name": 1,
-                        "end_station_name": 1,
-                        "start_lat": 1,
-                        "start_lng": 1,
-                        "end_lat": 1,
-                        "end_lng": 1,
-                        "started_at": 1,
-                        "ended_at": 1,
-                        "rideable_type": 1,
-                        "member_casual": 1,
-                    }
-                },
             ]
+            + self.read_stages()
+            + self.get_station_dimension().lookup_stages()
+            + [{"$project": {"_id": 0, **{field: 1 for field in MAP_QUERY_SCHEMA}}}]
         )
-        map_data_list = list(map_data)
-        map_data_df = pd.DataFrame(map_data_list)
+        map_data_df = frame_from_batches(map_data, MAP_QUERY_SCHEMA)
 
         return map_data_df
 
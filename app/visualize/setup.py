@@ -1,5 +1,6 @@
 import streamlit as st
 
+from app.etl.filters import TripFilter
 from app.etl.queries import Queries
 
 
@@ -30,7 +31,7 @@ def top_bar(queries: Queries) -> None:
         total_trips = queries.get_total_trips()
         average_trip_duration = queries.get_average_trip_duration()
         for duration in average_trip_duration:
-            avg_duration = round((duration["avg_duration"] / 60000), 2)
+            avg_duration = round((duration["avg_duration"] / 60), 2)
 
         first_column, second_column = st.columns(2)
         with first_column:
@@ -73,3 +74,19 @@ def sidebar_ops(query_type: str) -> str:
         query_type = st.sidebar.selectbox("Select Query", query_types)
 
     return query_type
+
+
+def dashboard_filter() -> TripFilter:
+    """
+    Function to display a date range picker for the predefined queries.
+
+    Returns:
+    TripFilter: The trips that started on the picked days, every trip if no day is picked.
+
+    """
+    with st.sidebar:
+        days = st.sidebar.date_input("Date Range", value=(), format="YYYY-MM-DD")
+    start = days[0] if len(days) > 0 else None
+    # while the range is being picked only its first day is known
+    end = days[1] if len(days) > 1 else start
+    return TripFilter(start=start, end=end)
@@ -1,13 +1,17 @@
+from typing import Optional
+
 import pandas as pd
 import plotly.express as px
 import streamlit as st
 
-from app.visualize.helpers import haversine_vectorized
+from app.etl.filters import TripFilter
 from app.etl.queries import Queries
 from app.visualize.gchat import analysis_overview
 
 
-def st_user_types(queries: Queries, data_col, viz_col):
+def st_user_types(
+    queries: Queries, data_col, viz_col, trip_filter: Optional[TripFilter] = None
+):
     """
     Visualizes user types data and plots a pie chart.
 
@@ -15,14 +19,13 @@ def st_user_types(queries: Queries, data_col, viz_col):
         queries (Queries): Queries containing methods to query user types data.
         data_col: Streamlit column to display the user types data.
         viz_col: Streamlit column to display the pie chart visualization.
+        trip_filter (TripFilter, optional): Restricts the trips shown.
 
     Returns:
         None
     """
     try:
-        user_types_cursor = queries.count_by_user_type()
-        user_types_list = list(user_types_cursor)
-        user_types_df = pd.DataFrame(user_types_list, columns=["count", "usertype"])
+        user_types_df = queries.frame("count_by_user_type", trip_filter=trip_filter)
         user_types_df = user_types_df.sort_values(by="count", ascending=False)
         user_types_df = user_types_df.rename(
             {"usertype": "User Type", "count": "Trip Count"}, axis=1
@@ -57,7 +60,9 @@ def st_user_types(queries: Queries, data_col, viz_col):
         return
 
 
-def st_bike_types(queries: Queries, data_col, viz_col) -> None:
+def st_bike_types(
+    queries: Queries, data_col, viz_col, trip_filter: Optional[TripFilter] = None
+) -> None:
     """
     Visualizes bike types data and plots a pie chart.
 
@@ -65,14 +70,13 @@ def st_bike_types(queries: Queries, data_col, viz_col) -> None:
     - queries: An object containing methods to query bike data.
     - data_col: The column to display the data in the UI.
     - viz_col: The column to display the visualization in the UI.
+    - trip_filter: Restricts the trips shown.
 
     Returns:
     None
     """
     try:
-        bike_types_cursor = queries.bike_count()
-        bike_types_list = list(bike_types_cursor)
-        bike_types_df = pd.DataFrame(bike_types_list, columns=["count", "bike type"])
+        bike_types_df = queries.frame("bike_count", trip_filter=trip_filter)
         bike_types_df = bike_types_df.sort_values(by="count", ascending=False)
         bike_types_df = bike_types_df.rename(
             {"bike type": "Bike Type", "count": "Trip Count"}, axis=1
@@ -111,7 +115,9 @@ def st_bike_types(queries: Queries, data_col, viz_col) -> None:
         return
 
 
-def st_bike_types_used_by_members(queries: Queries, data_col, viz_col) -> None:
+def st_bike_types_used_by_members(
+    queries: Queries, data_col, viz_col, trip_filter: Optional[TripFilter] = None
+) -> None:
     """
     Visualizes the bike types used by members.
 
@@ -119,12 +125,11 @@ def st_bike_types_used_by_members(queries: Queries, data_col, viz_col) -> None:
         queries (Queries): An object containing query methods.
         data_col: The column to display the data in.
         viz_col: The column to display the visualization in.
+        trip_filter (TripFilter, optional): Restricts the trips shown.
     """
     try:
-        bike_types_cursor = queries.get_bikes_used_by_member()
-        bike_types_list = list(bike_types_cursor)
-        bike_types_df = pd.DataFrame(
-            bike_types_list, columns=["count", "member_type", "bike_type"]
+        bike_types_df = queries.frame(
+            "get_bikes_used_by_member", trip_filter=trip_filter
         )
         bike_types_df = bike_types_df.sort_values(by="count", ascending=False)
         bike_types_df = bike_types_df.rename(
@@ -165,7 +170,7 @@ def st_bike_types_used_by_members(queries: Queries, data_col, viz_col) -> None:
 
 
 def st_average_trip_duration_per_user_types(
-    queries: Queries, data_col, viz_col
+    queries: Queries, data_col, viz_col, trip_filter: Optional[TripFilter] = None
 ) -> None:
     """
     Visualizes the average trip duration per user types.
@@ -174,16 +179,15 @@ def st_average_trip_duration_per_user_types(
         queries (Queries): An object containing query methods.
         data_col: The column to display the data in.
         viz_col: The column to display the visualization in.
+        trip_filter (TripFilter, optional): Restricts the trips shown.
     """
     try:
-        user_average_duration_cursor = queries.get_average_trip_duration_by_user_type()
-        user_average_duration_list = list(user_average_duration_cursor)
-        user_average_duration_df = pd.DataFrame(
-            user_average_duration_list, columns=["member_type", "average_duration"]
+        user_average_duration_df = queries.frame(
+            "get_average_trip_duration_by_user_type", trip_filter=trip_filter
         )
         # calculate average duration in minutes
         user_average_duration_df["average_duration"] = (
-            user_average_duration_df["average_duration"] / 60000
+            user_average_duration_df["average_duration"] / 60
         )
 
         with data_col:
@@ -219,7 +223,9 @@ def st_average_trip_duration_per_user_types(
         return
 
 
-def st_popular_stations(queries: Queries, data_col, viz_col) -> None:
+def st_popular_stations(
+    queries: Queries, data_col, viz_col, trip_filter: Optional[TripFilter] = None
+) -> None:
     """
     Visualizes the most popular start and end stations using Streamlit.
 
@@ -227,12 +233,13 @@ def st_popular_stations(queries: Queries, data_col, viz_col) -> None:
         queries: An object that provides access to the database queries.
         data_col: The Streamlit column to display the dataframes.
         viz_col: The Streamlit column to display the plots.
+        trip_filter (TripFilter, optional): Restricts the trips shown.
 
     Returns:
         None
     """
     try:
-        popular_stations_cursor = queries.most_popular_stations()
+        popular_stations_cursor = queries.most_popular_stations(trip_filter)
         popular_stations_list = list(popular_stations_cursor)
         popular_stations_data = popular_stations_list[0]
         popular_start_df = pd.DataFrame(
@@ -299,10 +306,10 @@ def st_popular_stations(queries: Queries, data_col, viz_col) -> None:
         return
 
 
-def st_peak_hours(queries, data_col, viz_col) -> None:
-    peak_hours_cursor = queries.get_peak_usage_hours()
-    peak_hours_list = list(peak_hours_cursor)
-    peak_hours_df = pd.DataFrame(peak_hours_list, columns=["hour", "count"])
+def st_peak_hours(
+    queries, data_col, viz_col, trip_filter: Optional[TripFilter] = None
+) -> None:
+    peak_hours_df = queries.frame("get_peak_usage_hours", trip_filter=trip_filter)
     peak_hours_df = peak_hours_df.sort_values(by="hour")
     peak_hours_df.rename(columns={"count": "Trip Count"}, inplace=True)
 
@@ -330,7 +337,9 @@ def st_peak_hours(queries, data_col, viz_col) -> None:
         st.plotly_chart(fig, use_container_width=True)
 
 
-def st_peak_hours_with_day(queries: Queries, data_col, viz_col) -> None:
+def st_peak_hours_with_day(
+    queries: Queries, data_col, viz_col, trip_filter: Optional[TripFilter] = None
+) -> None:
     """
     Visualizes peak usage hours with day.
 
@@ -338,27 +347,28 @@ def st_peak_hours_with_day(queries: Queries, data_col, viz_col) -> None:
         queries: An object that provides methods to retrieve peak usage hours data.
         data_col: The streamlit column to display the data.
         viz_col: The streamlit column to display the visualization.
+        trip_filter (TripFilter, optional): Restricts the trips shown.
 
     Returns:
         None
     """
     try:
-        peak_hours_cursor = queries.get_peak_usage_hours_with_day()
-        peak_hours_list = list(peak_hours_cursor)
-        peak_hours_df = pd.DataFrame(peak_hours_list, columns=["hour", "day", "count"])
+        peak_hours_df = queries.frame(
+            "get_peak_usage_hours_with_day", trip_filter=trip_filter
+        )
         peak_hours_df["hour_group"] = peak_hours_df["hour"].apply(
             lambda x: f"{x}:00 - {x + 1}:00"
         )
 
         peak_hours_df["day"] = peak_hours_df["day"].replace(
             {
-                1: "Monday",
-                2: "Tuesday",
-                3: "Wednesday",
-                4: "Thursday",
-                5: "Friday",
-                6: "Saturday",
-                7: "Sunday",
+                1: "Sunday",
+                2: "Monday",
+                3: "Tuesday",
+                4: "Wednesday",
+                5: "Thursday",
+                6: "Friday",
+                7: "Saturday",
             }
         )
         peak_hours_df["day"] = pd.Categorical(
@@ -411,7 +421,9 @@ def st_peak_hours_with_day(queries: Queries, data_col, viz_col) -> None:
         return
 
 
-def st_total_trips_per_month(queries, data_col_id, viz_col_id) -> None:
+def st_total_trips_per_month(
+    queries, data_col_id, viz_col_id, trip_filter: Optional[TripFilter] = None
+) -> None:
     """
     Visualizes the total number of trips per month.
 
@@ -419,15 +431,14 @@ def st_total_trips_per_month(queries, data_col_id, viz_col_id) -> None:
         queries: An object containing the queries to retrieve the total trips per month.
         data_col_id: The ID of the column to display the data.
         viz_col_id: The ID of the column to display the plot.
+        trip_filter (TripFilter, optional): Restricts the trips shown.
 
     Returns:
         None
     """
     try:
-        total_trips_cursor = queries.get_total_trips_per_month()
-        total_trips_list = list(total_trips_cursor)
-        total_trips_df = pd.DataFrame(
-            total_trips_list, columns=["month", "total_trips"]
+        total_trips_df = queries.frame(
+            "get_total_trips_per_month", trip_filter=trip_filter
         )
         total_trips_df["month"] = total_trips_df["month"].replace(
             {
@@ -474,7 +485,7 @@ def st_total_trips_per_month(queries, data_col_id, viz_col_id) -> None:
 
 
 def st_average_speed_per_user_and_bike_type(
-    queries: Queries, data_col, viz_col
+    queries: Queries, data_col, viz_col, trip_filter: Optional[TripFilter] = None
 ) -> None:
     """
     Calculate and visualize the average speed per user type and bike type.
@@ -483,36 +494,12 @@ def st_average_speed_per_user_and_bike_type(
         queries (Queries): Object containing query methods.
         data_col: Streamlit column for displaying data.
         viz_col: Streamlit column for displaying visualizations.
+        trip_filter (TripFilter, optional): Restricts the trips shown.
     """
     try:
-        average_speed_cursor = queries.get_raw_trip_data()
-        average_speed_list = list(average_speed_cursor)
-        average_speed_df = pd.DataFrame(average_speed_list)
-        average_speed_df["distance"] = haversine_vectorized(
-            average_speed_df["start_lat"],
-            average_speed_df["start_lng"],
-            average_speed_df["end_lat"],
-            average_speed_df["end_lng"],
-        )
-
-        # Calculate duration in hours
-        average_speed_df["duration_hours"] = (
-            average_speed_df["ended_at"] - average_speed_df["started_at"]
-        ).dt.total_seconds() / 3600
-
-        # Calculate speed
-        average_speed_df = average_speed_df[average_speed_df["duration_hours"] > 0]
-        average_speed_df["speed"] = (
-            average_speed_df["distance"] / average_speed_df["duration_hours"]
-        )
-
-        # Group by 'member_casual' and calculate average speed
-        average_speed_per_user_type = average_speed_df.groupby("member_casual")[
-            "speed"
-        ].mean()
-        average_speed_per_user_type = average_speed_per_user_type.reset_index()
-        average_speed_per_user_type = average_speed_per_user_type.sort_values(
-            by="speed", ascending=False
+        # speeds are averaged by the database, only the group means are read
+        average_speed_per_user_type = queries.frame(
+            "get_average_speed", "member_casual", trip_filter=trip_filter
         )
         average_speed_per_user_type["speed"] = average_speed_per_user_type[
             "speed"
@@ -522,13 +509,8 @@ def st_average_speed_per_user_and_bike_type(
             inplace=True,
         )
 
-        # Group by bike type and calculate average speed
-        average_speed_per_bike_type = average_speed_df.groupby("rideable_type")[
-            "speed"
-        ].mean()
-        average_speed_per_bike_type = average_speed_per_bike_type.reset_index()
-        average_speed_per_bike_type = average_speed_per_bike_type.sort_values(
-            by="speed", ascending=False
+        average_speed_per_bike_type = queries.frame(
+            "get_average_speed", "rideable_type", trip_filter=trip_filter
         )
         average_speed_per_bike_type["speed"] = average_speed_per_bike_type[
             "speed"
@@ -0,0 +1,82 @@
+"""
+Compares the pandas and pyarrow CSV parse backends on a synthetic month.
+
+Generates a Citi Bike style CSV inside a zip archive, then times how long
+each backend takes to read it and turn it into BSON-ready documents. No
+database is needed.
+
+    python -m benchmarks.parse_backends --rows 3000000 --batch_size 100000
+"""
+
+import argparse
+import os
+import tempfile
+import time
+import zipfile
+
+import numpy as np
+import pandas as pd
+
+from app.etl.extract import PARSE_BACKENDS, ExtractTransformLoad
+
+
+def synthetic_month(rows: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    stations = [f"W {n} St & {n % 12 + 1} Ave" for n in range(2000)]
+    station_ids = [f"{5000 + n}.{n % 10:02d}" for n in range(2000)]
+    start = rng.integers(0, len(stations), rows)
+    end = rng.integers(0, len(stations), rows)
+    started_at = pd.Timestamp("2023-07-01") + pd.to_timedelta(
+        rng.integers(0, 31 * 86400, rows), unit="s"
+    )
+    ended_at = started_at + pd.to_timedelta(rng.integers(60, 3600, rows), unit="s")
+    return pd.DataFrame(
+        {
+            "ride_id": [f"{n:016X}" for n in range(rows)],
+            "rideable_type": rng.choice(["classic_bike", "electric_bike"], rows),
+            "started_at": started_at.strftime("%Y-%m-%d %H:%M:%S"),
+            "ended_at": ended_at.strftime("%Y-%m-%d %H:%M:%S"),
+            "start_station_name": np.take(stations, start),
+            "start_station_id": np.take(station_ids, start),
+            "end_station_name": np.take(stations, end),
+            "end_station_id": np.take(station_ids, end),
+            "start_lat": 40.7 + rng.random(rows) / 10,
+            "start_lng": -74.0 + rng.random(rows) / 10,
+            "end_lat": 40.7 + rng.random(rows) / 10,
+            "end_lng": -74.0 + rng.random(rows) / 10,
+            "member_casual": rng.choice(["member", "casual"], rows),
+        }
+    )
+
+
+def main(rows: int, batch_size: int) -> None:
+    with tempfile.TemporaryDirectory() as path:
+        zip_path = os.path.join(path, "202307-citibike-tripdata.csv.zip")
+        with zipfile.ZipFile(zip_path, "w", zipfile.ZIP_DEFLATED) as zip_ref:
+            zip_ref.writestr(
+                "202307-citibike-tripdata.csv",
+                synthetic_month(rows).to_csv(index=False),
+            )
+
+        print(f"{rows} rows, batch size {batch_size}")
+        for backend in PARSE_BACKENDS:
+            documents = 0
+            start = time.perf_counter()
+            with zipfile.ZipFile(zip_path, "r") as zip_ref:
+                for member in ExtractTransformLoad.csv_members(zip_ref):
+                    for batch in ExtractTransformLoad.read_member_batches(
+                        zip_ref, member, batch_size, parse_backend=backend
+                    ):
+                        documents += len(batch)
+            elapsed = time.perf_counter() - start
+            print(f"{backend:<8}{elapsed:>8.2f}s{documents / elapsed:>14,.0f} docs/s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark CSV parse backends")
+    parser.add_argument("--rows", type=int, default=3_000_000, help="Rows to generate")
+    parser.add_argument(
+        "--batch_size", type=int, default=100_000, help="Rows per batch"
+    )
+    args = parser.parse_args()
+    main(args.rows, args.batch_size)
@@ -0,0 +1,109 @@
+"""
+Compares building query result DataFrames from documents and from raw BSON.
+
+Encodes synthetic trips into BSON batches of the size MongoDB returns,
+then compares the `pd.DataFrame(list(cursor))` path, which keeps a dict
+per document for the whole result, with its category columns converted
+afterwards, against `frame_from_batches`, which reads typed columns
+straight from the BSON. Both the time and the peak of the memory traced
+by `tracemalloc` while the frame is built are reported, so the BSON
+batches themselves are not counted. No database is needed.
+
+    python -m benchmarks.query_frames --rows 1000000
+"""
+
+import argparse
+import time
+import tracemalloc
+
+import bson
+import pandas as pd
+
+from app.etl.frames import frame_from_batches
+from benchmarks.parse_backends import synthetic_month
+
+# The trip fields read by the custom query and map pages
+SCHEMA = {
+    "started_at": "datetime",
+    "ended_at": "datetime",
+    "start_station_name": "category",
+    "end_station_name": "category",
+    "start_lat": "float",
+    "start_lng": "float",
+    "end_lat": "float",
+    "end_lng": "float",
+    "rideable_type": "category",
+    "member_casual": "category",
+}
+# MongoDB fills getMore batches up to 16 MiB
+BATCH_BYTES = 16 * 1024 * 1024
+
+
+def raw_batches(rows: int) -> list:
+    trips = synthetic_month(rows)[list(SCHEMA)]
+    trips["started_at"] = pd.to_datetime(trips["started_at"])
+    trips["ended_at"] = pd.to_datetime(trips["ended_at"])
+    batches, batch, size = [], [], 0
+    for document in trips.to_dict("records"):
+        for field in ("started_at", "ended_at"):
+            document[field] = document[field].to_pydatetime()
+        encoded = bson.encode(document)
+        if size + len(encoded) > BATCH_BYTES:
+            batches.append(b"".join(batch))
+            batch, size = [], 0
+        batch.append(encoded)
+        size += len(encoded)
+    batches.append(b"".join(batch))
+    return batches
+
+
+def from_documents(batches: list) -> pd.DataFrame:
+    documents = []
+    for data in batches:
+        documents.extend(bson.decode_all(data))
+    frame = pd.DataFrame(documents)
+    # the same column types as `frame_from_batches` gives
+    categories = [field for field, kind in SCHEMA.items() if kind == "category"]
+    return frame.astype({field: "category" for field in categories})
+
+
+def from_batches(batches: list) -> pd.DataFrame:
+    return frame_from_batches(batches, SCHEMA)
+
+
+def measure(build, batches: list) -> tuple:
+    """
+    Runs a decoder once for its time and once under tracemalloc for its peak memory.
+
+    Returns:
+        tuple: The seconds taken and the peak of traced allocations in MB.
+    """
+    start = time.perf_counter()
+    build(batches)
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    build(batches)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak / 1e6
+
+
+def main(rows: int) -> None:
+    print(f"Encoding {rows} trips")
+    batches = raw_batches(rows)
+    print(f"{len(batches)} batches, {sum(map(len, batches)) / 1e6:.0f} MB of BSON")
+    print(f"{'':<8}{'time':>9}{'docs/s':>14}{'peak':>11}")
+    for name, build in (("dicts", from_documents), ("columns", from_batches)):
+        elapsed, peak = measure(build, batches)
+        print(f"{name:<8}{elapsed:>8.2f}s{rows / elapsed:>14,.0f}{peak:>8.0f} MB")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark query result DataFrame decoding"
+    )
+    parser.add_argument(
+        "--rows", type=int, default=1_000_000, help="Documents to decode"
+    )
+    args = parser.parse_args()
+    main(args.rows)
@@ -1,11 +1,35 @@
 import os
+import sys
 import argparse
+from contextlib import nullcontext
+from typing import Optional
 import streamlit as st
-from app.etl.extract import ExtractTransformLoad
+from app.etl.extract import DEFAULT_BATCH_SIZE, PARSE_BACKENDS, ExtractTransformLoad
+from app.etl.indexes import IndexManager
+from app.etl.pipeline import IngestPipeline
+from app.etl.rollups import Rollups
 
 
 def main(
-    db: str, collection: str, uri: str, base_url: str, year: int, file_path: str
+    db: str,
+    collection: str,
+    uri: str,
+    base_url: str,
+    year: int,
+    file_path: str,
+    batch_size: Optional[int] = None,
+    parallel: bool = False,
+    download_workers: int = 4,
+    parse_workers: int = 2,
+    load_workers: int = 2,
+    keep_downloads: bool = False,
+    upsert: bool = False,
+    parse_backend: str = "pandas",
+    staging_dir: Optional[str] = None,
+    stage_only: bool = False,
+    from_staging: bool = False,
+    defer_indexes: bool = False,
+    timeseries: bool = False,
 ) -> None:
     """
     Main function for performing the ETL process.
@@ -17,30 +41,279 @@ def main(
         base_url (str): The base URL for data ingestion.
         year (int): The year for filtering the data.
         file_path (str): The file path for the data file.
+        batch_size (int, optional): Stream each month in batches of this many rows.
+        parallel (bool): Overlap downloads, parsing and loads across months.
+        download_workers (int): The number of concurrent downloads.
+        parse_workers (int): The number of CSV parsing processes.
+        load_workers (int): The number of concurrent MongoDB writers.
+        keep_downloads (bool): Keep the zip files so unchanged months are skipped next run.
+        upsert (bool): Upsert trips on `ride_id` instead of inserting them.
+        parse_backend (str): The CSV reader, "pandas" or "arrow".
+        staging_dir (str, optional): Stage cleaned months in this Parquet store and load from it.
+        stage_only (bool): Only write the Parquet store, do not load the database.
+        from_staging (bool): Load the database from the Parquet store without downloading.
+        defer_indexes (bool): Drop the trip indexes during the load and rebuild them afterwards.
+        timeseries (bool): Create the collection as a time-series collection if it does not exist.
 
     Returns:
         None
     """
-    etl = ExtractTransformLoad(db, collection, uri)
-    etl.ingest_data(base_url, year, file_path, collection)
+    etl = ExtractTransformLoad(db, collection, uri=uri)
+    staged_batch_size = batch_size or DEFAULT_BATCH_SIZE
+    if staging_dir and not from_staging:
+        etl.stage_data(
+            base_url,
+            year,
+            file_path,
+            staging_dir,
+            staged_batch_size,
+            keep_downloads,
+        )
+        if stage_only:
+            return
+
+    if timeseries:
+        etl.prepare_timeseries(collection)
+    # trips loaded by an earlier version get their station keys first
+    etl.backfill_station_keys(collection)
+    indexes = IndexManager(etl.get_collection(collection))
+    # the rollups are refreshed once the indexes are rebuilt, not per archive
+    with etl.deferred_rollups() if defer_indexes else nullcontext(), (
+        indexes.deferred() if defer_indexes else nullcontext()
+    ):
+        if staging_dir:
+            etl.load_staged(staging_dir, year, collection, staged_batch_size, upsert)
+        elif parallel:
+            pipeline = IngestPipeline(
+                etl,
+                download_workers=download_workers,
+                parse_workers=parse_workers,
+                load_workers=load_workers,
+                batch_size=batch_size,
+                keep_downloads=keep_downloads,
+                upsert=upsert,
+                parse_backend=parse_backend,
+            )
+            pipeline.run(base_url, year, file_path, collection)
+        else:
+            etl.ingest_data(
+                base_url,
+                year,
+                file_path,
+                collection,
+                batch_size,
+                keep_downloads,
+                upsert,
+                parse_backend,
+            )
+    indexes.build_indexes()
+    # later loads merge each month into the rollups as it is loaded
+    if not Rollups(etl.get_collection(collection)).is_built():
+        rebuild_rollups(etl, collection)
+
+
+def rebuild_rollups(etl: ExtractTransformLoad, collection: str) -> None:
+    """
+    Recomputes the rollup collections the dashboard reads from.
+
+    Args:
+        etl (ExtractTransformLoad): The ETL connected to the database.
+        collection (str): The name of the trips collection.
+
+    Returns:
+        None
+    """
+    # the station rollup counts trips per station key
+    etl.backfill_station_keys(collection)
+    rollups = Rollups(etl.get_collection(collection))
+    try:
+        rollups.rebuild()
+        print(f"Rebuilt {rollups.usage.name} and {rollups.stations.name}")
+    except Exception as e:
+        print(f"Error occurred while rebuilding rollups: {e}")
+
+
+def delete_month(db: str, collection: str, uri: str, year: int, month: int) -> None:
+    """
+    Deletes the trips loaded from a month's archive and subtracts them from the rollups.
+
+    Args:
+        db (str): The name of the database.
+        collection (str): The name of the collection.
+        uri (str): The URI for connecting to the MongoDB server.
+        year (int): The year of the month.
+        month (int): The month number.
+
+    Returns:
+        None
+    """
+    etl = ExtractTransformLoad(db, collection, uri=uri)
+    deleted = etl.delete_month(collection, year, month)
+    print(f"Deleted {deleted} trips loaded from {year}-{month:02d}")
+
+
+def manage_indexes(db: str, collection: str, uri: str, drop: bool = False) -> None:
+    """
+    Builds the trip indexes, or drops them, and lists the resulting indexes.
+
+    Args:
+        db (str): The name of the database.
+        collection (str): The name of the collection.
+        uri (str): The URI for connecting to the MongoDB server.
+        drop (bool): Drop the managed indexes instead of building them.
+
+    Returns:
+        None
+    """
+    etl = ExtractTransformLoad(db, collection, uri=uri)
+    indexes = IndexManager(etl.get_collection(collection))
+    if drop:
+        changed = indexes.drop_secondary_indexes()
+        print(f"Dropped: {', '.join(changed) or 'nothing'}")
+    else:
+        changed = indexes.build_indexes()
+        print(f"Built: {', '.join(changed) or 'nothing, all indexes exist'}")
+    print(f"Indexes on {collection}: {', '.join(indexes.index_names())}")
 
 
 if __name__ == "__main__":
+    connection = argparse.ArgumentParser(add_help=False)
+    connection.add_argument("--db", type=str, required=True, help="Database name")
+    connection.add_argument(
+        "--collection", type=str, required=True, help="Collection name"
+    )
+    connection.add_argument("--uri", type=str, required=True, help="MongoDB URI")
+
     parser = argparse.ArgumentParser(description="Run ETL process")
-    parser.add_argument("--db", type=str, required=True, help="Database name")
-    parser.add_argument("--collection", type=str, required=True, help="Collection name")
-    parser.add_argument("--uri", type=str, required=True, help="MongoDB URI")
-    parser.add_argument(
-        "--base_url", type=str, required=True, help="Base URL for data ingestion"
+    commands = parser.add_subparsers(dest="command", required=True)
+    ingest = commands.add_parser(
+        "ingest", parents=[connection], help="Load a year of trips (default)"
+    )
+    index = commands.add_parser(
+        "indexes", parents=[connection], help="Build or drop the trip indexes"
     )
-    parser.add_argument(
+    index.add_argument(
+        "--drop", action="store_true", help="Drop the managed indexes instead"
+    )
+    commands.add_parser(
+        "rollups",
+        parents=[connection],
+        help="Rebuild the dashboard rollups from the trips collection",
+    )
+    commands.add_parser(
+        "stations",
+        parents=[connection],
+        help="Build the station dimension and key the trips loaded without it",
+    )
+    delete = commands.add_parser(
+        "delete",
+        parents=[connection],
+        help="Delete the trips loaded from a month's archive and remove them from the rollups",
+    )
+    delete.add_argument("--year", type=int, required=True, help="Year of the month")
+    delete.add_argument(
+        "--month", type=int, choices=range(1, 13), required=True, help="Month number"
+    )
+    ingest.add_argument("--base_url", type=str, help="Base URL for data ingestion")
+    ingest.add_argument(
         "--year", type=int, required=True, help="Year for data filtering"
     )
-    parser.add_argument(
-        "--file_path", type=str, required=True, help="File path for data file"
+    ingest.add_argument("--file_path", type=str, help="File path for data file")
+    ingest.add_argument(
+        "--stream",
+        action="store_true",
+        help="Read, convert and load each month in batches instead of whole",
+    )
+    ingest.add_argument(
+        "--batch_size",
+        type=int,
+        default=DEFAULT_BATCH_SIZE,
+        help="Rows per batch when streaming",
+    )
+    ingest.add_argument(
+        "--parallel",
+        action="store_true",
+        help="Overlap downloads, parsing and loads across months",
     )
+    ingest.add_argument(
+        "--download_workers", type=int, default=4, help="Concurrent downloads"
+    )
+    ingest.add_argument(
+        "--parse_workers", type=int, default=2, help="CSV parsing processes"
+    )
+    ingest.add_argument(
+        "--load_workers", type=int, default=2, help="Concurrent MongoDB writers"
+    )
+    ingest.add_argument(
+        "--keep_downloads",
+        action="store_true",
+        help="Keep downloaded zips so unchanged months are not downloaded again",
+    )
+    ingest.add_argument(
+        "--upsert",
+        action="store_true",
+        help="Upsert trips on ride_id with unordered bulk writes instead of inserting",
+    )
+    ingest.add_argument(
+        "--parse_backend",
+        choices=PARSE_BACKENDS,
+        default="pandas",
+        help="CSV reader used to parse and convert trips",
+    )
+    ingest.add_argument(
+        "--staging_dir",
+        type=str,
+        help="Parquet store to stage cleaned months in and load the database from",
+    )
+    ingest.add_argument(
+        "--stage_only",
+        action="store_true",
+        help="Only write the Parquet store, do not load the database",
+    )
+    ingest.add_argument(
+        "--from_staging",
+        action="store_true",
+        help="Load the database from the Parquet store without downloading",
+    )
+    ingest.add_argument(
+        "--defer_indexes",
+        action="store_true",
+        help="Drop the trip indexes during the load and rebuild them afterwards",
+    )
+
+    ingest.add_argument(
+        "--timeseries",
+        action="store_true",
+        help="Store the trips in a MongoDB time-series collection on started_at",
+    )
+
+    # `python etl.py --db ...` without a command keeps meaning ingest
+    argv = sys.argv[1:]
+    if argv and argv[0].startswith("-") and argv[0] not in ("-h", "--help"):
+        argv = ["ingest"] + argv
+    args = parser.parse_args(argv)
+
+    if args.command == "indexes":
+        manage_indexes(args.db, args.collection, args.uri, args.drop)
+        sys.exit()
+    if args.command == "rollups":
+        etl = ExtractTransformLoad(args.db, args.collection, uri=args.uri)
+        rebuild_rollups(etl, args.collection)
+        sys.exit()
+    if args.command == "stations":
+        etl = ExtractTransformLoad(args.db, args.collection, uri=args.uri)
+        etl.backfill_station_keys(args.collection)
+        sys.exit()
+    if args.command == "delete":
+        delete_month(args.db, args.collection, args.uri, args.year, args.month)
+        sys.exit()
 
-    args = parser.parse_args()
+    if (args.stage_only or args.from_staging) and not args.staging_dir:
+        ingest.error("--stage_only and --from_staging require --staging_dir")
+    if args.timeseries and args.upsert:
+        ingest.error("--upsert needs a unique ride_id index, which --timeseries lacks")
+    if not args.from_staging and not (args.base_url and args.file_path):
+        ingest.error("--base_url and --file_path are required unless --from_staging")
 
     main(
         db=args.db,
@@ -49,4 +322,17 @@ if __name__ == "__main__":
         base_url=args.base_url,
         year=args.year,
         file_path=args.file_path,
+        batch_size=args.batch_size if args.stream else None,
+        parallel=args.parallel,
+        download_workers=args.download_workers,
+        parse_workers=args.parse_workers,
+        load_workers=args.load_workers,
+        keep_downloads=args.keep_downloads,
+        upsert=args.upsert,
+        parse_backend=args.parse_backend,
+        staging_dir=args.staging_dir,
+        stage_only=args.stage_only,
+        from_staging=args.from_staging,
+        defer_indexes=args.defer_indexes,
+        timeseries=args.timeseries,
     )
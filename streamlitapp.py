@@ -1,9 +1,10 @@
 import streamlit as st
 import os
 
+from app.etl.parquet_queries import ParquetQueries
 from app.etl.queries import Queries
 from app.visualize.custom_query import CustomQuery
-from app.visualize.setup import sidebar_ops, top_bar
+from app.visualize.setup import dashboard_filter, sidebar_ops, top_bar
 from app.visualize.visualize import (
     st_average_speed_per_user_and_bike_type,
     st_average_trip_duration_per_user_types,
@@ -16,13 +17,28 @@ from app.visualize.visualize import (
     st_user_types,
 )
 
+# Predefined pages whose charts `Queries.dashboard_snapshot` computes
+SNAPSHOT_PAGES = {
+    "User Types",
+    "Bike Types",
+    "Popular Stations",
+    "Peak Hours",
+    "Peak Hours With Day",
+    "Total Trips Per Month",
+    "Average Trip Duration Per User Types",
+}
+
 st.set_page_config(
     page_title="CitiBike Data Analysis", page_icon=":bike:", layout="wide"
 )
 
 
 def main():
-    queries = Queries("citibike", "trips", uri=st.secrets["URI"])
+    # Read the predefined queries from a Parquet store for offline analysis
+    if st.secrets.get("PARQUET_STORE"):
+        queries = ParquetQueries(st.secrets["PARQUET_STORE"])
+    else:
+        queries = Queries("citibike", "trips", uri=st.secrets["URI"])
     cq_query = CustomQuery("citibike", "trips", uri=st.secrets["URI"])
 
     top_bar(queries)
@@ -30,31 +46,47 @@ def main():
     query_type = sidebar_ops("visualize")
     if query_type == "Custom Query":
         query = cq_query.custom_query()
-        custom_data_df = cq_query.get_custom_query(query)
-        cq_query.custom_visualize_data(custom_data_df, data_col, viz_col)
+        custom_data_df = cq_query.custom_query_page(query, data_col)
+        summary = cq_query.get_custom_summary(query)
+        cq_query.custom_visualize_data(custom_data_df, data_col, viz_col, summary)
+    elif query_type != "Map Visualization":
+        # the predefined queries run over the picked days only
+        trip_filter = dashboard_filter()
+        # only `Queries` caches results, so only it gains from warming them;
+        # one aggregation fills the query cache for every overview chart
+        if isinstance(queries, Queries) and query_type in SNAPSHOT_PAGES:
+            queries.dashboard_snapshot(trip_filter)
     if query_type == "User Types":
-        st_user_types(queries, data_col, viz_col)
+        st_user_types(queries, data_col, viz_col, trip_filter)
     elif query_type == "Bike Types":
-        st_bike_types(queries, data_col, viz_col)
+        st_bike_types(queries, data_col, viz_col, trip_filter)
     elif query_type == "Bike Types Used By Members":
-        st_bike_types_used_by_members(queries, data_col, viz_col)
+        st_bike_types_used_by_members(queries, data_col, viz_col, trip_filter)
     elif query_type == "Popular Stations":
-        st_popular_stations(queries, data_col, viz_col)
+        st_popular_stations(queries, data_col, viz_col, trip_filter)
     elif query_type == "Peak Hours":
-        st_peak_hours(queries, data_col, viz_col)
+        st_peak_hours(queries, data_col, viz_col, trip_filter)
     elif query_type == "Peak Hours With Day":
-        st_peak_hours_with_day(queries, data_col, viz_col)
+        st_peak_hours_with_day(queries, data_col, viz_col, trip_filter)
     elif query_type == "Total Trips Per Month":
-        st_total_trips_per_month(queries, data_col, viz_col)
+        st_total_trips_per_month(queries, data_col, viz_col, trip_filter)
     elif query_type == "Average Trip Duration Per User Types":
-        st_average_trip_duration_per_user_types(queries, data_col, viz_col)
+        st_average_trip_duration_per_user_types(queries, data_col, viz_col, trip_filter)
     elif query_type == "Average Speed Per User Type and Bike Type":
-        st_average_speed_per_user_and_bike_type(queries, data_col, viz_col)
+        st_average_speed_per_user_and_bike_type(queries, data_col, viz_col, trip_filter)
     elif query_type == "Map Visualization":
         query = cq_query.custom_query()
         map_data_df = cq_query.get_map_query(query)
         cq_query.map_visualize_data(map_data_df)
 
+    # ParquetQueries reads local files and is not cached
+    if isinstance(queries, Queries):
+        stats = queries.cache.stats()
+        st.sidebar.caption(
+            f"Query cache: {stats['hits']} hits, {stats['misses']} misses "
+            f"({stats['hit_rate']:.0%} hit rate)"
+        )
+
 
 if __name__ == "__main__":
     main()
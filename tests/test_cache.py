@@ -0,0 +1,30 @@
+from app.etl.cache import QueryCache, cached
+
+
+class Trips:
+    def __init__(self) -> None:
+        self.cache = QueryCache()
+        self.calls = 0
+
+    @cached
+    def stations(self, trip_filter=None) -> list:
+        self.calls += 1
+        return iter([{"name": "Clark St", "counts": [1, 2]}])
+
+
+def test_cached_calls_share_a_key_with_defaults():
+    trips = Trips()
+    assert trips.stations() == trips.stations(trip_filter=None)
+    assert trips.calls == 1
+    assert trips.cache.stats()["hits"] == 1
+
+
+def test_changing_a_result_does_not_change_the_cache():
+    trips = Trips()
+    first = trips.stations()
+    first[0]["name"] = "State St"
+    first[0]["counts"].append(3)
+    first.append({})
+
+    assert trips.stations() == [{"name": "Clark St", "counts": [1, 2]}]
+    assert trips.calls == 1
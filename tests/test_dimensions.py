@@ -0,0 +1,137 @@
+import pytest
+from pymongo.errors import BulkWriteError
+
+from app.etl.dimensions import StationDimension
+
+mongomock = pytest.importorskip("mongomock")
+
+
+@pytest.fixture
+def trips():
+    return mongomock.MongoClient().db.trips
+
+
+def station(name: str) -> dict:
+    return {"name": name, "lat": 41.9, "lng": -87.6}
+
+
+def test_register_keeps_keys_stable(trips):
+    stations = StationDimension(trips)
+    keys = stations.register({"A1": station("Clark St"), "B2": station("State St")})
+    assert sorted(keys.values()) == [1, 2]
+
+    again = StationDimension(trips).register(
+        {"B2": station("State & Lake"), "C3": station("Canal St")}
+    )
+    assert again["B2"] == keys["B2"]
+    assert again["C3"] == 3
+    assert trips.database.trips_stations.find_one({"_id": keys["B2"]})["name"] == (
+        "State & Lake"
+    )
+
+
+def test_register_reads_the_key_of_a_concurrent_loader(trips, monkeypatch):
+    stations = StationDimension(trips)
+    stations.keys()
+    bulk_write = stations.collection.bulk_write
+
+    def lose_the_race(requests, ordered=True):
+        # another process inserts the station between our read and our upsert
+        stations.collection.insert_one(
+            {"_id": 99, "station_id": "A1", "name": "Clark St"}
+        )
+        bulk_write(requests[1:], ordered=ordered)
+        raise BulkWriteError(
+            {"writeErrors": [{"index": 0, "code": 11000, "errmsg": "E11000"}]}
+        )
+
+    monkeypatch.setattr(stations.collection, "bulk_write", lose_the_race)
+    keys = stations.register({"A1": station("Clark St"), "B2": station("State St")})
+
+    assert keys["A1"] == 99
+    assert stations.keys()["A1"] == 99
+    assert keys["B2"] != 99
+
+
+def test_register_raises_other_write_errors(trips, monkeypatch):
+    stations = StationDimension(trips)
+
+    def fail(requests, ordered=True):
+        raise BulkWriteError({"writeErrors": [{"index": 0, "code": 2}]})
+
+    monkeypatch.setattr(stations.collection, "bulk_write", fail)
+    with pytest.raises(BulkWriteError):
+        stations.register({"A1": station("Clark St")})
+
+
+@pytest.fixture
+def stations(trips):
+    stations = StationDimension(trips)
+    stations.register(
+        {
+            "A1": station("Clark St"),
+            "B2": station("State St"),
+            "C3": station("Clark St"),
+        }
+    )
+    return stations
+
+
+def test_key_condition_matches_every_station_with_a_name(stations):
+    keys = stations.keys()
+    clark = sorted([keys["A1"], keys["C3"]])
+    assert sorted(stations.key_condition("Clark St")["$in"]) == clark
+    assert stations.key_condition(None) is None
+    assert stations.key_condition({"$in": ["State St", None]}) == {
+        "$in": [keys["B2"], None]
+    }
+    assert stations.key_condition({"$eq": "State St"}) == {"$in": [keys["B2"]]}
+    assert stations.key_condition({"$ne": "State St"}) == {"$nin": [keys["B2"]]}
+    assert stations.key_condition({"$ne": None}) == {"$ne": None}
+    assert stations.key_condition({"$exists": True}) == {"$exists": True}
+    assert stations.key_condition({"$in": ["Nowhere"]}) == {"$in": []}
+
+
+def test_key_condition_rejects_other_operators(stations):
+    with pytest.raises(ValueError):
+        stations.key_condition({"$regex": "^Clark"})
+
+
+def test_station_query_translates_nested_name_conditions(stations):
+    keys = stations.keys()
+    query = stations.station_query(
+        {
+            "rideable_type": "classic_bike",
+            "$or": [
+                {"start_station_name": "State St"},
+                {"$nor": [{"end_station_name": {"$eq": "State St"}}]},
+            ],
+        }
+    )
+    assert query == {
+        "rideable_type": "classic_bike",
+        "$or": [
+            {"start_station_key": {"$in": [keys["B2"]]}},
+            {"$nor": [{"end_station_key": {"$in": [keys["B2"]]}}]},
+        ],
+    }
+
+
+def test_station_query_uses_the_current_station_names(trips, stations):
+    keys = stations.keys()
+    trips.insert_many(
+        [
+            {"start_station_key": keys["A1"]},
+            {"start_station_key": keys["B2"]},
+            {"start_station_key": None},
+        ]
+    )
+    StationDimension(trips).register({"B2": station("State & Lake")})
+
+    def count(names):
+        query = stations.station_query({"start_station_name": {"$in": names}})
+        return trips.count_documents(query)
+
+    assert count(["State St"]) == 0
+    assert count(["State & Lake"]) == 1
+    assert count(["Clark St", None]) == 2
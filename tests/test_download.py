@@ -0,0 +1,172 @@
+import hashlib
+import json
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from app.etl.download import CACHE_INDEX, Downloader
+
+PAYLOAD = os.urandom(300_000)
+ETAG = '"v1"'
+
+
+class ArchiveHandler(BaseHTTPRequestHandler):
+    """
+    Serves `PAYLOAD` with an ETag and single byte-range support.
+    """
+
+    requests = []
+    etag = ETAG
+
+    def log_message(self, *args) -> None:
+        pass
+
+    def _headers(self, status: int, length: int, content_range: str = None) -> None:
+        self.send_response(status)
+        self.send_header("ETag", self.etag)
+        self.send_header("Content-Length", str(length))
+        if content_range:
+            self.send_header("Content-Range", content_range)
+        self.end_headers()
+
+    def do_HEAD(self) -> None:
+        self.requests.append(("HEAD", None))
+        self._headers(200, len(PAYLOAD))
+
+    def do_GET(self) -> None:
+        range_header = self.headers.get("Range")
+        self.requests.append(("GET", range_header))
+        if range_header and self.headers.get("If-Range") in (None, self.etag):
+            start = int(range_header.split("=")[1].rstrip("-"))
+            body = PAYLOAD[start:]
+            self._headers(
+                206, len(body), f"bytes {start}-{len(PAYLOAD) - 1}/{len(PAYLOAD)}"
+            )
+        else:
+            body = PAYLOAD
+            self._headers(200, len(body))
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def url():
+    ArchiveHandler.requests = []
+    ArchiveHandler.etag = ETAG
+    server = ThreadingHTTPServer(("127.0.0.1", 0), ArchiveHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/202301-tripdata.zip"
+    server.shutdown()
+    server.server_close()
+
+
+def read_index(cache_dir) -> dict:
+    with open(os.path.join(cache_dir, CACHE_INDEX)) as f:
+        return json.load(f)
+
+
+def test_full_download(url, tmp_path):
+    dest = str(tmp_path / "202301-tripdata.zip")
+    Downloader(str(tmp_path), chunk_size=65536).download(url, dest)
+
+    with open(dest, "rb") as f:
+        assert f.read() == PAYLOAD
+    entry = read_index(tmp_path)[url]
+    assert entry["complete"]
+    assert entry["etag"] == ETAG
+    assert entry["size"] == len(PAYLOAD)
+    assert entry["sha256"] == hashlib.sha256(PAYLOAD).hexdigest()
+    assert not os.path.exists(f"{dest}.part")
+
+
+def test_cache_hit(url, tmp_path):
+    dest = str(tmp_path / "202301-tripdata.zip")
+    Downloader(str(tmp_path)).download(url, dest)
+    ArchiveHandler.requests.clear()
+
+    Downloader(str(tmp_path)).download(url, dest)
+
+    assert ArchiveHandler.requests == [("HEAD", None)]
+
+
+def test_cache_hit_with_altered_file(url, tmp_path):
+    dest = str(tmp_path / "202301-tripdata.zip")
+    Downloader(str(tmp_path)).download(url, dest)
+    with open(dest, "r+b") as f:
+        f.write(b"\0" * 16)
+    ArchiveHandler.requests.clear()
+
+    Downloader(str(tmp_path)).download(url, dest)
+
+    assert ("GET", None) in ArchiveHandler.requests
+    with open(dest, "rb") as f:
+        assert f.read() == PAYLOAD
+
+
+def test_range_resume(url, tmp_path):
+    dest = str(tmp_path / "202301-tripdata.zip")
+    offset = 100_000
+    with open(f"{dest}.part", "wb") as f:
+        f.write(PAYLOAD[:offset])
+    with open(tmp_path / CACHE_INDEX, "w") as f:
+        json.dump({url: {"etag": ETAG, "size": len(PAYLOAD), "complete": False}}, f)
+
+    downloader = Downloader(str(tmp_path))
+    downloader.download(url, dest)
+
+    assert ("GET", f"bytes={offset}-") in ArchiveHandler.requests
+    with open(dest, "rb") as f:
+        assert f.read() == PAYLOAD
+    assert read_index(tmp_path)[url]["sha256"] == hashlib.sha256(PAYLOAD).hexdigest()
+    assert not os.path.exists(f"{dest}.part")
+
+
+def test_resume_of_another_version_starts_over(url, tmp_path):
+    dest = str(tmp_path / "202301-tripdata.zip")
+    with open(f"{dest}.part", "wb") as f:
+        f.write(b"stale bytes")
+    with open(tmp_path / CACHE_INDEX, "w") as f:
+        json.dump({url: {"etag": '"v0"', "size": 11, "complete": False}}, f)
+
+    Downloader(str(tmp_path)).download(url, dest)
+
+    assert ("GET", None) in ArchiveHandler.requests
+    with open(dest, "rb") as f:
+        assert f.read() == PAYLOAD
+
+
+def write_corrupt_part(tmp_path, url, entry: dict) -> str:
+    dest = str(tmp_path / "202301-tripdata.zip")
+    offset = 100_000
+    with open(f"{dest}.part", "wb") as f:
+        f.write(b"\0" * 16 + PAYLOAD[16:offset])
+    with open(tmp_path / CACHE_INDEX, "w") as f:
+        json.dump({url: {**entry, "size": len(PAYLOAD), "complete": False}}, f)
+    return dest
+
+
+def test_resume_of_corrupt_part_fails_the_server_md5(url, tmp_path):
+    ArchiveHandler.etag = f'"{hashlib.md5(PAYLOAD).hexdigest()}"'
+    dest = write_corrupt_part(tmp_path, url, {"etag": ArchiveHandler.etag})
+
+    with pytest.raises(IOError, match="md5"):
+        Downloader(str(tmp_path)).download(url, dest)
+    assert not os.path.exists(f"{dest}.part")
+    assert not os.path.exists(dest)
+
+    Downloader(str(tmp_path)).download(url, dest)
+    assert ArchiveHandler.requests[-1] == ("GET", None)
+    with open(dest, "rb") as f:
+        assert f.read() == PAYLOAD
+
+
+def test_resume_of_corrupt_part_fails_the_recorded_sha256(url, tmp_path):
+    sha256 = hashlib.sha256(PAYLOAD).hexdigest()
+    dest = write_corrupt_part(tmp_path, url, {"etag": ETAG, "sha256": sha256})
+
+    with pytest.raises(IOError, match="sha256"):
+        Downloader(str(tmp_path)).download(url, dest)
+    assert not os.path.exists(f"{dest}.part")
+    assert read_index(tmp_path)[url]["sha256"] == sha256
@@ -0,0 +1,84 @@
+from datetime import date, datetime
+
+import pytest
+
+from app.etl.filters import TripFilter, and_match
+
+JUNE_AND_JULY = {"start": date(2023, 6, 1), "end": date(2023, 7, 31)}
+
+
+def test_empty_filter_reads_every_source_unfiltered():
+    trip_filter = TripFilter()
+    assert trip_filter.is_empty()
+    assert trip_filter.trip_match() == {}
+    assert trip_filter.period_match() == {}
+    assert trip_filter.usage_match() == {}
+    assert trip_filter.station_match() == {}
+
+
+def test_window_ends_at_the_day_after_its_last_day():
+    trip_filter = TripFilter(start=date(2023, 6, 10), end=date(2023, 6, 30))
+    assert trip_filter.time_range() == (datetime(2023, 6, 10), datetime(2023, 7, 1))
+    assert trip_filter.trip_match() == {
+        "started_at": {"$gte": datetime(2023, 6, 10), "$lt": datetime(2023, 7, 1)}
+    }
+
+
+def test_whole_months_are_answered_by_both_rollups():
+    trip_filter = TripFilter(**JUNE_AND_JULY)
+    period = {"period": {"$gte": "2023-06", "$lte": "2023-07"}}
+    assert trip_filter.period_match() == period
+    assert trip_filter.usage_match() == period
+    assert trip_filter.station_match() == period
+
+
+@pytest.mark.parametrize(
+    "start, end",
+    [
+        (date(2023, 6, 2), None),
+        (None, date(2023, 6, 29)),
+        (date(2023, 6, 1), date(2023, 7, 30)),
+    ],
+)
+def test_partial_months_read_the_trips(start, end):
+    trip_filter = TripFilter(start=start, end=end)
+    assert trip_filter.period_match() is None
+    assert trip_filter.usage_match() is None
+    assert trip_filter.station_match() is None
+
+
+def test_window_may_end_on_a_leap_day():
+    trip_filter = TripFilter(start=date(2024, 2, 1), end=date(2024, 2, 29))
+    assert trip_filter.period_match() == {
+        "period": {"$gte": "2024-02", "$lte": "2024-02"}
+    }
+
+
+def test_bike_and_user_types_keep_the_usage_rollup_only():
+    trip_filter = TripFilter(
+        rideable_types=["electric_bike"], member_types=["member"], **JUNE_AND_JULY
+    )
+    assert trip_filter.usage_match() == {
+        "period": {"$gte": "2023-06", "$lte": "2023-07"},
+        "rideable_type": {"$in": ["electric_bike"]},
+        "member_casual": {"$in": ["member"]},
+    }
+    assert trip_filter.station_match() is None
+
+
+def test_stations_read_the_trips():
+    trip_filter = TripFilter(start_stations=["Clark St"], **JUNE_AND_JULY)
+    assert trip_filter.usage_match() is None
+    assert trip_filter.station_match() is None
+    assert trip_filter.trip_match()["start_station_name"] == {"$in": ["Clark St"]}
+
+
+def test_filters_are_hashable():
+    assert hash(TripFilter(member_types=["member"])) == hash(
+        TripFilter(member_types=("member",))
+    )
+
+
+def test_and_match_keeps_distinct_fields_flat():
+    assert and_match({"a": 1}, {}, {"b": 2}) == {"a": 1, "b": 2}
+    assert and_match({"a": 1}, {"a": 2}) == {"$and": [{"a": 1}, {"a": 2}]}
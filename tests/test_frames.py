@@ -0,0 +1,70 @@
+import random
+import re
+from datetime import datetime, timedelta
+
+import bson
+import pandas as pd
+from bson import Binary, Int64, ObjectId
+
+from app.etl.frames import frame_from_batches, frame_from_documents
+
+SCHEMA = {
+    "count": "int",
+    "speed": "float",
+    "station": "category",
+    "note": "string",
+    "started_at": "datetime",
+    "flag": "bool",
+}
+
+
+def random_value(rng: random.Random):
+    return rng.choice(
+        [
+            None,
+            rng.randint(-(2**31), 2**31 - 1),
+            Int64(rng.randint(-(2**40), 2**40)),
+            rng.random() * 100,
+            rng.choice(["A", "B", "Ünïcode", ""]),
+            rng.random() < 0.5,
+            datetime(2023, 1, 1) + timedelta(milliseconds=rng.randint(0, 10**10)),
+            {"nested": 1},
+            [1, "two"],
+            ObjectId(),
+            Binary(b"\x00\x01"),
+        ]
+    )
+
+
+def random_documents(rng: random.Random, count: int) -> list:
+    documents = []
+    for _ in range(count):
+        fields = list(SCHEMA) + ["_id", "other"]
+        rng.shuffle(fields)
+        document = {field: random_value(rng) for field in fields if rng.random() < 0.9}
+        if rng.random() < 0.05:
+            # not sized by the column reader, so the document is decoded whole
+            document["pattern"] = re.compile("^a")
+        documents.append(document)
+    return documents
+
+
+def test_frame_from_batches_matches_decoded_documents():
+    rng = random.Random(7)
+    batches = [
+        b"".join(bson.encode(document) for document in random_documents(rng, size))
+        for size in (0, 1, 200, 57)
+    ]
+    documents = [document for data in batches for document in bson.decode_all(data)]
+
+    expected = frame_from_documents(documents, SCHEMA)
+    frame = frame_from_batches(batches, SCHEMA)
+
+    pd.testing.assert_frame_equal(frame, expected)
+
+
+def test_frame_from_batches_without_batches_has_the_schema_columns():
+    frame = frame_from_batches([], SCHEMA)
+
+    assert list(frame.columns) == list(SCHEMA)
+    assert frame.empty
@@ -0,0 +1,79 @@
+from collections import Counter
+from datetime import datetime
+
+import pytest
+
+from app.etl.manifest import LoadManifest
+
+mongomock = pytest.importorskip("mongomock")
+
+SOURCE = "202306-divvy-tripdata.zip"
+MEMBER = "202306-divvy-tripdata.csv"
+
+
+@pytest.fixture
+def manifest():
+    return LoadManifest(mongomock.MongoClient().db.trips_manifest)
+
+
+def test_new_member_is_loaded_from_the_start(manifest):
+    assert manifest.resume_offset(SOURCE, MEMBER) == 0
+    assert not manifest.is_interrupted(SOURCE)
+
+
+def test_interrupted_member_resumes_after_its_last_commit(manifest):
+    manifest.start(SOURCE, MEMBER)
+    assert manifest.resume_offset(SOURCE, MEMBER) == 0
+    assert manifest.is_interrupted(SOURCE)
+
+    manifest.commit(SOURCE, MEMBER, offset=1000, rows=990)
+    manifest.commit(SOURCE, MEMBER, offset=2000, rows=995)
+    assert manifest.resume_offset(SOURCE, MEMBER) == 2000
+    assert manifest.get(SOURCE, MEMBER)["rows"] == 1985
+
+    # a resumed load starts at the committed offset and keeps the row count
+    manifest.start(SOURCE, MEMBER, offset=2000)
+    assert manifest.resume_offset(SOURCE, MEMBER) == 2000
+    assert manifest.get(SOURCE, MEMBER)["rows"] == 1985
+
+
+def test_complete_member_is_skipped(manifest):
+    manifest.start(SOURCE, MEMBER)
+    manifest.commit(SOURCE, MEMBER, offset=1000, rows=1000)
+    manifest.complete(SOURCE, MEMBER)
+    manifest.complete(SOURCE)
+    assert manifest.resume_offset(SOURCE, MEMBER) is None
+    assert manifest.is_complete(SOURCE)
+    assert not manifest.is_interrupted(SOURCE)
+
+
+def test_commit_accumulates_metrics_and_started_range(manifest):
+    manifest.start(SOURCE, MEMBER)
+    manifest.commit(
+        SOURCE,
+        MEMBER,
+        offset=10,
+        rows=9,
+        metrics=Counter(missing_end=1),
+        started_range=(datetime(2023, 6, 2), datetime(2023, 6, 3)),
+    )
+    manifest.commit(
+        SOURCE,
+        MEMBER,
+        offset=20,
+        rows=8,
+        metrics=Counter(missing_end=2),
+        started_range=(datetime(2023, 6, 1), datetime(2023, 6, 2)),
+    )
+    assert manifest.get(SOURCE, MEMBER)["metrics"] == {"missing_end": 3}
+    assert manifest.started_range(SOURCE) == (
+        datetime(2023, 6, 1),
+        datetime(2023, 6, 3),
+    )
+
+
+def test_forget_loads_an_archive_again(manifest):
+    manifest.start(SOURCE, MEMBER)
+    manifest.complete(SOURCE, MEMBER)
+    assert manifest.forget("^202306") == 1
+    assert manifest.resume_offset(SOURCE, MEMBER) == 0
@@ -0,0 +1,79 @@
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pytest
+
+from app.etl.reducer import StreamingReducer, reduce_cursor
+
+EDGES = [0, 600, 1800, 3600]
+
+
+def trips(rows: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    duration = rng.integers(0, 4000, rows).astype(float)
+    duration[rng.random(rows) < 0.05] = np.nan
+    return pd.DataFrame(
+        {
+            "rideable_type": rng.choice(["classic_bike", "electric_bike", None], rows),
+            "member_casual": rng.choice(["member", "casual"], rows),
+            "duration_seconds": duration,
+        }
+    )
+
+
+def test_reducer_matches_groupby_across_blocks():
+    frame = trips(10_000)
+    documents = [
+        {key: value for key, value in row.items() if not pd.isna(value)}
+        for row in frame.to_dict("records")
+    ]
+    reducer = StreamingReducer(
+        ["rideable_type", "member_casual"],
+        ["duration_seconds"],
+        histograms={"duration_seconds": EDGES},
+    )
+    result = reduce_cursor(documents, [reducer], batch_size=999)[0].result()
+
+    groups = frame.fillna({"rideable_type": "none"}).groupby(
+        ["rideable_type", "member_casual"]
+    )
+    expected = groups["duration_seconds"].agg(["size", "sum", "count", "mean"])
+    result = result.fillna({"rideable_type": "none"}).set_index(
+        ["rideable_type", "member_casual"]
+    )
+    result = result.loc[expected.index]
+    assert (result["rows"] == expected["size"]).all()
+    assert np.allclose(result["duration_seconds_sum"], expected["sum"])
+    assert (result["duration_seconds_count"] == expected["count"]).all()
+    assert np.allclose(result["duration_seconds_mean"], expected["mean"])
+    for key, hist in result["duration_seconds_hist"].items():
+        values = groups.get_group(key)["duration_seconds"].dropna()
+        assert list(hist) == list(np.histogram(values, bins=EDGES)[0])
+
+
+def test_reducer_without_rows_or_groups():
+    reducer = StreamingReducer([], ["duration_seconds"])
+    assert reducer.consume([]).result().empty
+    total = StreamingReducer([], ["duration_seconds"]).consume(
+        [{"duration_seconds": 2.0}, {"duration_seconds": 4.0}, {}]
+    )
+    assert total.result()["rows"].tolist() == [3]
+    assert total.result()["duration_seconds_mean"].tolist() == [3.0]
+
+
+def test_parquet_queries_reduce_record_batches(tmp_path):
+    pytest.importorskip("streamlit")
+    from app.etl.parquet_queries import ParquetQueries
+    from app.etl.staging import ParquetStore
+
+    frame = trips(5_000, seed=1)
+    store = ParquetStore(str(tmp_path))
+    for month, part in ((6, frame[:2_000]), (7, frame[2_000:])):
+        table = pa.Table.from_pandas(part, preserve_index=False)
+        store.write_member(2023, month, "trips.csv", iter([table]))
+    queries = ParquetQueries(str(tmp_path))
+
+    counts = {row["usertype"]: row["count"] for row in queries.count_by_user_type()}
+    assert counts == frame["member_casual"].value_counts().to_dict()
+    average = queries.get_average_trip_duration()[0]["avg_duration"]
+    assert average == pytest.approx(frame["duration_seconds"].mean())